@@ -60,6 +60,18 @@ CREATE TABLE predicted_variants (
 CREATE INDEX idx_discovered_family ON discovered_threats(threat_family);
 CREATE INDEX idx_discovered_risk ON discovered_threats(risk_score);
 
+CREATE TABLE model_snapshots (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    model_key TEXT NOT NULL,  -- detector, profiler
+    format_version INTEGER NOT NULL,
+    sklearn_version TEXT,
+    payload BLOB NOT NULL,  -- Pickled fitted scaler/model or baseline statistics
+    is_encrypted INTEGER DEFAULT 1
+);
+
+CREATE INDEX idx_model_snapshots ON model_snapshots(model_key, id);
+
 -- ==================== DB3: Secure Action Logs (Append-Only) ====================
 CREATE TABLE action_logs (
     id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -211,6 +223,7 @@ CREATE TABLE fake_service_connections (
     targeted_service TEXT,  -- RDP, SMB, SSH, FTP
     targeted_port INTEGER,
     banner_sent TEXT,
+    first_bytes TEXT,  -- Hex of the first bytes the client sent
     tools_detected TEXT,  -- JSON array: nmap, metasploit, etc.
     severity TEXT DEFAULT 'HIGH',
     is_encrypted INTEGER DEFAULT 1
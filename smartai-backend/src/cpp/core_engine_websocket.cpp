@@ -4,6 +4,9 @@
 
 #include <iostream>
 #include <string>
+#include <cstdint>
+#include <memory>
+#include <ctime>
 #include <thread>
 #include <chrono>
 #include <vector>
@@ -21,6 +24,59 @@
 #pragma comment(lib, "iphlpapi.lib")
 #pragma comment(lib, "psapi.lib")
 
+// ==================== BINARY PROTOCOL ====================
+// Encoder for the "binary-v1" SYSTEM_DATA frame (layout: python/binary_protocol.py).
+// The wire format is little-endian, as are the x86/x64 targets, so values are copied as-is.
+
+namespace binary_protocol {
+    const char MAGIC[4] = { 'S', 'M', 'A', 'I' };
+    const uint8_t VERSION = 1;
+    const uint8_t MSG_SYSTEM_DATA = 1;
+    const char* FORMAT_NAME = "binary-v1";
+
+    struct ProcessEntry {
+        uint32_t pid;
+        float cpu;
+        float memory;
+        std::string name;
+    };
+
+    template <typename T>
+    void append(std::string& out, T value) {
+        out.append(reinterpret_cast<const char*>(&value), sizeof(T));
+    }
+
+    std::string encodeSystemData(double timestamp, float cpuUsage, float ramUsage,
+                                 uint32_t ramAvailable, uint32_t ramTotal,
+                                 const std::vector<ProcessEntry>& processes) {
+        // Records: pid, cpu, memory, name offset, name length; then the names back to back
+        std::string records;
+        std::string names;
+        for (const auto& proc : processes) {
+            append<uint32_t>(records, proc.pid);
+            append<float>(records, proc.cpu);
+            append<float>(records, proc.memory);
+            append<uint32_t>(records, (uint32_t)names.size());
+            append<uint32_t>(records, (uint32_t)proc.name.size());
+            names += proc.name;
+        }
+
+        std::string frame;
+        frame.append(MAGIC, 4);
+        append<uint8_t>(frame, VERSION);
+        append<uint8_t>(frame, MSG_SYSTEM_DATA);
+        append<uint16_t>(frame, 0);  // flags
+        append<double>(frame, timestamp);
+        append<float>(frame, cpuUsage);
+        append<float>(frame, ramUsage);
+        append<uint32_t>(frame, ramAvailable);
+        append<uint32_t>(frame, ramTotal);
+        append<uint32_t>(frame, (uint32_t)processes.size());
+        append<uint32_t>(frame, (uint32_t)names.size());
+        return frame + records + names;
+    }
+}
+
 // ==================== WEBSOCKET CLIENT ====================
 
 class WebSocketClient {
@@ -29,11 +85,13 @@ private:
     std::string host;
     int port;
     bool connected;
+    bool binaryFormat;  // negotiated per connection via HELLO / HELLO_ACK
     std::string encryptionKey;
 
 public:
     WebSocketClient(const std::string& host, int port, const std::string& key)
-        : host(host), port(port), encryptionKey(key), socket(INVALID_SOCKET), connected(false) {
+        : host(host), port(port), encryptionKey(key), socket(INVALID_SOCKET), connected(false),
+          binaryFormat(false) {
     }
 
     bool connect() {
@@ -62,37 +120,66 @@ public:
 
         std::cout << "[C++] ✓ Connected to Electron WebSocket on " << host << ":" << port << std::endl;
         connected = true;
+        binaryFormat = false;
+        negotiateFormat();
         return true;
     }
 
     bool sendEncrypted(const std::string& jsonData) {
         if (!connected) return false;
 
-        try {
-            // Simple BASE64 encryption (in production use AES-256)
-            std::string encrypted = base64_encode(jsonData);
+        // Simple BASE64 encryption (in production use AES-256)
+        return sendFrame(createWebSocketFrame(base64_encode(jsonData), 0x81));
+    }
 
-            // WebSocket frame format (simplified)
-            std::string frame = createWebSocketFrame(encrypted);
+    bool sendBinary(const std::string& payload) {
+        if (!connected || !binaryFormat) return false;
 
-            int bytes_sent = ::send(socket, frame.c_str(), frame.length(), 0);
-            if (bytes_sent == SOCKET_ERROR) {
-                std::cerr << "[C++] Send failed" << std::endl;
-                connected = false;
-                return false;
-            }
-
-            return true;
-        } catch (std::exception& e) {
-            std::cerr << "[C++] Send error: " << e.what() << std::endl;
-            return false;
-        }
+        // Binary frames are only accepted once HELLO negotiated them
+        return sendFrame(createWebSocketFrame(payload, 0x82));
     }
 
     bool isConnected() const {
         return connected;
     }
 
+    bool usesBinaryFormat() const {
+        return binaryFormat;
+    }
+
+    bool negotiateFormat(int timeoutMs = 2000) {
+        // Offer binary-v1; keep JSON unless the server acknowledges it
+        Json::Value hello;
+        hello["type"] = "HELLO";
+        hello["formats"].append(binary_protocol::FORMAT_NAME);
+        hello["formats"].append("json");
+
+        Json::StreamWriterBuilder writer;
+        if (!sendEncrypted(Json::writeString(writer, hello))) {
+            return false;
+        }
+
+        DWORD timeout = timeoutMs;
+        setsockopt(socket, SOL_SOCKET, SO_RCVTIMEO, (const char*)&timeout, sizeof(timeout));
+        std::string payload;
+        bool received = receiveFrame(payload);
+        timeout = 0;
+        setsockopt(socket, SOL_SOCKET, SO_RCVTIMEO, (const char*)&timeout, sizeof(timeout));
+
+        Json::Value ack;
+        Json::CharReaderBuilder reader;
+        std::string decoded = base64_decode(payload);
+        std::string errors;
+        std::unique_ptr<Json::CharReader> parser(reader.newCharReader());
+        if (received && parser->parse(decoded.data(), decoded.data() + decoded.size(), &ack, &errors)
+                && ack["type"].asString() == "HELLO_ACK") {
+            binaryFormat = ack["format"].asString() == binary_protocol::FORMAT_NAME;
+        }
+
+        std::cout << "[C++] Message format: " << (binaryFormat ? binary_protocol::FORMAT_NAME : "json") << std::endl;
+        return binaryFormat;
+    }
+
     void disconnect() {
         if (socket != INVALID_SOCKET) {
             closesocket(socket);
@@ -109,22 +196,88 @@ public:
     }
 
 private:
-    std::string createWebSocketFrame(const std::string& data) {
+    bool sendFrame(const std::string& frame) {
+        int bytes_sent = ::send(socket, frame.c_str(), frame.length(), 0);
+        if (bytes_sent == SOCKET_ERROR) {
+            std::cerr << "[C++] Send failed" << std::endl;
+            connected = false;
+            return false;
+        }
+        return true;
+    }
+
+    bool receiveAll(char* buffer, size_t length) {
+        size_t received = 0;
+        while (received < length) {
+            int n = ::recv(socket, buffer + received, (int)(length - received), 0);
+            if (n <= 0) {
+                return false;
+            }
+            received += n;
+        }
+        return true;
+    }
+
+    bool receiveFrame(std::string& payload) {
+        unsigned char header[2];
+        if (!receiveAll((char*)header, 2)) {
+            return false;
+        }
+
+        uint64_t length = header[1] & 0x7F;
+        int extended = length == 126 ? 2 : (length == 127 ? 8 : 0);
+        if (extended) {
+            unsigned char bytes[8];
+            if (!receiveAll((char*)bytes, extended)) {
+                return false;
+            }
+            length = 0;
+            for (int i = 0; i < extended; i++) {
+                length = (length << 8) | bytes[i];
+            }
+        }
+
+        unsigned char mask[4] = { 0, 0, 0, 0 };
+        bool masked = (header[1] & 0x80) != 0;
+        if (masked && !receiveAll((char*)mask, 4)) {
+            return false;
+        }
+
+        payload.resize((size_t)length);
+        if (length && !receiveAll(&payload[0], (size_t)length)) {
+            return false;
+        }
+        if (masked) {
+            for (size_t i = 0; i < payload.size(); i++) {
+                payload[i] ^= mask[i % 4];
+            }
+        }
+        return true;
+    }
+
+    std::string createWebSocketFrame(const std::string& data, unsigned char opcode) {
         // Simplified WebSocket frame
         // In production, use proper WebSocket library like libwebsockets
         
         std::string frame;
-        unsigned char header[2] = { 0x81, 0x00 }; // FIN + Text frame
+        frame.push_back((char)opcode); // FIN + Text (0x81) or Binary (0x82) frame
         
-        if (data.length() < 126) {
-            header[1] = (unsigned char)data.length();
-        } else if (data.length() < 65536) {
-            header[1] = 126;
+        // Extended payload lengths are big-endian
+        uint64_t length = data.length();
+        if (length < 126) {
+            frame.push_back((char)length);
+        } else if (length < 65536) {
+            frame.push_back((char)126);
+            for (int shift = 8; shift >= 0; shift -= 8) {
+                frame.push_back((char)((length >> shift) & 0xFF));
+            }
         } else {
-            header[1] = 127;
+            frame.push_back((char)127);
+            for (int shift = 56; shift >= 0; shift -= 8) {
+                frame.push_back((char)((length >> shift) & 0xFF));
+            }
         }
 
-        frame.append((char*)header, 2);
         frame.append(data);
         
         return frame;
@@ -157,6 +310,30 @@ private:
 
         return encoded;
     }
+
+    std::string base64_decode(const std::string& input) {
+        static const std::string base64_chars =
+            "ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789+/";
+
+        std::string decoded;
+        int val = 0;
+        int valb = -8;
+
+        for (unsigned char c : input) {
+            size_t index = base64_chars.find(c);
+            if (index == std::string::npos) {
+                break;  // '=' padding or end of data
+            }
+            val = (val << 6) + (int)index;
+            valb += 6;
+            if (valb >= 0) {
+                decoded.push_back((char)((val >> valb) & 0xFF));
+                valb -= 8;
+            }
+        }
+
+        return decoded;
+    }
 };
 
 // ==================== SYSTEM MONITORING ====================
@@ -196,27 +373,42 @@ private:
         }
 
         try {
+            // CPU and Memory
+            MEMORYSTATUSEX memStatus;
+            memStatus.dwLength = sizeof(MEMORYSTATUSEX);
+            GlobalMemoryStatusEx(&memStatus);
+
+            int cpuUsage = getProcessorUsage();
+            unsigned long ramAvailable = (unsigned long)(memStatus.ullAvailPhys / (1024 * 1024));
+            unsigned long ramTotal = (unsigned long)(memStatus.ullTotalPhys / (1024 * 1024));
+            std::vector<binary_protocol::ProcessEntry> procs = getRunningProcesses();
+
+            if (wsClient->usesBinaryFormat()) {
+                // Negotiated binary-v1: typed header and packed process table, no JSON or base64
+                std::string frame = binary_protocol::encodeSystemData(
+                    (double)time(nullptr), (float)cpuUsage, (float)memStatus.dwMemoryLoad,
+                    ramAvailable, ramTotal, procs);
+                if (wsClient->sendBinary(frame)) {
+                    std::cout << "[C++] System data sent to Electron (binary, size: " << frame.length() << " bytes)" << std::endl;
+                }
+                return;
+            }
+
             Json::Value root;
             
             // Collect system metrics
             root["type"] = "SYSTEM_DATA";
             root["timestamp"] = getCurrentTimestamp();
             
-            // CPU and Memory
-            MEMORYSTATUSEX memStatus;
-            memStatus.dwLength = sizeof(MEMORYSTATUSEX);
-            GlobalMemoryStatusEx(&memStatus);
-
-            root["systemStats"]["cpuUsage"] = getProcessorUsage();
+            root["systemStats"]["cpuUsage"] = cpuUsage;
             root["systemStats"]["ramUsage"] = (int)memStatus.dwMemoryLoad;
-            root["systemStats"]["ramAvailable"] = (unsigned long)(memStatus.ullAvailPhys / (1024 * 1024));
-            root["systemStats"]["ramTotal"] = (unsigned long)(memStatus.ullTotalPhys / (1024 * 1024));
+            root["systemStats"]["ramAvailable"] = ramAvailable;
+            root["systemStats"]["ramTotal"] = ramTotal;
 
             // Get running processes
             Json::Value processes(Json::arrayValue);
-            std::vector<std::string> procs = getRunningProcesses();
             for (const auto& proc : procs) {
-                processes.append(proc);
+                processes.append(proc.name);
             }
             root["systemStats"]["processes"] = processes;
 
@@ -268,8 +460,8 @@ private:
         return 0;
     }
 
-    std::vector<std::string> getRunningProcesses() {
-        std::vector<std::string> processes;
+    std::vector<binary_protocol::ProcessEntry> getRunningProcesses() {
+        std::vector<binary_protocol::ProcessEntry> processes;
         HANDLE hSnapshot = CreateToolhelp32Snapshot(TH32CS_SNAPPROCESS, 0);
         
         if (hSnapshot != INVALID_HANDLE_VALUE) {
@@ -278,7 +470,7 @@ private:
 
             if (Process32First(hSnapshot, &pe32)) {
                 do {
-                    processes.push_back(pe32.szExeFile);
+                    processes.push_back({ pe32.th32ProcessID, 0.0f, 0.0f, pe32.szExeFile });
                 } while (Process32Next(hSnapshot, &pe32) && processes.size() < 50);
             }
 
@@ -10,20 +10,35 @@ import sys
 import json
 import time
 import hashlib
+import hmac
 import threading
-import socket
 import subprocess
+import asyncio
+import pickle
+import queue
+import zlib
+import bisect
+import signal
+import multiprocessing
 from datetime import datetime, timedelta
-from collections import defaultdict, deque
-from typing import Dict, List, Tuple, Optional
-import numpy as np
-import pandas as pd
-from sklearn.ensemble import IsolationForest
-from sklearn.preprocessing import StandardScaler
+from collections import defaultdict, deque, OrderedDict
+from contextlib import contextmanager
+from itertools import islice
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Tuple, Optional, Iterable, Iterator, Callable, TYPE_CHECKING
 import sqlite3
-from scipy.spatial.distance import cosine
 import traceback
 
+_import_start = time.perf_counter()  # startup timing of the heavier imports below
+
+import numpy as np
+
+# scikit-learn is imported on first training/model load (see _sklearn),
+# netifaces and zeroconf when the deception/mesh modules start
+if TYPE_CHECKING:
+    from sklearn.ensemble import IsolationForest
+    from sklearn.preprocessing import StandardScaler
+
 # Import encrypted database handler
 try:
     from database_encryption import DatabaseEncryption, EncryptedDatabase
@@ -31,14 +46,185 @@ except ImportError:
     print("WARNING: database_encryption module not found. Database encryption disabled.")
     DatabaseEncryption = None
 
-# Third-party security libraries
+# Packet capture flow features (numpy-only pcap / AF_PACKET reader)
+try:
+    from flow_aggregator import FlowAggregator
+except ImportError:
+    FlowAggregator = None
+
+# Gossip dissemination of mesh threat intelligence
 try:
-    from scapy.all import sniff, IP, TCP, UDP, ARP
-    from netifaces import interfaces, ifaddresses, AF_INET
-    from zeroconf import ServiceBrowser, Zeroconf, ServiceStateChange
-    from bleak import BleakClient, BleakScanner
-except ImportError as e:
-    print(f"Warning: Optional library not installed: {e}")
+    from mesh_gossip import GossipNode, parse_peers
+except ImportError:
+    GossipNode = None
+
+# Event-driven honeypot file watcher (Linux inotify)
+try:
+    from honeypot_watcher import (InotifyWatcher, inotify_available,
+                                  ProcFdIndex, procfs_available)
+except ImportError:
+    InotifyWatcher = None
+    ProcFdIndex = None
+
+# Directory for SmartAI databases (models, intelligence, logs)
+DATA_DIR = os.getenv('SMARTAI_DATA_DIR', 'data')
+
+IMPORT_SECONDS = time.perf_counter() - _import_start
+
+
+def _sklearn():
+    """Import (IsolationForest, StandardScaler) on first use"""
+    from sklearn.ensemble import IsolationForest
+    from sklearn.preprocessing import StandardScaler
+    return IsolationForest, StandardScaler
+
+
+def sklearn_version() -> str:
+    """Installed scikit-learn version, without importing it if not loaded yet"""
+    if 'sklearn' in sys.modules:
+        return sys.modules['sklearn'].__version__
+    from importlib.metadata import version
+    return version('scikit-learn')
+
+# ==================== METRICS ====================
+
+# Histogram bucket upper bounds in seconds (the last bucket is +Inf)
+LATENCY_BUCKETS = (0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001,
+                   0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5,
+                   5.0, 10.0)
+
+
+class LatencyHistogram:
+    """Fixed-bucket latency histogram"""
+    
+    def __init__(self, buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+    
+    def observe(self, seconds: float):
+        self.counts[bisect.bisect_left(self.buckets, seconds)] += 1
+        self.count += 1
+        self.sum += seconds
+        if seconds > self.max:
+            self.max = seconds
+    
+    def quantile(self, q: float) -> float:
+        """Upper bound of the bucket holding quantile q (max for the +Inf bucket)"""
+        if self.count == 0:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            seen += n
+            if seen >= rank and n:
+                return self.buckets[i] if i < len(self.buckets) else self.max
+        return self.max
+
+
+class MetricsRegistry:
+    """
+    Per-stage latency histograms and event counters
+    
+    Timing uses the monotonic perf_counter; recording a value is a bucket
+    lookup and a few additions under one lock, cheap enough for every sample.
+    """
+    
+    def __init__(self, buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.histograms = {}
+        self.counters = defaultdict(int)
+        self.started = time.time()
+        self._lock = threading.Lock()
+    
+    def observe(self, stage: str, seconds: float):
+        """Record one stage duration"""
+        with self._lock:
+            histogram = self.histograms.get(stage)
+            if histogram is None:
+                histogram = self.histograms[stage] = LatencyHistogram(self.buckets)
+            histogram.observe(seconds)
+    
+    def increment(self, counter: str, n: int = 1):
+        """Add to an event counter"""
+        with self._lock:
+            self.counters[counter] += n
+    
+    @contextmanager
+    def timer(self, stage: str):
+        """Time the enclosed block as one observation of stage"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - start)
+    
+    def reset(self):
+        """Drop all recorded values"""
+        with self._lock:
+            self.histograms = {}
+            self.counters = defaultdict(int)
+            self.started = time.time()
+    
+    def snapshot(self) -> Dict:
+        """Export counters and per-stage histograms as a dict"""
+        with self._lock:
+            stages = {}
+            for stage, h in self.histograms.items():
+                stages[stage] = {
+                    "count": h.count,
+                    "sum_seconds": h.sum,
+                    "mean_ms": h.sum / h.count * 1000 if h.count else 0.0,
+                    "max_ms": h.max * 1000,
+                    "p50_ms": h.quantile(0.5) * 1000,
+                    "p99_ms": h.quantile(0.99) * 1000,
+                    "buckets": list(h.counts),
+                }
+            return {
+                "uptime_seconds": time.time() - self.started,
+                "bucket_bounds": list(self.buckets),
+                "counters": dict(self.counters),
+                "stages": stages,
+            }
+    
+    def merge(self, snapshot: Dict):
+        """Add another registry's snapshot (e.g. from a shard process)"""
+        with self._lock:
+            for counter, n in snapshot.get("counters", {}).items():
+                self.counters[counter] += n
+            for stage, data in snapshot.get("stages", {}).items():
+                histogram = self.histograms.get(stage)
+                if histogram is None:
+                    histogram = self.histograms[stage] = LatencyHistogram(self.buckets)
+                histogram.counts = [a + b for a, b in zip(histogram.counts, data["buckets"])]
+                histogram.count += data["count"]
+                histogram.sum += data["sum_seconds"]
+                histogram.max = max(histogram.max, data["max_ms"] / 1000)
+    
+    def to_text(self, prefix: str = "smartai") -> str:
+        """Export in the Prometheus text exposition format"""
+        snapshot = self.snapshot()
+        lines = []
+        for counter, n in sorted(snapshot["counters"].items()):
+            lines.append(f"# TYPE {prefix}_{counter}_total counter")
+            lines.append(f"{prefix}_{counter}_total {n}")
+        
+        name = f"{prefix}_stage_latency_seconds"
+        lines.append(f"# TYPE {name} histogram")
+        for stage, data in sorted(snapshot["stages"].items()):
+            cumulative = 0
+            for bound, n in zip(list(self.buckets) + ["+Inf"], data["buckets"]):
+                cumulative += n
+                lines.append(f'{name}_bucket{{stage="{stage}",le="{bound}"}} {cumulative}')
+            lines.append(f'{name}_sum{{stage="{stage}"}} {data["sum_seconds"]}')
+            lines.append(f'{name}_count{{stage="{stage}"}} {data["count"]}')
+        return "\n".join(lines) + "\n"
+
+
+# Process-wide metrics (each shard process has its own)
+METRICS = MetricsRegistry()
 
 # ==================== ENCRYPTION MODULE ====================
 
@@ -79,7 +265,8 @@ class EncryptionHandler:
         
         Args:
             conn: sqlite3 connection
-            encrypt: True to encrypt database after closing
+            encrypt: True to encrypt database after closing, False to
+                discard a read-only connection without rewriting the file
         """
         if self.db_encryption:
             self.db_encryption.close(conn, encrypt=encrypt)
@@ -129,14 +316,56 @@ class EncryptionHandler:
 
 # ==================== BEHAVIOR PROFILING ====================
 
+# Windowed network features (see flow_aggregator), after the process slots
+FLOW_FEATURE_KEYS = [
+    'flow_bytes',
+    'flow_packets',
+    'flow_distinct_dst_ports',
+    'flow_syn_ratio',
+    'flow_active_flows',
+]
+
 class BehaviorProfiler:
     """Build and maintain user/system behavior baseline"""
     
-    def __init__(self, db_handler: EncryptionHandler):
+    def __init__(self, db_handler: EncryptionHandler,
+                 baseline_mode: str = "batch", decay: float = 0.0):
+        """
+        Args:
+            db_handler: Encryption/database handler
+            baseline_mode: "batch" (history buffer, baseline after learning
+                period) or "streaming" (running statistics, no buffer)
+            decay: Exponential decay rate (0-1) for streaming statistics,
+                0 disables decay
+        """
+        if baseline_mode not in ("batch", "streaming"):
+            raise ValueError(f"Unknown baseline mode: {baseline_mode}")
+        
         self.db = db_handler
         self.baseline = {}
-        self.feature_history = defaultdict(deque)
+        self.baseline_mode = baseline_mode
+        self.decay = decay
+        self.n_features = 50
         self.max_history = 1000
+        self.feature_keys = [f'feature_{i}' for i in range(self.n_features)]
+        
+        # Preallocated ring buffer: one row per sample, one column per feature
+        # (not needed in streaming mode)
+        if baseline_mode == "batch":
+            self.feature_history = np.zeros((self.max_history, self.n_features))
+        else:
+            self.feature_history = None
+        self.history_index = 0
+        self.history_count = 0
+        
+        # Running statistics for streaming mode
+        self.min_streaming_samples = 30
+        self.stream_count = 0
+        self.stream_mean = np.zeros(self.n_features)
+        self.stream_var = np.zeros(self.n_features)
+        self.stream_min = np.zeros(self.n_features)
+        self.stream_max = np.zeros(self.n_features)
+        
         self.learning_period_hours = 24
         self.learning_start_time = time.time()
     
@@ -151,12 +380,17 @@ class BehaviorProfiler:
             len(system_data.get('processes', [])),
         ]
         
-        # Add process-specific features
-        for proc in system_data.get('processes', [])[:10]:
+        # Add process-specific features (fixed 10 slots)
+        processes = system_data.get('processes', [])[:10]
+        for proc in processes:
             features.extend([
                 proc.get('cpu', 0),
                 proc.get('memory', 0),
             ])
+        features.extend([0, 0] * (10 - len(processes)))
+        
+        # Add packet capture features
+        features.extend(system_data.get(key, 0) for key in FLOW_FEATURE_KEYS)
         
         # Pad to fixed size
         while len(features) < 50:
@@ -164,94 +398,475 @@ class BehaviorProfiler:
         
         return np.array(features[:50])
     
-    def update_baseline(self, system_data: Dict):
-        """Update behavior baseline with new data"""
-        features = self.build_feature_vector(system_data)
+    def build_feature_matrix(self, snapshots: Iterable[Dict],
+                             n_rows: Optional[int] = None) -> np.ndarray:
+        """
+        Convert many system_data snapshots into an (N, 50) float32 matrix
+        
+        Args:
+            snapshots: List or any iterable (e.g. generator) of system_data dicts
+            n_rows: Number of snapshots if known, lets a stream be written
+                into a preallocated buffer
+            
+        Returns:
+            Feature matrix with the same layout as build_feature_vector
+        """
+        if n_rows is None and hasattr(snapshots, '__len__'):
+            n_rows = len(snapshots)
+        
+        # Values are streamed straight into the array, no per-row lists
+        count = n_rows * self.n_features if n_rows is not None else -1
+        values = np.fromiter(self._iter_feature_values(snapshots),
+                             dtype=np.float32, count=count)
+        return values.reshape(-1, self.n_features)
+    
+    def _iter_feature_values(self, snapshots: Iterable[Dict]):
+        """Yield the feature values of each snapshot, row after row"""
+        padding = (0,) * self.n_features
+        for system_data in snapshots:
+            processes = system_data.get('processes', [])
+            yield system_data.get('cpu_usage', 0)
+            yield system_data.get('memory_usage', 0)
+            yield system_data.get('network_in', 0)
+            yield system_data.get('network_out', 0)
+            yield system_data.get('process_count', 0)
+            yield len(processes)
+            
+            n_procs = 0
+            for proc in islice(processes, 10):
+                yield proc.get('cpu', 0)
+                yield proc.get('memory', 0)
+                n_procs += 1
+            yield from padding[:2 * (10 - n_procs)]
+            
+            for key in FLOW_FEATURE_KEYS:
+                yield system_data.get(key, 0)
+            
+            yield from padding[:self.n_features - 26 - len(FLOW_FEATURE_KEYS)]
+    
+    def update_baseline(self, system_data: Dict, features: Optional[np.ndarray] = None):
+        """Update behavior baseline with new data (features: its prebuilt vector)"""
+        if features is None:
+            features = self.build_feature_vector(system_data)
         
-        # Store in history
-        for i, val in enumerate(features):
-            self.feature_history[f'feature_{i}'].append(val)
-            if len(self.feature_history[f'feature_{i}']) > self.max_history:
-                self.feature_history[f'feature_{i}'].popleft()
+        if self.baseline_mode == "streaming":
+            self.update_streaming_stats(features)
+            return
+        
+        # Store in history (overwrites the oldest row once full)
+        self.feature_history[self.history_index] = features
+        self.history_index = (self.history_index + 1) % self.max_history
+        self.history_count = min(self.history_count + 1, self.max_history)
         
         # Check if learning period is complete
         elapsed = (time.time() - self.learning_start_time) / 3600
         if elapsed >= self.learning_period_hours and not self.baseline:
             self.finalize_baseline()
     
+    def update_streaming_stats(self, features: np.ndarray):
+        """
+        Fold one sample into the running statistics (Welford, O(1))
+        
+        Uses weight max(1/n, decay) so the first samples give the exact
+        mean/variance and later samples are exponentially weighted.
+        """
+        self.stream_count += 1
+        
+        if self.stream_count == 1:
+            self.stream_mean[:] = features
+            self.stream_var[:] = 0
+            self.stream_min[:] = features
+            self.stream_max[:] = features
+            return
+        
+        alpha = max(1.0 / self.stream_count, self.decay)
+        delta = features - self.stream_mean
+        self.stream_mean += alpha * delta
+        self.stream_var *= (1 - alpha)
+        self.stream_var += (1 - alpha) * alpha * delta * delta
+        
+        if self.decay > 0:
+            # Let old extremes relax towards the mean so min/max track drift
+            self.stream_min += self.decay * (self.stream_mean - self.stream_min)
+            self.stream_max += self.decay * (self.stream_mean - self.stream_max)
+        np.minimum(self.stream_min, features, out=self.stream_min)
+        np.maximum(self.stream_max, features, out=self.stream_max)
+    
+    def get_feature_history(self) -> np.ndarray:
+        """Get stored samples, oldest first, as an (n_samples, n_features) array"""
+        if self.feature_history is None:
+            return np.zeros((0, self.n_features))
+        if self.history_count < self.max_history:
+            return self.feature_history[:self.history_count]
+        return np.roll(self.feature_history, -self.history_index, axis=0)
+    
     def finalize_baseline(self):
         """Convert learning data into baseline statistics"""
-        for feature_key, values in self.feature_history.items():
-            if values:
-                self.baseline[feature_key] = {
-                    'mean': float(np.mean(values)),
-                    'std': float(np.std(values)),
-                    'min': float(np.min(values)),
-                    'max': float(np.max(values))
-                }
+        if self.history_count == 0:
+            return
+        
+        # Column-wise statistics over the filled part of the buffer
+        values = self.feature_history[:self.history_count]
+        means = values.mean(axis=0)
+        stds = values.std(axis=0)
+        mins = values.min(axis=0)
+        maxs = values.max(axis=0)
+        
+        self.baseline = self._baseline_from_stats(means, stds, mins, maxs)
+    
+    def _baseline_from_stats(self, means: np.ndarray, stds: np.ndarray,
+                             mins: np.ndarray, maxs: np.ndarray) -> Dict:
+        """Build the per-feature baseline dict from column statistics"""
+        baseline = {}
+        for i, feature_key in enumerate(self.feature_keys):
+            baseline[feature_key] = {
+                'mean': float(means[i]),
+                'std': float(stds[i]),
+                'min': float(mins[i]),
+                'max': float(maxs[i])
+            }
+        return baseline
     
     def get_baseline(self) -> Dict:
         """Get current baseline"""
+        if self.baseline_mode == "streaming":
+            if self.stream_count == 0:
+                return {}
+            # Built on demand so per-sample updates stay O(1)
+            self.baseline = self._baseline_from_stats(
+                self.stream_mean, np.sqrt(self.stream_var),
+                self.stream_min, self.stream_max
+            )
         return self.baseline
     
     def is_learning_complete(self) -> bool:
         """Check if initial learning period is complete"""
+        if self.baseline_mode == "streaming":
+            return self.stream_count >= self.min_streaming_samples
         elapsed = (time.time() - self.learning_start_time) / 3600
         return elapsed >= self.learning_period_hours
+    
+    def get_state(self) -> Dict:
+        """Export baseline statistics and history for persistence"""
+        history = self.get_feature_history()
+        return {
+            "baseline_mode": self.baseline_mode,
+            "baseline": dict(self.baseline),
+            "feature_history": history.astype(np.float32),
+            "learning_start_time": self.learning_start_time,
+            "stream_count": self.stream_count,
+            "stream_mean": self.stream_mean.copy(),
+            "stream_var": self.stream_var.copy(),
+            "stream_min": self.stream_min.copy(),
+            "stream_max": self.stream_max.copy()
+        }
+    
+    def load_state(self, state: Dict):
+        """Restore state exported by get_state"""
+        self.learning_start_time = state["learning_start_time"]
+        
+        if state["baseline_mode"] != self.baseline_mode:
+            print(f"Warning: saved baseline is {state['baseline_mode']}, "
+                  f"profiler is {self.baseline_mode}; keeping learning time only")
+            return
+        
+        self.baseline = dict(state["baseline"])
+        self.stream_count = state["stream_count"]
+        self.stream_mean[:] = state["stream_mean"]
+        self.stream_var[:] = state["stream_var"]
+        self.stream_min[:] = state["stream_min"]
+        self.stream_max[:] = state["stream_max"]
+        
+        if self.feature_history is not None:
+            history = state["feature_history"][-self.max_history:]
+            n_rows = len(history)
+            self.feature_history[:n_rows] = history
+            self.history_count = n_rows
+            self.history_index = n_rows % self.max_history
 
 
 # ==================== ANOMALY DETECTION ====================
 
+class RobustZScoreEngine:
+    """
+    Online anomaly engine using streaming robust z-scores
+    
+    Keeps a Huber-style running location and mean absolute deviation per
+    feature: O(n_features) memory and O(1) work per sample, no refits.
+    """
+    
+    def __init__(self, learning_rate: float = 0.01, z_threshold: float = 4.0,
+                 warmup_samples: int = 100, clip: float = 1.5):
+        self.learning_rate = learning_rate
+        self.z_threshold = z_threshold
+        self.warmup_samples = warmup_samples
+        self.clip = clip
+        self.n_samples = 0
+        self.center = None
+        self.deviation = None
+    
+    def is_ready(self) -> bool:
+        """Check if enough samples have been seen to score"""
+        return self.n_samples >= self.warmup_samples
+    
+    def _scale(self) -> np.ndarray:
+        # 1.2533 * mean absolute deviation ~ std for normal data;
+        # the floor avoids dividing by ~0 on constant features
+        return 1.2533 * self.deviation + 0.01 * np.abs(self.center) + 1e-6
+    
+    def update(self, features: np.ndarray):
+        """Fold one sample into the running statistics"""
+        x = np.asarray(features, dtype=np.float64)
+        self.n_samples += 1
+        
+        if self.center is None:
+            self.center = x.copy()
+            self.deviation = np.zeros_like(x)
+            return
+        
+        alpha = max(1.0 / self.n_samples, self.learning_rate)
+        residual = x - self.center
+        if self.n_samples > self.warmup_samples:
+            # Clip residuals so outliers barely move the estimates
+            limit = self.clip * self._scale()
+            np.clip(residual, -limit, limit, out=residual)
+        
+        self.center += alpha * residual
+        self.deviation += alpha * (np.abs(residual) - self.deviation)
+    
+    def score(self, feature_matrix: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Score rows against the running statistics
+        
+        Returns:
+            (is_anomaly, anomaly_scores) with scores in 0-100, 50 at threshold
+        """
+        X = np.asarray(feature_matrix, dtype=np.float64)
+        z = np.abs(X - self.center) / self._scale()
+        max_z = z.max(axis=1)
+        scores = np.minimum(max_z / self.z_threshold * 50, 100)
+        return max_z > self.z_threshold, scores
+
+
+# Online engines selectable by name; "isolation_forest" is the batch default
+ONLINE_ENGINES = {
+    "robust_zscore": RobustZScoreEngine,
+}
+
+
 class AnomalyDetector:
-    """Detect behavioral anomalies using Isolation Forest"""
+    """Detect behavioral anomalies using Isolation Forest or an online engine"""
     
-    def __init__(self):
-        self.model = None
-        self.scaler = StandardScaler()
-        self.training_data = []
+    # Shared by every detector: each fit already uses all cores (n_jobs=-1)
+    training_slots = threading.BoundedSemaphore(1)
+    
+    def __init__(self, background_training: bool = True,
+                 engine: str = "isolation_forest", n_jobs: int = -1):
+        """
+        Args:
+            background_training: Retrain in a worker thread instead of
+                blocking add_training_data
+            engine: "isolation_forest" (periodic batch refits) or the name of
+                an online engine in ONLINE_ENGINES
+            n_jobs: Isolation Forest parallelism; 1 inside shard processes,
+                which are daemonic and cannot start joblib workers
+        """
+        if engine != "isolation_forest" and engine not in ONLINE_ENGINES:
+            raise ValueError(f"Unknown anomaly engine: {engine}")
+        self.engine = engine
+        self.n_jobs = n_jobs
+        self.online_engine = ONLINE_ENGINES[engine]() if engine in ONLINE_ENGINES else None
+        
+        # Fitted (scaler, model) pair, replaced as a whole after each retrain
+        self._fitted = (None, None)
+        self.training_window = 1000
+        self.training_data = deque(maxlen=self.training_window)
         self.risk_score = 0
         self.min_training_samples = 100
+        
+        # Retraining schedule: whichever trigger fires first
+        self.retrain_every_samples = 500
+        self.retrain_interval_seconds = 600
+        self.drift_threshold = 1.0
+        self.drift_smoothing = 0.01
+        self.background_training = background_training
+        
+        self.samples_since_training = 0
+        self.last_training_time = None
+        self.retrain_count = 0
+        self._drift = None
+        self._data_lock = threading.Lock()
+        self._retrain_event = threading.Event()
+        self._training_thread = None
+        self._stopped = False
+    
+    @property
+    def model(self) -> Optional["IsolationForest"]:
+        """Currently active model (None until first training)"""
+        return self._fitted[1]
+    
+    @property
+    def scaler(self) -> Optional["StandardScaler"]:
+        """Scaler fitted together with the active model (None until first training)"""
+        return self._fitted[0]
     
     def add_training_data(self, features: np.ndarray):
         """Add data for model training"""
-        self.training_data.append(features)
+        if self.online_engine is not None:
+            self.online_engine.update(features)
+            return
+        
+        with self._data_lock:
+            self.training_data.append(features)
+            n_samples = len(self.training_data)
+        self.samples_since_training += 1
+        
+        if n_samples >= self.min_training_samples and self.should_retrain(features):
+            self.request_retrain()
+    
+    def should_retrain(self, features: np.ndarray) -> bool:
+        """Check sample count, elapsed time and drift retraining triggers"""
+        scaler, model = self._fitted
+        if model is None:
+            return True
+        
+        if self.samples_since_training >= self.retrain_every_samples:
+            return True
+        
+        if time.time() - self.last_training_time >= self.retrain_interval_seconds:
+            return True
         
-        if len(self.training_data) >= self.min_training_samples:
+        # Drift: smoothed z-score of new samples against the training data,
+        # starting from the training mean (0) so single outliers don't trigger
+        z = (np.asarray(features) - scaler.mean_) / scaler.scale_
+        if self._drift is None:
+            self._drift = np.zeros_like(z)
+        self._drift = self._drift + self.drift_smoothing * (z - self._drift)
+        return float(np.max(np.abs(self._drift))) > self.drift_threshold
+    
+    def request_retrain(self):
+        """Schedule a retrain (runs inline if background training is off)"""
+        if not self.background_training:
+            self.train_model()
+            return
+        
+        if self._training_thread is None and not self._stopped:
+            self._training_thread = threading.Thread(
+                target=self._training_worker,
+                daemon=True
+            )
+            self._training_thread.start()
+        
+        # Requests made while a retrain is running collapse into one more run
+        self._retrain_event.set()
+    
+    def _training_worker(self):
+        """Background loop that retrains whenever a retrain is requested"""
+        while not self._stopped:
+            self._retrain_event.wait()
+            self._retrain_event.clear()
+            if self._stopped:
+                break
             self.train_model()
     
-    def train_model(self):
-        """Train Isolation Forest model"""
+    def stop(self):
+        """Stop the background training worker"""
+        self._stopped = True
+        self._retrain_event.set()
+        if self._training_thread is not None:
+            self._training_thread.join(timeout=5)
+            self._training_thread = None
+    
+    def train_model(self) -> bool:
+        """Train Isolation Forest model on the training window and swap it in"""
         try:
-            X = np.array(self.training_data[-1000:])  # Use recent data
-            X_scaled = self.scaler.fit_transform(X)
+            with self._data_lock:
+                X = np.array(self.training_data)  # Bounded to recent data
+            self.samples_since_training = 0
             
-            self.model = IsolationForest(
-                contamination=0.1,
-                random_state=42,
-                n_estimators=100
-            )
-            self.model.fit(X_scaled)
+            IsolationForest, StandardScaler = _sklearn()
+            with self.training_slots:
+                start = time.perf_counter()
+                scaler = StandardScaler()
+                X_scaled = scaler.fit_transform(X)
+                
+                model = IsolationForest(
+                    contamination=0.1,
+                    random_state=42,
+                    n_estimators=100,
+                    n_jobs=self.n_jobs
+                )
+                model.fit(X_scaled)
+            
+            # Single assignment so readers never see a mismatched pair
+            self._fitted = (scaler, model)
+            self._drift = None
+            self.last_training_time = time.time()
+            self.retrain_count += 1
+            METRICS.increment("retrains")
+            METRICS.observe("retrain", time.perf_counter() - start)
+            return True
         except Exception as e:
             print(f"Error training model: {e}")
+            METRICS.increment("errors")
+            return False
     
     def detect_anomaly(self, features: np.ndarray) -> Tuple[bool, float]:
         """
         Detect if current behavior is anomalous
         Returns: (is_anomaly, anomaly_score)
         """
-        if self.model is None:
+        if self.online_engine is not None:
+            if not self.online_engine.is_ready():
+                return False, 0.0
+            is_anomaly, scores = self.online_engine.score([features])
+            return bool(is_anomaly[0]), float(scores[0])
+        
+        scaler, model = self._fitted
+        if model is None:
             return False, 0.0
         
         try:
-            X_scaled = self.scaler.transform([features])
-            anomaly_score = self.model.decision_function(X_scaled)[0]
-            is_anomaly = self.model.predict(X_scaled)[0] == -1
+            X_scaled = scaler.transform([features])
+            # predict() is decision_function() < 0, so one forest pass suffices
+            anomaly_score = model.decision_function(X_scaled)[0]
+            is_anomaly = anomaly_score < 0
             
-            return is_anomaly, float(abs(anomaly_score) * 100)
+            return bool(is_anomaly), float(abs(anomaly_score) * 100)
         except Exception as e:
             print(f"Error detecting anomaly: {e}")
             return False, 0.0
     
+    def detect_anomalies(self, feature_matrix: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Score many feature vectors (hosts or time steps) at once
+        
+        Args:
+            feature_matrix: (N, n_features) array, e.g. from build_feature_matrix
+            
+        Returns:
+            (is_anomaly, anomaly_scores) arrays of length N, same scale as
+            detect_anomaly
+        """
+        X = np.asarray(feature_matrix)
+        n_rows = X.shape[0]
+        if self.online_engine is not None:
+            if not self.online_engine.is_ready() or n_rows == 0:
+                return np.zeros(n_rows, dtype=bool), np.zeros(n_rows)
+            return self.online_engine.score(X)
+        
+        scaler, model = self._fitted
+        if model is None or n_rows == 0:
+            return np.zeros(n_rows, dtype=bool), np.zeros(n_rows)
+        
+        try:
+            X_scaled = scaler.transform(X)
+            anomaly_scores = model.decision_function(X_scaled)
+            return anomaly_scores < 0, np.abs(anomaly_scores) * 100
+        except Exception as e:
+            print(f"Error detecting anomalies: {e}")
+            return np.zeros(n_rows, dtype=bool), np.zeros(n_rows)
+    
     def calculate_risk_score(self, anomaly_score: float, 
                            detection_count: int = 0, 
                            severity: float = 0.5) -> float:
@@ -270,204 +885,1374 @@ class AnomalyDetector:
         self.risk_score = final_score
         
         return final_score
+    
+    def get_state(self) -> Dict:
+        """Export fitted scaler/model and training window for persistence"""
+        scaler, model = self._fitted
+        with self._data_lock:
+            training_data = np.array(self.training_data, dtype=np.float32)
+        return {
+            "engine": self.engine,
+            "online_engine": self.online_engine,
+            "scaler": scaler,
+            "model": model,
+            "training_data": training_data,
+            "last_training_time": self.last_training_time,
+            "retrain_count": self.retrain_count
+        }
+    
+    def load_state(self, state: Dict):
+        """Restore state exported by get_state; scoring works immediately"""
+        if state.get("engine", "isolation_forest") != self.engine:
+            print(f"Warning: saved detector uses {state.get('engine')}, "
+                  f"configured engine is {self.engine}; not restoring")
+            return
+        if self.online_engine is not None:
+            self.online_engine = state["online_engine"]
+        
+        with self._data_lock:
+            self.training_data.clear()
+            self.training_data.extend(state["training_data"])
+        self.last_training_time = state["last_training_time"]
+        self.retrain_count = state["retrain_count"]
+        self.samples_since_training = 0
+        self._drift = None
+        model = state["model"]
+        if model is not None:
+            model.n_jobs = self.n_jobs  # saved by a process with other parallelism
+        self._fitted = (state["scaler"], model)
 
 
-# ==================== DECEPTION NETWORK ====================
+# ==================== MODEL PERSISTENCE ====================
 
-class DeceptionNetworkMapper:
-    """Create and manage fake network topology for attackers"""
+def load_model_key(key_path: str = None) -> bytes:
+    """
+    Secret that authenticates saved model payloads
     
-    def __init__(self, db_handler: EncryptionHandler):
+    SMARTAI_MODEL_KEY if set, otherwise a random key kept in
+    DATA_DIR/model_store.key, created owner-only on first use.
+    """
+    env_key = os.getenv('SMARTAI_MODEL_KEY')
+    if env_key:
+        return env_key.encode()
+    
+    key_path = key_path or os.path.join(DATA_DIR, "model_store.key")
+    os.makedirs(os.path.dirname(os.path.abspath(key_path)), mode=0o700, exist_ok=True)
+    try:
+        with open(key_path, 'rb') as f:
+            return f.read()
+    except FileNotFoundError:
+        pass
+    
+    # Write a complete key under a temp name, then link it into place:
+    # shard processes starting together all end up with the same key
+    temp_path = f"{key_path}.{os.getpid()}.tmp"
+    fd = os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    try:
+        os.write(fd, os.urandom(32))
+    finally:
+        os.close(fd)
+    try:
+        os.link(temp_path, key_path)
+    except FileExistsError:
+        pass
+    finally:
+        os.remove(temp_path)
+    with open(key_path, 'rb') as f:
+        return f.read()
+
+
+def _sign_payload(key: bytes, payload: bytes) -> bytes:
+    return hmac.new(key, payload, hashlib.sha256).digest() + payload
+
+
+def _verify_payload(key: bytes, signed: bytes) -> bytes:
+    mac, payload = signed[:32], signed[32:]
+    if not hmac.compare_digest(mac, hmac.new(key, payload, hashlib.sha256).digest()):
+        raise ValueError("model payload failed authentication, not unpickling it")
+    return payload
+
+
+class ModelStore:
+    """
+    Versioned snapshots of fitted models and baselines in an encrypted database
+    
+    Trust boundary: snapshots are pickles, and unpickling runs code. The
+    file encryption key is derived from a key in the source, so it keeps
+    the data unreadable but proves nothing about who wrote it. Each payload
+    therefore carries an HMAC-SHA256 keyed by load_model_key()
+    (SMARTAI_MODEL_KEY or the owner-only model_store.key) and is unpickled
+    only if that verifies. Whoever can read that key, i.e. the service
+    account, can still forge snapshots. Database files are kept owner-only.
+    """
+    
+    # 2: flow features fill the trailing feature-vector slots
+    # 3: payloads are HMAC-signed
+    FORMAT_VERSION = 3
+    
+    def __init__(self, db_handler: EncryptionHandler, db_path: str = None,
+                 keep_versions: int = 3, model_key: bytes = None):
         self.db = db_handler
-        self.fake_network = self.generate_fake_network()
-        self.attacker_tracking = {}
-        self.real_network = self.map_real_network()
+        self.db_path = db_path or os.path.join(DATA_DIR, "ai_models.db")
+        self.keep_versions = keep_versions
+        self.model_key = model_key or load_model_key()
+        # The encrypted database is decrypted to one fixed temp file per path,
+        # so saves and loads from different threads must not overlap
+        self.lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(self.db_path)), exist_ok=True)
     
-    def generate_fake_network(self) -> Dict:
-        """Generate realistic-looking fake network"""
-        fake_network = {
-            "devices": [
-                {
-                    "ip": "192.168.1.10",
-                    "hostname": "CORP-DB-SERVER",
-                    "os": "Windows Server 2022",
-                    "services": [
-                        {"port": 3389, "service": "RDP", "version": "10.0.19041"},
-                        {"port": 1433, "service": "MS-SQL", "version": "2019"},
-                        {"port": 445, "service": "SMB", "version": "3.1.1"}
-                    ]
-                },
-                {
-                    "ip": "192.168.1.20",
-                    "hostname": "CORP-ADMIN-PC",
-                    "os": "Windows 11 Pro",
-                    "services": [
-                        {"port": 3389, "service": "RDP", "version": "10.0"},
-                        {"port": 135, "service": "RPC", "version": "6.1"}
-                    ]
-                },
-                {
-                    "ip": "192.168.1.30",
-                    "hostname": "BACKUP-SERVER",
-                    "os": "Linux Ubuntu 22.04",
-                    "services": [
-                        {"port": 22, "service": "SSH", "version": "OpenSSH 8.2"},
-                        {"port": 445, "service": "Samba", "version": "4.15"}
-                    ]
-                },
-                {
-                    "ip": "192.168.1.50",
-                    "hostname": "WEB-SERVER",
-                    "os": "Linux CentOS 8",
-                    "services": [
-                        {"port": 80, "service": "HTTP", "version": "Apache 2.4"},
-                        {"port": 443, "service": "HTTPS", "version": "Apache 2.4"},
-                        {"port": 22, "service": "SSH", "version": "OpenSSH 7.4"}
-                    ]
-                }
-            ],
-            "fake_credentials": [
-                {"username": "admin", "password": "Corp@dmin123!", "note": "Database admin"},
-                {"username": "backup", "password": "Backup@2024!", "note": "Backup service"},
-                {"username": "root", "password": "Root$ecure888", "note": "Root access"}
-            ]
-        }
-        
-        return fake_network
+    def _ensure_table(self, conn: sqlite3.Connection):
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS model_snapshots (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                model_key TEXT NOT NULL,
+                format_version INTEGER NOT NULL,
+                sklearn_version TEXT,
+                payload BLOB NOT NULL,
+                is_encrypted INTEGER DEFAULT 1
+            )
+        ''')
+        conn.execute('''
+            CREATE INDEX IF NOT EXISTS idx_model_snapshots
+            ON model_snapshots(model_key, id)
+        ''')
     
-    def map_real_network(self) -> Dict:
-        """Map actual real network (encrypted, never exposed)"""
-        real_network = {}
+    def save_states(self, states: Dict[str, Dict]) -> bool:
+        """
+        Save several states in one encrypted transaction
         
+        Args:
+            states: Mapping of model key (e.g. "detector") to state dict
+            
+        Returns:
+            True if successful
+        """
+        with self.lock:
+            return self._save_states(states)
+    
+    def _save_states(self, states: Dict[str, Dict]) -> bool:
         try:
-            for interface in interfaces():
-                iface_info = ifaddresses(interface)
-                if AF_INET in iface_info:
-                    real_network[interface] = iface_info[AF_INET]
+            conn = self.db.connect_database(self.db_path)
         except Exception as e:
-            print(f"Error mapping real network: {e}")
+            print(f"Error opening model store: {e}")
+            return False
         
-        return real_network
+        try:
+            self._ensure_table(conn)
+            for model_key, state in states.items():
+                payload = _sign_payload(
+                    self.model_key, pickle.dumps(state, protocol=pickle.HIGHEST_PROTOCOL))
+                conn.execute(
+                    "INSERT INTO model_snapshots "
+                    "(model_key, format_version, sklearn_version, payload) "
+                    "VALUES (?, ?, ?, ?)",
+                    (model_key, self.FORMAT_VERSION, sklearn_version(), payload)
+                )
+                # Keep only the newest versions per key
+                conn.execute(
+                    "DELETE FROM model_snapshots WHERE model_key = ? AND id NOT IN "
+                    "(SELECT id FROM model_snapshots WHERE model_key = ? "
+                    "ORDER BY id DESC LIMIT ?)",
+                    (model_key, model_key, self.keep_versions)
+                )
+            conn.commit()
+            return True
+        except Exception as e:
+            print(f"Error saving model state: {e}")
+            return False
+        finally:
+            self.db.close_database(conn)
+            if os.path.exists(self.db_path):
+                os.chmod(self.db_path, 0o600)
     
-    def get_fake_network_for_attacker(self, attacker_ip: str) -> Dict:
-        """Serve fake network to attacker"""
-        # Always serve the same fake network, never the real one
-        self.attacker_tracking[attacker_ip] = {
-            "first_seen": datetime.now().isoformat(),
-            "queries": []
-        }
+    def load_states(self, model_keys: List[str]) -> Dict[str, Dict]:
+        """
+        Load the newest compatible snapshot for each key
         
-        return {
-            "network": self.fake_network,
-            "timestamp": datetime.now().isoformat(),
-            "decoy": True  # Internal flag, never exposed
-        }
-    
-    def track_attacker_movement(self, attacker_ip: str, 
-                               target_ip: str, action: str):
-        """Log attacker interactions with fake network"""
-        if attacker_ip not in self.attacker_tracking:
-            self.attacker_tracking[attacker_ip] = {
-                "first_seen": datetime.now().isoformat(),
-                "queries": []
-            }
+        Snapshots from another format version or scikit-learn version are
+        skipped, the caller then starts learning from scratch.
         
-        self.attacker_tracking[attacker_ip]["queries"].append({
-            "target": target_ip,
-            "action": action,
-            "timestamp": datetime.now().isoformat()
-        })
+        Returns:
+            Mapping of model key to state dict (missing keys are omitted)
+        """
+        with self.lock:
+            return self._load_states(model_keys)
+    
+    def _load_states(self, model_keys: List[str]) -> Dict[str, Dict]:
+        if not os.path.exists(self.db_path):
+            return {}
+        
+        states = {}
+        try:
+            conn = self.db.connect_database(self.db_path)
+        except Exception as e:
+            print(f"Error opening model store: {e}")
+            return states
+        
+        try:
+            if conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'model_snapshots'"
+            ).fetchone() is None:
+                return states
+            for model_key in model_keys:
+                row = conn.execute(
+                    "SELECT payload FROM model_snapshots "
+                    "WHERE model_key = ? AND format_version = ? AND sklearn_version = ? "
+                    "ORDER BY id DESC LIMIT 1",
+                    (model_key, self.FORMAT_VERSION, sklearn_version())
+                ).fetchone()
+                if row is not None:
+                    states[model_key] = pickle.loads(_verify_payload(self.model_key, row[0]))
+        except Exception as e:
+            print(f"Error loading model state: {e}")
+        finally:
+            # Read-only: don't VACUUM and re-encrypt the whole file
+            self.db.close_database(conn, encrypt=False)
+        
+        return states
+
+
+class DeviceStateStore:
+    """
+    Latest profiler/detector state of each device, one encrypted row per device
+    
+    Unlike ModelStore the database file itself stays plain SQLite and each
+    payload is encrypted on its own, so loading or saving one device touches
+    only its row instead of decrypting and re-encrypting every device.
+    Payloads are HMAC-signed and verified before unpickling, with the same
+    trust boundary as ModelStore.
+    """
+    
+    def __init__(self, db_handler: EncryptionHandler, db_path: str = None,
+                 model_key: bytes = None):
+        self.db_path = db_path or os.path.join(DATA_DIR, "device_models.db")
+        self.model_key = model_key or load_model_key()
+        encryption = db_handler.db_encryption
+        self.fernet = encryption.fernet if encryption else None
+        os.makedirs(os.path.dirname(os.path.abspath(self.db_path)), exist_ok=True)
+        
+        # Owner-only before SQLite opens it (its WAL files copy these permissions)
+        os.close(os.open(self.db_path, os.O_WRONLY | os.O_CREAT, 0o600))
+        os.chmod(self.db_path, 0o600)
+        conn = self._connect()
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS device_states (
+                    device_id TEXT PRIMARY KEY,
+                    timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    format_version INTEGER NOT NULL,
+                    sklearn_version TEXT,
+                    payload BLOB NOT NULL
+                )
+            ''')
+            conn.commit()
+        finally:
+            conn.close()
+    
+    def _connect(self) -> sqlite3.Connection:
+        # Short-lived connections: the eviction worker and get() run in different threads
+        return sqlite3.connect(self.db_path, timeout=30)
+    
+    def save_states(self, states: Dict[str, Dict]) -> bool:
+        """
+        Save (replace) the state of several devices in one transaction
+        
+        Args:
+            states: Mapping of device ID to state dict
+            
+        Returns:
+            True if successful
+        """
+        try:
+            rows = []
+            for device_id, state in states.items():
+                payload = _sign_payload(
+                    self.model_key, pickle.dumps(state, protocol=pickle.HIGHEST_PROTOCOL))
+                if self.fernet:
+                    payload = self.fernet.encrypt(payload)
+                rows.append((device_id, ModelStore.FORMAT_VERSION, sklearn_version(), payload))
+            
+            conn = self._connect()
+            try:
+                conn.executemany(
+                    "INSERT OR REPLACE INTO device_states "
+                    "(device_id, format_version, sklearn_version, payload) VALUES (?, ?, ?, ?)",
+                    rows
+                )
+                conn.commit()
+            finally:
+                conn.close()
+            return True
+        except Exception as e:
+            print(f"Error saving device state: {e}")
+            return False
+    
+    def load_state(self, device_id: str) -> Optional[Dict]:
+        """
+        Load a device's state, None if missing or saved by another format
+        or scikit-learn version
+        """
+        try:
+            conn = self._connect()
+            try:
+                row = conn.execute(
+                    "SELECT payload FROM device_states "
+                    "WHERE device_id = ? AND format_version = ? AND sklearn_version = ?",
+                    (device_id, ModelStore.FORMAT_VERSION, sklearn_version())
+                ).fetchone()
+            finally:
+                conn.close()
+            if row is None:
+                return None
+            payload = self.fernet.decrypt(row[0]) if self.fernet else row[0]
+            return pickle.loads(_verify_payload(self.model_key, payload))
+        except Exception as e:
+            print(f"Error loading device state: {e}")
+            return None
+
+
+# ==================== DEVICE MODEL REGISTRY ====================
+
+class DeviceModelRegistry:
+    """
+    Per-device profiler/detector pairs with LRU eviction
+    
+    Least-recently-used devices are dropped from memory once max_devices
+    or max_memory_bytes is exceeded, then reloaded on their next sample.
+    Evicted devices are handed to a background worker that waits for any
+    retrain in flight and then saves them, so get() never blocks on either.
+    A device is loaded outside the registry lock, so other devices are
+    served while it is read from the state store.
+    """
+    
+    def __init__(self, db_handler: EncryptionHandler, state_store: DeviceStateStore,
+                 max_devices: int = 64, max_memory_bytes: int = 256 * 1024 * 1024,
+                 engine: str = "isolation_forest", n_jobs: int = -1):
+        self.db = db_handler
+        self.state_store = state_store
+        self.max_devices = max_devices
+        self.max_memory_bytes = max_memory_bytes
+        self.engine = engine
+        self.n_jobs = n_jobs
+        self.devices = OrderedDict()  # device_id -> (profiler, detector), LRU first
+        self.evicting = {}  # device_id -> Event set once its eviction is saved
+        self.loading = {}  # device_id -> Event set once it is resident
+        self.lock = threading.RLock()
+        self.evictions = 0
+        self.reloads = 0
+        self._evict_queue = queue.Queue()
+        self._evict_thread = threading.Thread(target=self._eviction_worker, daemon=True)
+        self._evict_thread.start()
+    
+    def get(self, device_id: str) -> Tuple[BehaviorProfiler, AnomalyDetector]:
+        """Get (profiler, detector) for a device, loading or creating it"""
+        while True:
+            with self.lock:
+                entry = self.devices.get(device_id)
+                if entry is not None:
+                    self.devices.move_to_end(device_id)
+                    return entry
+                # Reload what an eviction saved, and load each device only once
+                pending = self.evicting.get(device_id) or self.loading.get(device_id)
+                if pending is None:
+                    self.loading[device_id] = threading.Event()
+                    break
+            pending.wait()
+        
+        try:
+            profiler = BehaviorProfiler(self.db)
+            detector = AnomalyDetector(engine=self.engine, n_jobs=self.n_jobs)
+            state = self.state_store.load_state(device_id)
+            if state is not None:
+                profiler.load_state(state["profiler"])
+                detector.load_state(state["detector"])
+            
+            entry = (profiler, detector)
+            with self.lock:
+                if state is not None:
+                    self.reloads += 1
+                self.devices[device_id] = entry
+                self.enforce_limits()
+            return entry
+        finally:
+            with self.lock:
+                self.loading.pop(device_id).set()
+    
+    def estimate_memory(self) -> int:
+        """Approximate bytes held by resident device models"""
+        with self.lock:
+            return sum(self._estimate_entry(entry) for entry in self.devices.values())
+    
+    @staticmethod
+    def _estimate_entry(entry: Tuple[BehaviorProfiler, AnomalyDetector]) -> int:
+        profiler, detector = entry
+        total = profiler.stream_mean.nbytes * 5
+        if profiler.feature_history is not None:
+            total += profiler.feature_history.nbytes
+        total += len(detector.training_data) * profiler.n_features * 8
+        
+        model = detector.model
+        if model is not None:
+            # Roughly 80 bytes per tree node (split, thresholds, children, value)
+            total += 80 * sum(tree.tree_.node_count for tree in model.estimators_)
+        return total
+    
+    def enforce_limits(self):
+        """Evict least-recently-used devices until within the limits"""
+        with self.lock:
+            total_bytes = None
+            while len(self.devices) > 1:
+                if len(self.devices) <= self.max_devices:
+                    if total_bytes is None:
+                        total_bytes = self.estimate_memory()
+                    if total_bytes <= self.max_memory_bytes:
+                        break
+                
+                device_id, entry = self.devices.popitem(last=False)
+                if total_bytes is not None:
+                    total_bytes -= self._estimate_entry(entry)
+                self.evicting[device_id] = threading.Event()
+                self._evict_queue.put((device_id, entry))
+                self.evictions += 1
+    
+    def _eviction_worker(self):
+        """Stop evicted detectors, then save everything evicted so far in one transaction"""
+        while True:
+            batch = [self._evict_queue.get()]
+            while True:
+                try:
+                    batch.append(self._evict_queue.get_nowait())
+                except queue.Empty:
+                    break
+            
+            entries = {}
+            for item in batch:
+                if item is not None:
+                    device_id, (profiler, detector) = item
+                    detector.stop()  # a retrain in flight finishes and is saved
+                    entries[device_id] = (profiler, detector)
+            if entries:
+                self._save(entries)
+                with self.lock:
+                    for device_id in entries:
+                        self.evicting.pop(device_id).set()
+            
+            if None in batch:
+                return
+    
+    def _save(self, entries: Dict[str, Tuple[BehaviorProfiler, AnomalyDetector]]) -> bool:
+        states = {
+            device_id: {"profiler": profiler.get_state(), "detector": detector.get_state()}
+            for device_id, (profiler, detector) in entries.items()
+        }
+        return self.state_store.save_states(states)
+    
+    def flush(self) -> bool:
+        """Save every resident device model (e.g. on shutdown)"""
+        with self.lock:
+            if not self.devices:
+                return True
+            return self._save(dict(self.devices))
+    
+    def stop(self):
+        """Finish pending evictions and stop background training of resident detectors"""
+        if self._evict_thread is not None:
+            self._evict_queue.put(None)
+            self._evict_thread.join()
+            self._evict_thread = None
+        with self.lock:
+            detectors = [detector for profiler, detector in self.devices.values()]
+        for detector in detectors:
+            detector.stop()
+
+
+# ==================== DECEPTION NETWORK ====================
+
+# Attacker action -> tool it suggests, in report order
+ATTACKER_TOOL_SIGNATURES = {
+    "port_scan": "Nmap/Port Scanner",
+    "rdp_attempt": "RDP/Remote Access",
+    "credential_test": "Credential Handler",
+}
+
+
+class AttackerRecord:
+    """Fixed-size ring of one attacker's most recent queries plus running aggregates"""
+    
+    __slots__ = ("first_seen", "last_seen", "timestamps", "actions",
+                 "targets", "next_index", "count", "total_queries",
+                 "action_counts", "target_set", "targeted_assets", "tools")
+    
+    def __init__(self, max_queries: int, now: float):
+        self.first_seen = now
+        self.last_seen = now
+        self.timestamps = np.zeros(max_queries)
+        self.actions = np.zeros(max_queries, dtype=np.int16)
+        self.targets = [None] * max_queries
+        self.next_index = 0
+        self.count = 0
+        self.total_queries = 0
+        
+        # Aggregates over the attacker's whole history (including spilled queries)
+        self.action_counts = {}
+        self.target_set = set()
+        self.targeted_assets = []
+        self.tools = []
+    
+    def add_aggregates(self, target: str, action: str, max_targets: int):
+        """Fold one query into the running aggregates"""
+        count = self.action_counts.get(action, 0)
+        self.action_counts[action] = count + 1
+        
+        if count == 0 and action in ATTACKER_TOOL_SIGNATURES:
+            self.tools = [
+                tool for known_action, tool in ATTACKER_TOOL_SIGNATURES.items()
+                if known_action in self.action_counts
+            ]
+        
+        if target not in self.target_set and len(self.targeted_assets) < max_targets:
+            self.target_set.add(target)
+            self.targeted_assets.append(target)
+
+
+class AttackerTracker:
+    """
+    Bounded attacker tracking store
+    
+    Each attacker keeps a ring of its last max_queries queries (interned
+    action codes, float timestamps). Queries pushed out of the ring, and the
+    history of attackers evicted after ttl_seconds idle (or beyond
+    max_attackers), are spilled to the attacker_movements table by a
+    background thread once spill_batch_size are pending or
+    flush_interval_seconds have passed. If the database cannot keep up,
+    the oldest unsaved queries beyond max_pending are dropped.
+    """
+    
+    def __init__(self, db_handler: EncryptionHandler, db_path: str = None,
+                 max_queries: int = 256, ttl_seconds: float = 3600,
+                 max_attackers: int = 10000, spill_batch_size: int = 500,
+                 max_targets: int = 1024, max_pending: int = 100000,
+                 flush_interval_seconds: float = 60.0):
+        self.db = db_handler
+        self.db_path = db_path or os.path.join(DATA_DIR, "deception_intel.db")
+        self.max_queries = max_queries
+        self.ttl_seconds = ttl_seconds
+        self.max_attackers = max_attackers
+        self.spill_batch_size = spill_batch_size
+        self.max_targets = max_targets
+        self.flush_interval_seconds = flush_interval_seconds
+        
+        self.records = OrderedDict()  # attacker_ip -> AttackerRecord, least recently active first
+        self.action_codes = {}
+        self.action_names = []
+        self.pending_spill = deque(maxlen=max_pending)
+        self.lock = threading.RLock()
+        # One writer at a time: the encrypted database uses one temp file per path
+        self._flush_lock = threading.Lock()
+        self._flush_event = threading.Event()
+        self._stopped = False
+        self._thread = threading.Thread(target=self._flush_loop, daemon=True)
+        self._thread.start()
+    
+    def __contains__(self, attacker_ip: str) -> bool:
+        return attacker_ip in self.records
+    
+    def __len__(self) -> int:
+        return len(self.records)
+    
+    def action_code(self, action: str) -> int:
+        """Intern an action name as a small integer code"""
+        code = self.action_codes.get(action)
+        if code is None:
+            code = len(self.action_names)
+            self.action_codes[action] = code
+            self.action_names.append(action)
+        return code
+    
+    def touch(self, attacker_ip: str, now: float = None) -> AttackerRecord:
+        """Get or create an attacker's record and mark it active"""
+        now = time.time() if now is None else now
+        with self.lock:
+            record = self._touch(attacker_ip, now)
+        self._flush_if_full()
+        return record
+    
+    def _touch(self, attacker_ip: str, now: float) -> AttackerRecord:
+        # Caller holds self.lock
+        record = self.records.get(attacker_ip)
+        if record is None:
+            record = AttackerRecord(self.max_queries, now)
+            self.records[attacker_ip] = record
+        else:
+            self.records.move_to_end(attacker_ip)
+        record.last_seen = now
+        self._evict_expired(now)
+        return record
+    
+    def record_query(self, attacker_ip: str, target: str, action: str,
+                     now: float = None) -> AttackerRecord:
+        """Append one query to an attacker's ring"""
+        now = time.time() if now is None else now
+        with self.lock:
+            record = self._touch(attacker_ip, now)
+            i = record.next_index
+            
+            if record.count == self.max_queries:
+                # Ring is full: the oldest query goes to the database
+                self.pending_spill.append((
+                    record.timestamps[i], attacker_ip,
+                    record.targets[i], self.action_names[record.actions[i]]
+                ))
+            else:
+                record.count += 1
+            
+            record.timestamps[i] = now
+            record.actions[i] = self.action_code(action)
+            record.targets[i] = target
+            record.next_index = (i + 1) % self.max_queries
+            record.total_queries += 1
+            record.add_aggregates(target, action, self.max_targets)
+        
+        self._flush_if_full()
+        return record
+    
+    def get_record(self, attacker_ip: str) -> Optional[AttackerRecord]:
+        """Get an attacker's record without marking it active"""
+        return self.records.get(attacker_ip)
+    
+    def get_queries(self, attacker_ip: str) -> List[Dict]:
+        """Get an attacker's queries still held in memory, oldest first"""
+        with self.lock:
+            record = self.records.get(attacker_ip)
+            if record is None:
+                return []
+            return [
+                {
+                    "target": record.targets[i],
+                    "action": self.action_names[record.actions[i]],
+                    "timestamp": datetime.fromtimestamp(record.timestamps[i]).isoformat()
+                }
+                for i in self._ring_order(record)
+            ]
+    
+    def _ring_order(self, record: AttackerRecord) -> Iterable[int]:
+        if record.count < self.max_queries:
+            return range(record.count)
+        return [(record.next_index + k) % self.max_queries for k in range(self.max_queries)]
+    
+    def evict_expired(self, now: float = None):
+        """Evict idle attackers past the TTL, and the least active beyond max_attackers"""
+        now = time.time() if now is None else now
+        with self.lock:
+            self._evict_expired(now)
+        self._flush_if_full()
+    
+    def _evict_expired(self, now: float):
+        # Caller holds self.lock
+        while self.records:
+            attacker_ip, record = next(iter(self.records.items()))
+            if (now - record.last_seen < self.ttl_seconds
+                    and len(self.records) <= self.max_attackers):
+                break
+            self.records.popitem(last=False)
+            for i in self._ring_order(record):
+                self.pending_spill.append((
+                    record.timestamps[i], attacker_ip,
+                    record.targets[i], self.action_names[record.actions[i]]
+                ))
+    
+    def _flush_if_full(self):
+        if len(self.pending_spill) >= self.spill_batch_size:
+            self._flush_event.set()
+    
+    def _flush_loop(self):
+        while not self._stopped:
+            self._flush_event.wait(self.flush_interval_seconds)
+            self._flush_event.clear()
+            # Idle attackers expire even when no new traffic arrives
+            self.evict_expired()
+            self.flush()
+    
+    def flush(self) -> bool:
+        """Write spilled queries to attacker_movements in one transaction"""
+        with self._flush_lock:
+            with self.lock:
+                if not self.pending_spill:
+                    return True
+                batch = list(self.pending_spill)
+                self.pending_spill.clear()
+            rows = [
+                (datetime.fromtimestamp(ts).isoformat(), attacker_ip, target, action)
+                for ts, attacker_ip, target, action in batch
+            ]
+            
+            try:
+                os.makedirs(os.path.dirname(os.path.abspath(self.db_path)), exist_ok=True)
+                conn = self.db.connect_database(self.db_path)
+            except Exception as e:
+                print(f"Error opening deception database: {e}")
+                self._requeue(batch)
+                return False
+            
+            try:
+                conn.execute('''
+                    CREATE TABLE IF NOT EXISTS attacker_movements (
+                        id INTEGER PRIMARY KEY AUTOINCREMENT,
+                        timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                        attacker_ip TEXT NOT NULL,
+                        targeted_fake_asset TEXT,
+                        action_taken TEXT,
+                        tools_detected TEXT,
+                        intelligence_gathered TEXT,
+                        is_encrypted INTEGER DEFAULT 1
+                    )
+                ''')
+                conn.executemany(
+                    "INSERT INTO attacker_movements "
+                    "(timestamp, attacker_ip, targeted_fake_asset, action_taken) "
+                    "VALUES (?, ?, ?, ?)",
+                    rows
+                )
+                conn.commit()
+                return True
+            except Exception as e:
+                print(f"Error spilling attacker movements: {e}")
+                self._requeue(batch)
+                return False
+            finally:
+                self.db.close_database(conn)
+    
+    def _requeue(self, batch: List[Tuple]):
+        # Failed batch goes back in front; the bound still drops the oldest
+        with self.lock:
+            newer = list(self.pending_spill)
+            self.pending_spill.clear()
+            self.pending_spill.extend(batch)
+            self.pending_spill.extend(newer)
+    
+    def close(self):
+        """Stop the flush thread and persist whatever is pending"""
+        self._stopped = True
+        self._flush_event.set()
+        self._thread.join(timeout=5)
+        self.flush()
+
+
+class DeceptionNetworkMapper:
+    """Create and manage fake network topology for attackers"""
+    
+    def __init__(self, db_handler: EncryptionHandler):
+        self.db = db_handler
+        self.fake_network = self.generate_fake_network()
+        self.attacker_tracking = AttackerTracker(db_handler)
+        self.real_network = self.map_real_network()
+    
+    def generate_fake_network(self) -> Dict:
+        """Generate realistic-looking fake network"""
+        fake_network = {
+            "devices": [
+                {
+                    "ip": "192.168.1.10",
+                    "hostname": "CORP-DB-SERVER",
+                    "os": "Windows Server 2022",
+                    "services": [
+                        {"port": 3389, "service": "RDP", "version": "10.0.19041"},
+                        {"port": 1433, "service": "MS-SQL", "version": "2019"},
+                        {"port": 445, "service": "SMB", "version": "3.1.1"}
+                    ]
+                },
+                {
+                    "ip": "192.168.1.20",
+                    "hostname": "CORP-ADMIN-PC",
+                    "os": "Windows 11 Pro",
+                    "services": [
+                        {"port": 3389, "service": "RDP", "version": "10.0"},
+                        {"port": 135, "service": "RPC", "version": "6.1"}
+                    ]
+                },
+                {
+                    "ip": "192.168.1.30",
+                    "hostname": "BACKUP-SERVER",
+                    "os": "Linux Ubuntu 22.04",
+                    "services": [
+                        {"port": 22, "service": "SSH", "version": "OpenSSH 8.2"},
+                        {"port": 445, "service": "Samba", "version": "4.15"}
+                    ]
+                },
+                {
+                    "ip": "192.168.1.50",
+                    "hostname": "WEB-SERVER",
+                    "os": "Linux CentOS 8",
+                    "services": [
+                        {"port": 80, "service": "HTTP", "version": "Apache 2.4"},
+                        {"port": 443, "service": "HTTPS", "version": "Apache 2.4"},
+                        {"port": 22, "service": "SSH", "version": "OpenSSH 7.4"}
+                    ]
+                }
+            ],
+            "fake_credentials": [
+                {"username": "admin", "password": "Corp@dmin123!", "note": "Database admin"},
+                {"username": "backup", "password": "Backup@2024!", "note": "Backup service"},
+                {"username": "root", "password": "Root$ecure888", "note": "Root access"}
+            ]
+        }
+        
+        return fake_network
+    
+    def map_real_network(self) -> Dict:
+        """Map actual real network (encrypted, never exposed)"""
+        real_network = {}
+        
+        try:
+            from netifaces import interfaces, ifaddresses, AF_INET
+        except ImportError as e:
+            print(f"Warning: Optional library not installed: {e}")
+            return real_network
+        
+        try:
+            for interface in interfaces():
+                iface_info = ifaddresses(interface)
+                if AF_INET in iface_info:
+                    real_network[interface] = iface_info[AF_INET]
+        except Exception as e:
+            print(f"Error mapping real network: {e}")
+        
+        return real_network
+    
+    def get_fake_network_for_attacker(self, attacker_ip: str) -> Dict:
+        """Serve fake network to attacker"""
+        # Always serve the same fake network, never the real one
+        self.attacker_tracking.touch(attacker_ip)
+        
+        return {
+            "network": self.fake_network,
+            "timestamp": datetime.now().isoformat(),
+            "decoy": True  # Internal flag, never exposed
+        }
+    
+    def track_attacker_movement(self, attacker_ip: str, 
+                               target_ip: str, action: str):
+        """Log attacker interactions with fake network"""
+        self.attacker_tracking.record_query(attacker_ip, target_ip, action)
     
     def generate_attacker_report(self, attacker_ip: str) -> Dict:
         """Generate intelligence report on attacker behavior"""
-        if attacker_ip not in self.attacker_tracking:
+        record = self.attacker_tracking.get_record(attacker_ip)
+        if record is None:
             return {}
         
+        # Read from aggregates kept up to date by track_attacker_movement
         report = {
             "attacker_ip": attacker_ip,
-            "first_detected": self.attacker_tracking[attacker_ip]["first_seen"],
-            "total_queries": len(self.attacker_tracking[attacker_ip]["queries"]),
-            "targeted_assets": list(set(
-                q["target"] for q in self.attacker_tracking[attacker_ip]["queries"]
-            )),
-            "suspected_tools": self.infer_attacker_tools(attacker_ip),
-            "threat_level": "HIGH" if len(self.attacker_tracking[attacker_ip]["queries"]) > 20 else "MEDIUM"
+            "first_detected": datetime.fromtimestamp(record.first_seen).isoformat(),
+            "last_seen": datetime.fromtimestamp(record.last_seen).isoformat(),
+            "total_queries": record.total_queries,
+            "action_counts": dict(record.action_counts),
+            "targeted_assets": list(record.targeted_assets),
+            "suspected_tools": list(record.tools),
+            "threat_level": "HIGH" if record.total_queries > 20 else "MEDIUM"
         }
         
         return report
     
     def infer_attacker_tools(self, attacker_ip: str) -> List[str]:
         """Infer what tools attacker is using based on behavior"""
-        tools = []
-        queries = self.attacker_tracking.get(attacker_ip, {}).get("queries", [])
+        # Maintained per query from ATTACKER_TOOL_SIGNATURES
+        record = self.attacker_tracking.get_record(attacker_ip)
+        return list(record.tools) if record is not None else []
+
+
+# ==================== HONEYPOT SYSTEM ====================
+
+class AlertBuffer:
+    """
+    Thread-safe bounded alert buffer with batched persistence
+    
+    Keeps the last max_alerts alerts in memory. New alerts are queued for
+    a background thread that writes them to honeypot_alerts /
+    fake_service_connections in one transaction once flush_batch_size are
+    pending or flush_interval_seconds have passed (other alert types, such
+    as SCAN_DETECTED, stay in memory only). If the database cannot
+    keep up, the oldest unsaved alerts beyond max_pending are dropped.
+    """
+    
+    def __init__(self, db_handler: EncryptionHandler, db_path: str = None,
+                 max_alerts: int = 1000, max_pending: int = 10000,
+                 flush_batch_size: int = 100, flush_interval_seconds: float = 10.0):
+        self.db = db_handler
+        self.db_path = db_path or os.path.join(DATA_DIR, "honeypot_system.db")
+        self.flush_batch_size = flush_batch_size
+        self.flush_interval_seconds = flush_interval_seconds
         
-        # Simple heuristics
-        if any(q["action"] == "port_scan" for q in queries):
-            tools.append("Nmap/Port Scanner")
-        if any(q["action"] == "rdp_attempt" for q in queries):
-            tools.append("RDP/Remote Access")
-        if any(q["action"] == "credential_test" for q in queries):
-            tools.append("Credential Handler")
+        self.recent = deque(maxlen=max_alerts)
+        self.pending = deque(maxlen=max_pending)
+        self.total_alerts = 0
+        self.persisted_alerts = 0
+        self.lock = threading.Lock()
+        self._flush_event = threading.Event()
+        self._flush_lock = threading.Lock()
+        self._stopped = False
+        self._thread = threading.Thread(target=self._flush_loop, daemon=True)
+        self._thread.start()
+    
+    def append(self, alert: Dict):
+        """Record an alert (never blocks on the database)"""
+        with self.lock:
+            self.recent.append(alert)
+            self.pending.append(alert)
+            self.total_alerts += 1
+            n_pending = len(self.pending)
         
-        return tools
+        if n_pending >= self.flush_batch_size:
+            self._flush_event.set()
+    
+    def __len__(self) -> int:
+        return len(self.recent)
+    
+    def __iter__(self):
+        with self.lock:
+            return iter(list(self.recent))
+    
+    def get_recent(self, count: int = 10) -> List[Dict]:
+        """Get the newest alerts, oldest first"""
+        with self.lock:
+            return list(self.recent)[-count:]
+    
+    def _flush_loop(self):
+        while not self._stopped:
+            self._flush_event.wait(self.flush_interval_seconds)
+            self._flush_event.clear()
+            self.flush()
+    
+    def flush(self) -> bool:
+        """Write pending alerts to the database in one transaction"""
+        with self._flush_lock:
+            with self.lock:
+                if not self.pending:
+                    return True
+                batch = list(self.pending)
+                self.pending.clear()
+            
+            file_rows = []
+            service_rows = []
+            for alert in batch:
+                alert_type = alert.get("type")
+                if alert_type == "HONEYPOT_SERVICE_ACCESS":
+                    service_rows.append((
+                        alert.get("timestamp"), alert.get("attacker_ip"),
+                        alert.get("attacker_port"), alert.get("service"),
+                        alert.get("port"), alert.get("banner_sent"),
+                        alert.get("first_bytes"),
+                        json.dumps(alert.get("scan_types", [])),
+                        alert.get("severity", "HIGH")
+                    ))
+                elif alert_type == "HONEYPOT_TRIGGERED":
+                    process_info = alert.get("process_info") or {}
+                    processes = process_info.get("processes") or [{}]
+                    file_rows.append((
+                        alert.get("timestamp"), alert.get("file"),
+                        alert.get("file_type"),
+                        processes[0].get("name", process_info.get("process")),
+                        processes[0].get("pid"), processes[0].get("parent_pid"),
+                        processes[0].get("command_line"),
+                        alert.get("severity", "CRITICAL")
+                    ))
+            
+            try:
+                os.makedirs(os.path.dirname(os.path.abspath(self.db_path)), exist_ok=True)
+                conn = self.db.connect_database(self.db_path)
+            except Exception as e:
+                print(f"Error opening honeypot database: {e}")
+                self._requeue(batch)
+                return False
+            
+            try:
+                self._ensure_tables(conn)
+                conn.executemany(
+                    "INSERT INTO honeypot_alerts (timestamp, file_accessed, file_type, "
+                    "process_name, process_pid, process_parent_pid, process_command_line, "
+                    "severity) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    file_rows
+                )
+                conn.executemany(
+                    "INSERT INTO fake_service_connections (timestamp, attacker_ip, "
+                    "attacker_port, targeted_service, targeted_port, banner_sent, "
+                    "first_bytes, tools_detected, severity) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    service_rows
+                )
+                conn.commit()
+                self.persisted_alerts += len(batch)
+                return True
+            except Exception as e:
+                print(f"Error persisting honeypot alerts: {e}")
+                self._requeue(batch)
+                return False
+            finally:
+                self.db.close_database(conn)
+    
+    def _requeue(self, batch: List[Dict]):
+        # Failed batch goes back in front; the bound still drops the oldest
+        with self.lock:
+            newer = list(self.pending)
+            self.pending.clear()
+            self.pending.extend(batch)
+            self.pending.extend(newer)
+    
+    @staticmethod
+    def _ensure_tables(conn: sqlite3.Connection):
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS honeypot_alerts (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                file_accessed TEXT,
+                file_type TEXT,
+                process_name TEXT,
+                process_pid INTEGER,
+                process_parent_pid INTEGER,
+                process_command_line TEXT,
+                source_ip TEXT,
+                source_port INTEGER,
+                severity TEXT CHECK(severity IN ('HIGH', 'CRITICAL')),
+                memory_snapshot_path TEXT,
+                memory_snapshot_hash TEXT,
+                actions_recorded TEXT,
+                is_encrypted INTEGER DEFAULT 1
+            )
+        ''')
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS fake_service_connections (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                attacker_ip TEXT,
+                attacker_port INTEGER,
+                targeted_service TEXT,
+                targeted_port INTEGER,
+                banner_sent TEXT,
+                first_bytes TEXT,
+                tools_detected TEXT,
+                severity TEXT DEFAULT 'HIGH',
+                is_encrypted INTEGER DEFAULT 1
+            )
+        ''')
+    
+    def close(self):
+        """Stop the flush thread and persist whatever is pending"""
+        self._stopped = True
+        self._flush_event.set()
+        self._thread.join(timeout=5)
+        self.flush()
 
 
-# ==================== HONEYPOT SYSTEM ====================
+class ScanSource:
+    """Time-bucketed connection counters for one source IP"""
+    
+    __slots__ = ("bucket", "port_counts", "port_totals", "port_last_seen",
+                 "last_seen", "last_reported")
+    
+    def __init__(self, bucket: int, now: float):
+        self.bucket = bucket
+        self.port_counts = {}  # port -> per-bucket connection counts (ring)
+        self.port_totals = {}  # port -> connections in the short window
+        self.port_last_seen = {}  # port -> timestamp of last connection
+        self.last_seen = now
+        self.last_reported = {}  # classification -> time last reported
+
+
+class ScanDetector:
+    """
+    Sliding-window scan classifier for fake service connections
+    
+    Per source IP it keeps counters in n_buckets time buckets per port
+    (short window) plus the last time each port was hit (long window).
+    Memory is bounded by max_sources x fake ports x n_buckets and each
+    connection costs O(1) for a fixed set of fake ports:
+    - port_scan: port_scan_ports distinct ports within the short window
+    - brute_force: brute_force_attempts connections to one port within the short window
+    - slow_scan: slow_scan_ports distinct ports within the long window only
+    """
+    
+    def __init__(self, window_seconds: float = 60, n_buckets: int = 12,
+                 slow_window_seconds: float = 3600, port_scan_ports: int = 3,
+                 brute_force_attempts: int = 10, slow_scan_ports: int = 3,
+                 max_sources: int = 10000, report_cooldown_seconds: float = 300):
+        self.bucket_seconds = window_seconds / n_buckets
+        self.n_buckets = n_buckets
+        self.window_seconds = window_seconds
+        self.slow_window_seconds = slow_window_seconds
+        self.port_scan_ports = port_scan_ports
+        self.brute_force_attempts = brute_force_attempts
+        self.slow_scan_ports = slow_scan_ports
+        self.max_sources = max_sources
+        self.report_cooldown_seconds = report_cooldown_seconds
+        
+        self.sources = OrderedDict()  # ip -> ScanSource, least recently active first
+        self.lock = threading.Lock()
+    
+    def record(self, source_ip: str, port: int, now: float = None) -> Tuple[List[str], List[str]]:
+        """
+        Count one connection and classify the source
+        
+        Returns:
+            (active, new): classifications currently matching this source, and
+            those not reported for it within report_cooldown_seconds
+        """
+        now = time.time() if now is None else now
+        bucket = int(now // self.bucket_seconds)
+        
+        with self.lock:
+            source = self.sources.get(source_ip)
+            if source is None:
+                source = ScanSource(bucket, now)
+                self.sources[source_ip] = source
+            else:
+                self.sources.move_to_end(source_ip)
+            # Mark active before evicting so this source is never the one dropped
+            source.last_seen = now
+            self._advance(source, bucket)
+            self._evict(now)
+            
+            counts = source.port_counts.get(port)
+            if counts is None:
+                counts = source.port_counts[port] = [0] * self.n_buckets
+                source.port_totals[port] = 0
+            counts[bucket % self.n_buckets] += 1
+            source.port_totals[port] += 1
+            source.port_last_seen[port] = now
+            
+            active = self._classify(source, now)
+            new = []
+            for kind in active:
+                last = source.last_reported.get(kind)
+                if last is None or now - last >= self.report_cooldown_seconds:
+                    source.last_reported[kind] = now
+                    new.append(kind)
+            return active, new
+    
+    def _advance(self, source: ScanSource, bucket: int):
+        # Zero buckets that slid out of the window (at most n_buckets each)
+        steps = min(bucket - source.bucket, self.n_buckets)
+        if steps <= 0:
+            return
+        for port, counts in source.port_counts.items():
+            for k in range(1, steps + 1):
+                i = (source.bucket + k) % self.n_buckets
+                source.port_totals[port] -= counts[i]
+                counts[i] = 0
+        source.bucket = bucket
+    
+    def _evict(self, now: float):
+        while self.sources:
+            source_ip, source = next(iter(self.sources.items()))
+            if (now - source.last_seen < self.slow_window_seconds
+                    and len(self.sources) <= self.max_sources):
+                break
+            self.sources.popitem(last=False)
+    
+    def _classify(self, source: ScanSource, now: float) -> List[str]:
+        recent_ports = 0
+        slow_ports = 0
+        for last_seen in source.port_last_seen.values():
+            age = now - last_seen
+            if age < self.window_seconds:
+                recent_ports += 1
+            if age < self.slow_window_seconds:
+                slow_ports += 1
+        
+        kinds = []
+        if recent_ports >= self.port_scan_ports:
+            kinds.append("port_scan")
+        elif slow_ports >= self.slow_scan_ports:
+            kinds.append("slow_scan")
+        if max(source.port_totals.values()) >= self.brute_force_attempts:
+            kinds.append("brute_force")
+        return kinds
+
 
 class HoneypotSystem:
     """Manage decoy files and fake services to catch attackers"""
     
-    def __init__(self, db_handler: EncryptionHandler):
+    def __init__(self, db_handler: EncryptionHandler,
+                 listener_backlog: int = 1024, listener_read_timeout: float = 5.0,
+                 deception: DeceptionNetworkMapper = None):
         self.db = db_handler
+        self.deception = deception
+        self.scan_detector = ScanDetector()
+        self.listener_backlog = listener_backlog
+        self.listener_read_timeout = listener_read_timeout
+        self.service_listener = None
         self.honeypot_files = {}
         self.fake_credentials = {}
-        self.alerts = []
+        self.alerts = AlertBuffer(db_handler)
+        
+        # File access alerts pushed by the watcher thread
+        self.alert_queue = queue.Queue(maxsize=10000)
+        self.watcher = None
+        
+        # Service connections for the deception tracker, drained off the
+        # listener loop because tracking can spill to the database
+        self.movement_queue = queue.Queue(maxsize=10000)
+        self._movement_thread = None
+        
+        # Index of processes holding decoy files open (Linux /proc)
+        self.process_index = None
+        if ProcFdIndex is not None and procfs_available():
+            self.process_index = ProcFdIndex()
+        
         self.setup_honeypot_files()
+        self.start_file_watcher()
         self.start_fake_services()
     
-    def setup_honeypot_files(self):
-        """Create decoy files on disk"""
-        honeypot_paths = {
-            "passwords": "C:\\Users\\Public\\passwords.txt",
-            "credit_cards": "C:\\Users\\Public\\credit_cards.xlsx",
-            "secrets": "C:\\Users\\Public\\company_secrets.pdf",
-            "config": "C:\\Users\\Public\\app.config"
-        }
+    def setup_honeypot_files(self):
+        """Create decoy files on disk"""
+        if os.name == 'nt':
+            decoy_dir = "C:\\Users\\Public"
+        else:
+            decoy_dir = os.path.expanduser("~/Public")
+        decoy_dir = os.getenv('SMARTAI_HONEYPOT_DIR', decoy_dir)
+        
+        honeypot_paths = {
+            "passwords": os.path.join(decoy_dir, "passwords.txt"),
+            "credit_cards": os.path.join(decoy_dir, "credit_cards.xlsx"),
+            "secrets": os.path.join(decoy_dir, "company_secrets.pdf"),
+            "config": os.path.join(decoy_dir, "app.config")
+        }
+        
+        decoy_contents = {
+            "passwords": "admin:Password123!\nroot:Root@2024!\ndbuser:Db$ecure888",
+            "credit_cards": "Fake credit card numbers for detection",
+            "secrets": "Confidential business information - decoy",
+            "config": '[database]\nhost=192.168.1.10\nuser=admin\npassword=Admin@123'
+        }
+        
+        for honey_type, path in honeypot_paths.items():
+            self.add_honeypot_file(path, honey_type,
+                                   decoy_contents.get(honey_type, "Decoy content"))
+    
+    def add_honeypot_file(self, path: str, honey_type: str,
+                          content: str = "Decoy content") -> bool:
+        """Create one decoy file and start watching it"""
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'w') as f:
+                f.write(content)
+            
+            self.honeypot_files[path] = {
+                "type": honey_type,
+                "created": datetime.now().isoformat(),
+                "access_count": 0,
+                "last_accessed": None,
+                "mtime": os.path.getmtime(path),
+                "content": content
+            }
+            
+            if self.watcher is not None:
+                self.watcher.add_watch(path)
+            if self.process_index is not None:
+                self.process_index.watch(path)
+            return True
+        except Exception as e:
+            print(f"Error creating honeypot file {path}: {e}")
+            return False
+    
+    def restore_honeypot_file(self, file_path: str) -> bool:
+        """Re-create a decoy that was deleted or moved away, and watch it again"""
+        file_info = self.honeypot_files[file_path]
+        try:
+            os.makedirs(os.path.dirname(file_path), exist_ok=True)
+            with open(file_path, 'w') as f:
+                f.write(file_info["content"])
+            file_info["mtime"] = os.path.getmtime(file_path)
+            
+            # Watch only after writing, so restoring raises no alert
+            if self.watcher is not None:
+                self.watcher.add_watch(file_path)
+            if self.process_index is not None:
+                self.process_index.watch(file_path)
+            return True
+        except Exception as e:
+            print(f"Error restoring honeypot file {file_path}: {e}")
+            return False
+    
+    def start_file_watcher(self):
+        """Watch decoy files for open/read/modify events (falls back to mtime polling)"""
+        if InotifyWatcher is None or not inotify_available():
+            print("⚠ inotify unavailable, honeypot files will be polled")
+            return
+        
+        try:
+            self.watcher = InotifyWatcher(self._on_honeypot_file_event)
+            for path in self.honeypot_files:
+                self.watcher.add_watch(path)
+            self.watcher.start()
+        except Exception as e:
+            print(f"Error starting honeypot file watcher: {e}")
+            self.watcher = None
+        
+        if self.process_index is not None:
+            self.process_index.start()
+    
+    def stop_file_watcher(self):
+        """Stop the honeypot file watcher"""
+        if self.watcher is not None:
+            self.watcher.stop()
+            self.watcher = None
+        if self.process_index is not None:
+            self.process_index.stop()
+    
+    def _on_honeypot_file_event(self, file_path: str, events: List[str]):
+        """Watcher thread callback: record access and queue an alert"""
+        file_info = self.honeypot_files.get(file_path)
+        if file_info is None:
+            return
         
-        decoy_contents = {
-            "passwords": "admin:Password123!\nroot:Root@2024!\ndbuser:Db$ecure888",
-            "credit_cards": "Fake credit card numbers for detection",
-            "secrets": "Confidential business information - decoy",
-            "config": '[database]\nhost=192.168.1.10\nuser=admin\npassword=Admin@123'
+        file_info["access_count"] += 1
+        file_info["last_accessed"] = datetime.now().isoformat()
+        
+        alert = {
+            "severity": "CRITICAL",
+            "type": "HONEYPOT_TRIGGERED",
+            "file": file_path,
+            "file_type": file_info["type"],
+            "events": events,
+            "timestamp": datetime.now().isoformat(),
+            "process_info": self.get_process_accessing_file(file_path),
+            "action": "Immediate isolation and threat response"
         }
+        try:
+            self.alert_queue.put_nowait(alert)
+        except queue.Full:
+            print("Warning: honeypot alert queue full, dropping alert")
         
-        for honey_type, path in honeypot_paths.items():
-            try:
-                os.makedirs(os.path.dirname(path), exist_ok=True)
-                with open(path, 'w') as f:
-                    f.write(decoy_contents.get(honey_type, "Decoy content"))
-                
-                self.honeypot_files[path] = {
-                    "type": honey_type,
-                    "created": datetime.now().isoformat(),
-                    "access_count": 0,
-                    "last_accessed": None
-                }
-            except Exception as e:
-                print(f"Error creating honeypot file {path}: {e}")
+        # A replaced decoy is re-watched by the watcher; a missing one is restored
+        if ("delete" in events or "move" in events) and not os.path.exists(file_path):
+            self.restore_honeypot_file(file_path)
     
     def monitor_honeypot_access(self) -> List[Dict]:
         """Monitor if honeypot files are accessed"""
         alerts = []
         
-        for file_path in self.honeypot_files.keys():
+        if self.watcher is not None:
+            # Event-driven: just drain what the watcher queued
+            while True:
+                try:
+                    alert = self.alert_queue.get_nowait()
+                except queue.Empty:
+                    break
+                alerts.append(alert)
+                self.alerts.append(alert)
+            return alerts
+        
+        for file_path, file_info in self.honeypot_files.items():
             try:
                 if os.path.exists(file_path):
-                    access_time = os.path.getmtime(file_path)
-                    current_time = time.time()
+                    modified_time = os.path.getmtime(file_path)
                     
-                    # If file was accessed recently
-                    if (current_time - access_time) < 60:  # Within last minute
+                    # Alert once per modification
+                    if modified_time != file_info["mtime"]:
+                        file_info["mtime"] = modified_time
                         self.honeypot_files[file_path]["access_count"] += 1
                         self.honeypot_files[file_path]["last_accessed"] = datetime.now().isoformat()
                         
@@ -475,12 +2260,15 @@ class HoneypotSystem:
                             "severity": "CRITICAL",
                             "type": "HONEYPOT_TRIGGERED",
                             "file": file_path,
+                            "file_type": file_info["type"],
                             "timestamp": datetime.now().isoformat(),
                             "process_info": self.get_process_accessing_file(file_path),
                             "action": "Immediate isolation and threat response"
                         }
                         alerts.append(alert)
                         self.alerts.append(alert)
+                else:
+                    self.restore_honeypot_file(file_path)
             except Exception as e:
                 print(f"Error monitoring honeypot: {e}")
         
@@ -488,6 +2276,16 @@ class HoneypotSystem:
     
     def get_process_accessing_file(self, file_path: str) -> Dict:
         """Identify which process is accessing the honeypot file"""
+        if self.process_index is not None:
+            # Answered from the /proc index, never forks
+            processes = self.process_index.lookup(file_path)
+            return {
+                "file": file_path,
+                "process": processes[0]["name"] if processes else "Unknown (file no longer open)",
+                "processes": processes,
+                "timestamp": datetime.now().isoformat()
+            }
+        
         try:
             # Use Windows API or system commands to identify process
             result = subprocess.run(
@@ -512,66 +2310,239 @@ class HoneypotSystem:
             {"port": 21, "service": "FTP", "banner": "220 FTP Server Ready"},
         ]
         
-        for service in fake_services:
-            self.create_listening_service(service)
+        if self.deception is not None and self._movement_thread is None:
+            self._movement_thread = threading.Thread(target=self._track_movements, daemon=True)
+            self._movement_thread.start()
+        
+        # One event loop thread serves every fake port
+        self.service_listener = FakeServiceListener(
+            self._on_service_connection,
+            backlog=self.listener_backlog,
+            read_timeout=self.listener_read_timeout
+        )
+        self.service_listener.start(fake_services)
     
-    def create_listening_service(self, service_config: Dict):
+    def create_listening_service(self, service_config: Dict) -> bool:
         """Create a honeypot service listening on specified port"""
+        return self.service_listener.add_service(service_config)
+    
+    def stop_fake_services(self):
+        """Close all fake service ports"""
+        if self.service_listener is not None:
+            self.service_listener.stop()
+        if self._movement_thread is not None:
+            self.movement_queue.put(None)
+            self._movement_thread.join(timeout=5)
+            self._movement_thread = None
+    
+    def _track_movements(self):
+        """Feed queued service connections to the deception tracker"""
+        while True:
+            item = self.movement_queue.get()
+            if item is None:
+                return
+            try:
+                self.deception.track_attacker_movement(*item)
+            except Exception as e:
+                print(f"Error tracking attacker movement: {e}")
+    
+    def _on_service_connection(self, connection: Dict):
+        """Listener callback: log a connection to a fake service"""
+        attacker_ip = connection["attacker_ip"]
+        scan_types, new_scan_types = self.scan_detector.record(
+            attacker_ip, connection["port"]
+        )
+        
+        alert = {
+            "severity": "HIGH",
+            "type": "HONEYPOT_SERVICE_ACCESS",
+            "scan_types": scan_types,
+            **connection
+        }
+        self.alerts.append(alert)
+        
+        for scan_type in new_scan_types:
+            self.alerts.append({
+                "severity": "HIGH",
+                "type": "SCAN_DETECTED",
+                "scan_type": scan_type,
+                "attacker_ip": attacker_ip,
+                "timestamp": connection["timestamp"]
+            })
+        
+        # Feed the deception tracker so attacker reports see this activity
+        if self.deception is not None:
+            if "port_scan" in scan_types or "slow_scan" in scan_types:
+                action = "port_scan"
+            elif "brute_force" in scan_types:
+                action = "credential_test"
+            elif connection["service"] == "RDP":
+                action = "rdp_attempt"
+            else:
+                action = "service_connect"
+            try:
+                self.movement_queue.put_nowait(
+                    (attacker_ip, f"{connection['service']}:{connection['port']}", action)
+                )
+            except queue.Full:
+                print("Warning: attacker movement queue full, dropping connection")
+
+
+class FakeServiceListener:
+    """
+    Serve any number of fake service ports from one asyncio event loop
+    
+    Each connection gets the service banner, then up to capture_bytes of
+    whatever the client sends first are captured (waiting at most
+    read_timeout seconds) and reported through on_connection.
+    """
+    
+    def __init__(self, on_connection: Callable[[Dict], None], host: str = '0.0.0.0',
+                 backlog: int = 1024, read_timeout: float = 5.0,
+                 capture_bytes: int = 1024, max_connections: int = 10000):
+        self.on_connection = on_connection
+        self.host = host
+        self.backlog = backlog
+        self.read_timeout = read_timeout
+        self.capture_bytes = capture_bytes
+        self.max_connections = max_connections
+        
+        self.servers = {}  # port -> asyncio server
+        self.connection_count = 0
+        self.loop = None
+        self._thread = None
+        self._ready = threading.Event()
+        self._slots = None
+    
+    def start(self, services: List[Dict]):
+        """Start the event loop thread and listen on the given services"""
+        self._thread = threading.Thread(target=self._run_loop, daemon=True)
+        self._thread.start()
+        self._ready.wait()
+        for service_config in services:
+            self.add_service(service_config)
+    
+    def _run_loop(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self._slots = asyncio.Semaphore(self.max_connections)
+        self.loop.call_soon(self._ready.set)
+        self.loop.run_forever()
+    
+    def add_service(self, service_config: Dict, timeout: float = 5.0) -> bool:
+        """Start listening on one more fake service port"""
+        future = asyncio.run_coroutine_threadsafe(
+            self._start_server(service_config), self.loop
+        )
         try:
-            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-            sock.bind(('0.0.0.0', service_config["port"]))
-            sock.listen(5)
-            
-            # Start listener in background thread
-            thread = threading.Thread(
-                target=self.service_listener,
-                args=(sock, service_config),
-                daemon=True
-            )
-            thread.start()
+            return future.result(timeout)
         except Exception as e:
             print(f"Error creating service on port {service_config['port']}: {e}")
+            return False
     
-    def service_listener(self, sock: socket.socket, service_config: Dict):
-        """Listen for connections to fake service"""
-        while True:
+    async def _start_server(self, service_config: Dict) -> bool:
+        async def handle(reader, writer):
+            await self._handle_connection(reader, writer, service_config)
+        
+        server = await asyncio.start_server(
+            handle, self.host, service_config["port"],
+            backlog=self.backlog, reuse_address=True
+        )
+        self.servers[service_config["port"]] = server
+        return True
+    
+    async def _handle_connection(self, reader: asyncio.StreamReader,
+                                 writer: asyncio.StreamWriter, service_config: Dict):
+        peer = writer.get_extra_info('peername') or ('unknown', 0)
+        first_bytes = b""
+        
+        async with self._slots:
             try:
-                client, addr = sock.accept()
-                
-                # Log connection attempt
-                alert = {
-                    "severity": "HIGH",
-                    "type": "HONEYPOT_SERVICE_ACCESS",
-                    "service": service_config["service"],
-                    "port": service_config["port"],
-                    "attacker_ip": addr[0],
-                    "timestamp": datetime.now().isoformat()
-                }
-                self.alerts.append(alert)
-                
-                # Send fake banner
-                client.send(service_config["banner"].encode() + b"\r\n")
-                client.close()
-            except Exception as e:
-                break
+                # Send fake banner, then capture what the client sends first
+                writer.write(service_config["banner"].encode() + b"\r\n")
+                await writer.drain()
+                first_bytes = await asyncio.wait_for(
+                    reader.read(self.capture_bytes), self.read_timeout
+                )
+            except (asyncio.TimeoutError, ConnectionError, OSError):
+                pass
+            finally:
+                writer.close()
+        
+        self.connection_count += 1
+        try:
+            self.on_connection({
+                "service": service_config["service"],
+                "port": service_config["port"],
+                "attacker_ip": peer[0],
+                "attacker_port": peer[1],
+                "banner_sent": service_config["banner"],
+                "first_bytes": first_bytes.hex(),
+                "timestamp": datetime.now().isoformat()
+            })
+        except Exception as e:
+            print(f"Error handling honeypot connection: {e}")
+    
+    def stop(self):
+        """Close all listening ports and stop the event loop"""
+        if self.loop is None:
+            return
+        
+        async def close_servers():
+            for server in self.servers.values():
+                server.close()
+            self.servers.clear()
+        
+        asyncio.run_coroutine_threadsafe(close_servers(), self.loop).result(5)
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join(timeout=5)
+        self.loop = None
 
 
 # ==================== MESH DEFENSE ====================
 
 class MeshDefenseNetwork:
-    """P2P mesh defense coordination between SmartAI devices"""
+    """
+    P2P mesh defense coordination between SmartAI devices
+
+    Online/high-alert device counts and per-threat votes are kept as
+    counters updated on every state change, so consensus checks and
+    collective defense never iterate over mesh_devices. With gossip
+    started, alerts, votes and alert-mode changes reach the other devices.
+    """
     
-    def __init__(self, db_handler: EncryptionHandler, device_id: str):
+    def __init__(self, db_handler: EncryptionHandler, device_id: str,
+                 consensus_ratio: float = 0.6, max_threats: int = 1000):
         self.db = db_handler
         self.device_id = device_id
+        self.consensus_ratio = consensus_ratio
+        self.max_threats = max_threats
         self.mesh_devices = {}
         self.threat_intelligence = deque(maxlen=1000)
         self.mesh_status = "initializing"
+        
+        # Incremental counters
+        self.online_count = 0
+        self.high_alert_count = 0  # peers reporting high alert mode
+        self.high_alert_mode = False  # collective defense on this mesh
+        self.threats_broadcast = 0
+        
+        # threat_id -> set of devices voting the threat valid, oldest first
+        self.threat_votes = OrderedDict()
+        self._lock = threading.RLock()
+        self.gossip = None
+        
         self.discover_mesh_devices()
     
     def discover_mesh_devices(self):
         """Auto-discover other SmartAI devices on network using mDNS"""
+        try:
+            from zeroconf import ServiceBrowser, Zeroconf, ServiceStateChange
+        except ImportError as e:
+            print(f"Warning: Optional library not installed: {e}")
+            self.mesh_status = "offline"
+            return
+        
         try:
             zeroconf = Zeroconf()
             
@@ -589,71 +2560,568 @@ class MeshDefenseNetwork:
             print(f"Error discovering mesh devices: {e}")
             self.mesh_status = "offline"
     
+    def start_gossip(self, port: int, key: bytes, peers: List[Tuple[str, int]] = (),
+                     host: str = "0.0.0.0") -> bool:
+        """
+        Start exchanging threat intelligence with peer devices
+        
+        Args:
+            key: Shared mesh key; packets not signed with it are dropped
+        """
+        if GossipNode is None:
+            print("⚠ Mesh gossip unavailable (mesh_gossip module missing)")
+            return False
+        if not key:
+            print("⚠ Mesh gossip needs a mesh key (SMARTAI_MESH_KEY), not started")
+            return False
+        
+        try:
+            self.gossip = GossipNode(self.device_id, key, host=host, port=port,
+                                     peers=peers, on_message=self.receive_intel)
+            self.gossip.start()
+            return True
+        except OSError as e:
+            print(f"Error starting mesh gossip on port {port}: {e}")
+            self.gossip = None
+            return False
+    
+    def stop_gossip(self):
+        """Stop exchanging threat intelligence"""
+        if self.gossip is not None:
+            self.gossip.stop()
+            self.gossip = None
+    
+    def _publish(self, message: Dict):
+        if self.gossip is not None:
+            self.gossip.publish(message)
+    
+    def receive_intel(self, message: Dict):
+        """Apply a message learned from another mesh device"""
+        source = message.get("source_device")
+        if not source or source == self.device_id:
+            return
+        
+        with self._lock:
+            if source not in self.mesh_devices:
+                self.add_mesh_device(source)
+            
+            msg_type = message.get("type")
+            if msg_type == "threat_alert":
+                self.threat_intelligence.append(message)
+                self.update_device_status(source, high_alert_mode=True)
+                self.record_vote(message.get("threat_id"), source)
+            elif msg_type == "threat_vote":
+                self.record_vote(message.get("threat_id"), source,
+                                 message.get("is_valid", True))
+            elif msg_type == "device_status":
+                self.update_device_status(source, status=message.get("status"),
+                                          high_alert_mode=message.get("high_alert_mode"))
+    
     def add_mesh_device(self, device_name: str):
         """Add discovered device to mesh network"""
-        self.mesh_devices[device_name] = {
-            "status": "online",
-            "last_seen": datetime.now().isoformat(),
-            "threat_alerts": 0,
-            "high_alert_mode": False
-        }
+        with self._lock:
+            if device_name in self.mesh_devices:
+                self.update_device_status(device_name, status="online")
+                return
+            
+            self.mesh_devices[device_name] = {
+                "status": "online",
+                "last_seen": datetime.now().isoformat(),
+                "alerts_base": self.threats_broadcast,
+                "high_alert_mode": False,
+                "votes": set()
+            }
+            self.online_count += 1
     
     def remove_mesh_device(self, device_name: str):
         """Remove device from mesh network"""
-        if device_name in self.mesh_devices:
-            del self.mesh_devices[device_name]
+        with self._lock:
+            device = self.mesh_devices.pop(device_name, None)
+            if device is None:
+                return
+            
+            if device["status"] == "online":
+                self.online_count -= 1
+            if device["high_alert_mode"]:
+                self.high_alert_count -= 1
+            for threat_id in device["votes"]:
+                voters = self.threat_votes.get(threat_id)
+                if voters is not None:
+                    voters.discard(device_name)
+    
+    def update_device_status(self, device_name: str, status: Optional[str] = None,
+                             high_alert_mode: Optional[bool] = None):
+        """Apply a status report from a mesh device"""
+        with self._lock:
+            device = self.mesh_devices.get(device_name)
+            if device is None:
+                return
+            
+            if status is not None and status != device["status"]:
+                if device["status"] == "online":
+                    self.online_count -= 1
+                elif status == "online":
+                    self.online_count += 1
+                device["status"] = status
+            
+            if high_alert_mode is not None and high_alert_mode != device["high_alert_mode"]:
+                self.high_alert_count += 1 if high_alert_mode else -1
+                device["high_alert_mode"] = high_alert_mode
+            
+            device["last_seen"] = datetime.now().isoformat()
+    
+    def get_device_status(self, device_name: str) -> Optional[Dict]:
+        """Get a mesh device's current state"""
+        with self._lock:
+            device = self.mesh_devices.get(device_name)
+            if device is None:
+                return None
+            return {
+                "status": device["status"],
+                "last_seen": device["last_seen"],
+                "threat_alerts": self.threats_broadcast - device["alerts_base"],
+                "high_alert_mode": self.high_alert_mode or device["high_alert_mode"],
+                "votes": len(device["votes"])
+            }
     
-    def broadcast_threat(self, threat_data: Dict):
-        """Broadcast threat to all mesh devices"""
+    def broadcast_threat(self, threat_data: Dict) -> str:
+        """Broadcast threat to all mesh devices, returning its threat ID"""
+        threat_id = threat_data.get("threat_id") or hashlib.sha256(
+            json.dumps(threat_data, sort_keys=True, default=str).encode()
+        ).hexdigest()[:16]
+        
         message = {
             "type": "threat_alert",
+            "threat_id": threat_id,
             "source_device": self.device_id,
             "threat": threat_data,
             "timestamp": datetime.now().isoformat(),
             "requires_vote": True
         }
         
-        # Store in local queue for all devices to receive
-        self.threat_intelligence.append(message)
+        with self._lock:
+            # Store in local queue for all devices to receive
+            self.threat_intelligence.append(message)
+            
+            # Every device's alert count is threats_broadcast - alerts_base
+            self.threats_broadcast += 1
+            self.high_alert_mode = True
+            
+            # The reporting device votes for its own threat
+            self.record_vote(threat_id, self.device_id)
         
-        # Activate high alert on all devices
-        for device in self.mesh_devices.values():
-            device["high_alert_mode"] = True
-            device["threat_alerts"] += 1
+        self._publish(message)
+        return threat_id
+    
+    def vote_on_threat(self, threat_id: str, is_valid: bool = True):
+        """Cast this device's vote on a threat and share it with the mesh"""
+        self.record_vote(threat_id, self.device_id, is_valid)
+        self._publish({
+            "type": "threat_vote",
+            "threat_id": threat_id,
+            "source_device": self.device_id,
+            "is_valid": is_valid,
+            "timestamp": datetime.now().isoformat()
+        })
+    
+    def record_vote(self, threat_id: str, device_name: str, is_valid: bool = True):
+        """Record a device's vote on a threat (only 'valid' votes are counted)"""
+        with self._lock:
+            if device_name != self.device_id and device_name not in self.mesh_devices:
+                return
+            
+            voters = self.threat_votes.get(threat_id)
+            if voters is None:
+                if not is_valid:
+                    return
+                voters = self.threat_votes[threat_id] = set()
+                if len(self.threat_votes) > self.max_threats:
+                    self._forget_threat(next(iter(self.threat_votes)))
+            
+            device = self.mesh_devices.get(device_name)
+            if is_valid:
+                voters.add(device_name)
+                if device is not None:
+                    device["votes"].add(threat_id)
+            else:
+                voters.discard(device_name)
+                if device is not None:
+                    device["votes"].discard(threat_id)
+    
+    def _forget_threat(self, threat_id: str):
+        for device_name in self.threat_votes.pop(threat_id, ()):
+            device = self.mesh_devices.get(device_name)
+            if device is not None:
+                device["votes"].discard(threat_id)
     
     def consensus_check(self, threat_id: str) -> Tuple[bool, float]:
         """
         Devices vote on threat validity to reduce false positives
         Returns: (is_valid_threat, confidence_score)
         """
-        votes_yes = 0
-        total_devices = len(self.mesh_devices) + 1  # Include this device
-        
-        for device in self.mesh_devices.values():
-            if device["high_alert_mode"]:
-                votes_yes += 1
-        
-        if total_devices == 0:
-            return False, 0.0
+        with self._lock:
+            # Devices that went offline after voting keep their vote
+            total_devices = self.online_count + 1  # Include this device
+            votes_yes = min(len(self.threat_votes.get(threat_id, ())), total_devices)
         
         confidence = (votes_yes / total_devices) * 100
-        is_valid = votes_yes >= (total_devices * 0.6)  # 60% consensus required
+        is_valid = votes_yes >= (total_devices * self.consensus_ratio)  # 60% consensus required
         
         return is_valid, confidence
     
     def activate_collective_defense(self):
         """When under attack, coordinate collective defense"""
-        for device in self.mesh_devices.values():
-            device["high_alert_mode"] = True
+        self._set_high_alert_mode(True)
     
     def deactivate_collective_defense(self):
         """When threat cleared, stand down collective defense"""
-        threat_count = sum(1 for d in self.mesh_devices.values() 
-                          if d["high_alert_mode"])
+        # Stay alert while any peer still reports high alert mode
+        if self.high_alert_count == 0:
+            self._set_high_alert_mode(False)
+    
+    def _set_high_alert_mode(self, enabled: bool):
+        if self.high_alert_mode == enabled:
+            return
+        self.high_alert_mode = enabled
+        self._publish({
+            "type": "device_status",
+            "source_device": self.device_id,
+            "status": "online",
+            "high_alert_mode": enabled,
+            "timestamp": datetime.now().isoformat()
+        })
+
+
+# ==================== PROCESSING PIPELINE ====================
+
+class ProcessingPipeline:
+    """
+    Stages connected by bounded queues, each served by its own worker threads
+    
+    Every stage function takes a batch (list) of items and returns the items
+    to pass on; workers grab up to max_batch queued items at once. Full queues
+    block the stage before them, so a slow stage applies backpressure all the
+    way to submit(). Throughput is set by the slowest stage instead of the sum
+    of all stages.
+    """
+    
+    def __init__(self, stages: List[Tuple[str, Callable[[List], List], int]],
+                 queue_size: int = 1024, max_batch: int = 64,
+                 on_output: Optional[Callable[[object], None]] = None):
+        """
+        Args:
+            stages: (name, function, worker count) in processing order; stages
+                holding per-device state should use one worker to keep order
+            queue_size: Capacity of the queue in front of each stage
+            max_batch: Most items a worker takes from its queue at once
+            on_output: Called with every item leaving the last stage
+        """
+        self.stages = stages
+        self.max_batch = max_batch
+        self.on_output = on_output
+        self.queues = [queue.Queue(maxsize=queue_size) for _ in stages]
+        self.stats = {name: {"processed": 0, "errors": 0} for name, _, _ in stages}
+        self.dropped = 0
+        self._stats_lock = threading.Lock()
+        self._threads = []
+        self._running = False
+    
+    def start(self):
+        """Start the stage workers"""
+        if self._running:
+            return
+        self._running = True
+        for index, (name, _, workers) in enumerate(self.stages):
+            for n in range(workers):
+                thread = threading.Thread(target=self._worker, args=(index,),
+                                          name=f"pipeline-{name}-{n}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+    
+    def submit(self, item, block: bool = True, timeout: Optional[float] = None) -> bool:
+        """Feed an item into the first stage; False if it was dropped (queue full)"""
+        try:
+            self.queues[0].put(item, block=block, timeout=timeout)
+            return True
+        except queue.Full:
+            with self._stats_lock:
+                self.dropped += 1
+            return False
+    
+    def stop(self, drain: bool = True):
+        """Stop the workers, first letting queued items finish if drain"""
+        if drain and self._running:
+            for q in self.queues:
+                q.join()
+        self._running = False
+        for thread in self._threads:
+            thread.join(timeout=2)
+        self._threads = []
+    
+    def queue_depths(self) -> Dict[str, int]:
+        """Items waiting in front of each stage"""
+        return {name: q.qsize() for (name, _, _), q in zip(self.stages, self.queues)}
+    
+    def _worker(self, index: int):
+        name, function, _ = self.stages[index]
+        inbox = self.queues[index]
+        outbox = self.queues[index + 1] if index + 1 < len(self.queues) else None
+        
+        while self._running:
+            try:
+                batch = [inbox.get(timeout=0.5)]
+            except queue.Empty:
+                continue
+            while len(batch) < self.max_batch:
+                try:
+                    batch.append(inbox.get_nowait())
+                except queue.Empty:
+                    break
+            
+            try:
+                results = function(batch)
+                with self._stats_lock:
+                    self.stats[name]["processed"] += len(batch)
+                for item in results:
+                    if outbox is not None:
+                        outbox.put(item)
+                    elif self.on_output is not None:
+                        self.on_output(item)
+            except Exception as e:
+                with self._stats_lock:
+                    self.stats[name]["errors"] += 1
+                METRICS.increment("errors")
+                print(f"Error in pipeline stage {name}: {e}")
+                traceback.print_exc()
+            finally:
+                for _ in batch:
+                    inbox.task_done()
+
+
+def extract_features(items: List[Dict]) -> List[Dict]:
+    """Update each item's profiler baseline and attach its feature vector"""
+    clock = time.perf_counter
+    for item in items:
+        profiler = item["profiler"]
+        t0 = clock()
+        features = profiler.build_feature_vector(item["system_data"])
+        t1 = clock()
+        profiler.update_baseline(item["system_data"], features)
+        t2 = clock()
+        item["detector"].add_training_data(features)
+        t3 = clock()
+        item["features"] = features
+        
+        METRICS.observe("feature_extraction", t1 - t0)
+        METRICS.observe("baseline_update", t2 - t1)
+        METRICS.observe("training", t3 - t2)
+    return items
+
+
+def score_items(items: List[Dict]) -> List[Dict]:
+    """Detect anomalies (one model pass per detector) and attach risk scores"""
+    by_detector = defaultdict(list)
+    for item in items:
+        by_detector[id(item["detector"])].append(item)
+    
+    for group in by_detector.values():
+        detector = group[0]["detector"]
+        with METRICS.timer("scoring"):
+            is_anomaly, anomaly_scores = detector.detect_anomalies(
+                np.array([item["features"] for item in group])
+            )
+        METRICS.increment("anomalies", int(np.count_nonzero(is_anomaly)))
+        for item, anomalous, anomaly_score in zip(group, is_anomaly, anomaly_scores):
+            item["is_anomaly"] = bool(anomalous)
+            item["anomaly_score"] = float(anomaly_score)
+            item["risk_score"] = detector.calculate_risk_score(
+                item["anomaly_score"],
+                detection_count=1 if anomalous else 0,
+                severity=0.8 if anomalous else 0.3
+            )
+            item["baseline_complete"] = item["profiler"].is_learning_complete()
+    return items
+
+
+# ==================== SHARDED ANALYSIS ====================
+
+SHARD_RESULT_KEYS = ("is_anomaly", "anomaly_score", "risk_score", "baseline_complete")
+
+
+def shard_for_device(device_id: str, n_shards: int) -> int:
+    """Stable device -> shard mapping (same in every process and run)"""
+    return zlib.crc32(str(device_id).encode()) % n_shards
+
+
+def _shard_worker(shard_index: int, inbox, outbox, key: str, engine: str, db_path: str):
+    """Worker process: owns the profiler/detector state of its devices"""
+    # Ctrl-C goes to the controller, which stops the shards in order
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    crypto = EncryptionHandler(key)
+    # Shard processes are daemonic: fit single-threaded, one process per core already
+    registry = DeviceModelRegistry(crypto, DeviceStateStore(crypto, db_path=db_path),
+                                   engine=engine, n_jobs=1)
+    
+    while True:
+        message = inbox.get()
+        if message is None:
+            break
+        command, request_id, payload = message
+        try:
+            if command == "analyze":
+                items = [
+                    {"system_data": system_data, "index": index}
+                    for index, system_data in payload
+                ]
+                for item in items:
+                    item["profiler"], item["detector"] = registry.get(item["system_data"]["device_id"])
+                score_items(extract_features(items))
+                result = [
+                    (item["index"], {k: item[k] for k in SHARD_RESULT_KEYS})
+                    for item in items
+                ]
+            elif command == "flush":
+                result = registry.flush()
+            elif command == "metrics":
+                result = METRICS.snapshot()
+            else:
+                raise ValueError(f"Unknown shard command: {command}")
+            outbox.put((request_id, shard_index, result, None))
+        except Exception as e:
+            outbox.put((request_id, shard_index, None, str(e)))
+    
+    registry.flush()
+    registry.stop()
+
+
+class ShardedAnalyzer:
+    """
+    Analyze device telemetry in a pool of worker processes
+    
+    Each device ID hashes to one of n_shards processes, which keeps that
+    device's profiler/detector (and its own device state file), so feature
+    extraction and scoring for different devices use separate cores.
+    """
+    
+    def __init__(self, key: str, n_shards: Optional[int] = None,
+                 engine: str = "isolation_forest", timeout: float = 60.0):
+        self.key = key
+        self.n_shards = n_shards or os.cpu_count() or 1
+        self.engine = engine
+        self.timeout = timeout
+        self.processes = []
+        self.inboxes = []
+        self.outbox = None
+        
+        self._next_request = 0
+        self._pending = {}  # request_id -> [parts still expected, results, error]
+        self._lock = threading.Lock()
+        self._done = threading.Condition(self._lock)
+        self._collector = None
+    
+    def start(self):
+        """Start the worker processes and the result collector"""
+        if self.processes:
+            return
+        # spawn: the controller already runs threads, which fork() would not copy safely
+        context = multiprocessing.get_context("spawn")
+        self.outbox = context.Queue()
+        for shard_index in range(self.n_shards):
+            inbox = context.Queue()
+            db_path = os.path.join(DATA_DIR, f"device_models_shard{shard_index}.db")
+            process = context.Process(
+                target=_shard_worker,
+                args=(shard_index, inbox, self.outbox, self.key, self.engine, db_path),
+                daemon=True
+            )
+            process.start()
+            self.inboxes.append(inbox)
+            self.processes.append(process)
+        
+        self._collector = threading.Thread(target=self._collect, daemon=True)
+        self._collector.start()
+    
+    def _collect(self):
+        while True:
+            message = self.outbox.get()
+            if message is None:
+                break
+            request_id, _, result, error = message
+            with self._done:
+                pending = self._pending.get(request_id)
+                if pending is None:
+                    continue
+                pending[0] -= 1
+                if error is not None:
+                    pending[2] = error
+                elif isinstance(result, list):
+                    pending[1].extend(result)
+                else:
+                    pending[1].append(result)
+                self._done.notify_all()
+    
+    def _request(self, parts: Dict[int, object], command: str) -> List:
+        with self._lock:
+            request_id = self._next_request
+            self._next_request += 1
+            self._pending[request_id] = [len(parts), [], None]
         
-        if threat_count == 0:
-            for device in self.mesh_devices.values():
-                device["high_alert_mode"] = False
+        for shard_index, payload in parts.items():
+            self.inboxes[shard_index].put((command, request_id, payload))
+        
+        with self._done:
+            finished = self._done.wait_for(lambda: self._pending[request_id][0] == 0,
+                                           timeout=self.timeout)
+            _, results, error = self._pending.pop(request_id)
+        if not finished:
+            raise TimeoutError(f"Shard {command} request timed out")
+        if error is not None:
+            raise RuntimeError(f"Shard {command} failed: {error}")
+        return results
+    
+    def analyze(self, samples: List[Dict]) -> List[Dict]:
+        """
+        Analyze device-tagged samples on their shards (thread-safe)
+        
+        Returns:
+            One dict per sample, in order, with is_anomaly, anomaly_score,
+            risk_score and baseline_complete
+        """
+        if not samples:
+            return []
+        parts = defaultdict(list)
+        for index, system_data in enumerate(samples):
+            parts[shard_for_device(system_data["device_id"], self.n_shards)].append(
+                (index, system_data))
+        
+        results = [None] * len(samples)
+        for index, result in self._request(parts, "analyze"):
+            results[index] = result
+        return results
+    
+    def flush(self) -> bool:
+        """Save every shard's device models"""
+        if not self.processes:
+            return True
+        return all(self._request({i: None for i in range(self.n_shards)}, "flush"))
+    
+    def metrics(self) -> List[Dict]:
+        """Metrics snapshot of every shard process"""
+        if not self.processes:
+            return []
+        return self._request({i: None for i in range(self.n_shards)}, "metrics")
+    
+    def stop(self):
+        """Save state and shut the worker processes down"""
+        for inbox in self.inboxes:
+            inbox.put(None)
+        for process in self.processes:
+            process.join(timeout=30)
+        if self.outbox is not None:
+            self.outbox.put(None)
+            self._collector.join(timeout=5)
+        self.processes = []
+        self.inboxes = []
 
 
 # ==================== MAIN AI CONTROLLER ====================
@@ -662,95 +3130,377 @@ class SmartAIController:
     """Main AI orchestrator coordinating all modules"""
     
     def __init__(self):
+        init_start = time.perf_counter()
         self.running = True
         self.iteration_count = 0
+        self.startup_timings = {"imports": IMPORT_SECONDS * 1000}  # ms per step
         
         # Initialize encryption
         self.crypto = EncryptionHandler("smartai_temp_key_2024")
         
         # Initialize all modules
         self.profiler = BehaviorProfiler(self.crypto)
-        self.detector = AnomalyDetector()
-        self.deception = DeceptionNetworkMapper(self.crypto)
-        self.honeypot = HoneypotSystem(self.crypto)
-        self.mesh = MeshDefenseNetwork(self.crypto, "smartai_device_001")
+        self.detector = AnomalyDetector(
+            engine=os.getenv('SMARTAI_ANOMALY_ENGINE', 'isolation_forest')
+        )
+        self.model_store = ModelStore(self.crypto)
+        self.checkpoint_interval_seconds = 900
+        self.last_checkpoint_time = time.time()
+        
+        # Warm start from saved models runs in the background (unpickling a
+        # forest imports scikit-learn); samples wait in the pipeline until done
+        self.models_ready = threading.Event()
+        threading.Thread(target=self._restore_in_background, name="smartai-restore",
+                         daemon=True).start()
+        
+        # Independent subsystems start in parallel: network discovery and
+        # honeypot files, and mDNS/gossip
+        with ThreadPoolExecutor(max_workers=2, thread_name_prefix="smartai-init") as pool:
+            tasks = [
+                pool.submit(self._init_network_defense),
+                pool.submit(self._timed, "mesh", self._init_mesh),
+            ]
+            for task in tasks:
+                task.result()  # re-raise initialization errors
+        
+        # Per-device models for telemetry tagged with a device_id
+        self.registry = DeviceModelRegistry(
+            self.crypto, DeviceStateStore(self.crypto), engine=self.detector.engine
+        )
+        
+        # Optional process pool for device-tagged telemetry (SMARTAI_SHARDS workers)
+        self.shards = None
+        n_shards = int(os.getenv('SMARTAI_SHARDS', '0'))
+        if n_shards > 0:
+            self.shards = ShardedAnalyzer(self.crypto.key, n_shards, engine=self.detector.engine)
+            self.shards.start()
+        
+        # Staged pipeline for samples from any number of sources; stages that
+        # update per-device baselines keep a single worker to preserve order
+        # (scoring too with shards, which train on the samples they score)
+        self.response_handlers = []
+        self.last_response = None
+        self.pipeline = ProcessingPipeline(
+            [
+                ("ingest", self._stage_ingest, 1),
+                ("features", self._stage_features, 1),
+                ("scoring", self._stage_scoring, 1 if self.shards is not None else 2),
+                ("honeypot", self._stage_honeypot, 1),
+                ("response", self._stage_response, 1),
+            ],
+            queue_size=int(os.getenv('SMARTAI_PIPELINE_QUEUE_SIZE', '1024')),
+            on_output=self._on_response
+        )
+        
+        self.startup_timings["total"] = (time.perf_counter() - init_start) * 1000
+        steps = ", ".join(f"{name} {ms:.0f} ms" for name, ms in self.startup_timings.items()
+                          if name != "total")
+        if not self.models_ready.is_set():
+            steps += ", model restore continuing in background"
+        print(f"[SmartAI AI Module] All systems initialized in "
+              f"{self.startup_timings['total']:.0f} ms ({steps})")
+    
+    def _timed(self, name: str, function: Callable):
+        """Run an initialization step and record its duration"""
+        start = time.perf_counter()
+        try:
+            return function()
+        finally:
+            self.startup_timings[name] = (time.perf_counter() - start) * 1000
+    
+    def _restore_in_background(self):
+        try:
+            self._timed("restore_models", self.restore_models)
+        except Exception as e:
+            print(f"Error restoring models: {e}")
+        finally:
+            self.models_ready.set()
+    
+    def _init_network_defense(self):
+        """Deception mapper, then the honeypots and packet capture that use it"""
+        self.deception = self._timed("deception", lambda: DeceptionNetworkMapper(self.crypto))
+        self.honeypot = self._timed(
+            "honeypot", lambda: HoneypotSystem(self.crypto, deception=self.deception))
+        
+        # Network features from packet capture (interface or pcap replay)
+        self.flow_aggregator = self._timed("flow_capture", self.start_flow_capture)
+    
+    def _init_mesh(self):
+        self.mesh = MeshDefenseNetwork(self.crypto, os.getenv('SMARTAI_DEVICE_ID', 'smartai_device_001'))
+        mesh_port = os.getenv('SMARTAI_MESH_PORT')
+        if mesh_port:
+            peers = parse_peers(os.getenv('SMARTAI_MESH_PEERS', '')) if GossipNode is not None else []
+            mesh_key = os.getenv('SMARTAI_MESH_KEY', '').encode()
+            self.mesh.start_gossip(int(mesh_port), mesh_key, peers)
+    
+    def start_flow_capture(self):
+        """Start packet capture if SMARTAI_CAPTURE_INTERFACE or SMARTAI_CAPTURE_PCAP is set"""
+        interface = os.getenv('SMARTAI_CAPTURE_INTERFACE')
+        pcap_path = os.getenv('SMARTAI_CAPTURE_PCAP')
+        if not interface and not pcap_path:
+            return None
+        if FlowAggregator is None:
+            print("⚠ Flow aggregation unavailable (flow_aggregator module missing)")
+            return None
+        
+        local_ips = [
+            address['addr']
+            for addresses in self.deception.real_network.values()
+            for address in addresses if 'addr' in address
+        ]
+        try:
+            aggregator = FlowAggregator(local_ips=local_ips)
+            if interface:
+                aggregator.start_live(interface)
+            else:
+                aggregator.start_pcap(pcap_path)
+            return aggregator
+        except Exception as e:
+            print(f"Error starting packet capture: {e}")
+            return None
+    
+    def restore_models(self) -> bool:
+        """Load saved detector and profiler state, if any"""
+        start = time.perf_counter()
+        states = self.model_store.load_states(["detector", "profiler"])
         
-        print("[SmartAI AI Module] All systems initialized")
+        if "detector" in states:
+            self.detector.load_state(states["detector"])
+        if "profiler" in states:
+            self.profiler.load_state(states["profiler"])
+        
+        if states:
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            print(f"[SmartAI AI Module] Restored {', '.join(states)} in {elapsed_ms:.1f} ms")
+        return bool(states)
+    
+    def save_models(self) -> bool:
+        """Checkpoint detector and profiler state to the encrypted store"""
+        self.models_ready.wait()  # never overwrite a snapshot still being restored
+        self.last_checkpoint_time = time.time()
+        saved = self.model_store.save_states({
+            "detector": self.detector.get_state(),
+            "profiler": self.profiler.get_state()
+        })
+        if self.shards is not None:
+            saved = self.shards.flush() and saved
+        return self.registry.flush() and saved
     
     def process_system_data(self, system_data: Dict) -> Dict:
         """Process system data and generate threat assessment"""
         try:
+            batch = [{"system_data": system_data, "source": "direct",
+                      "received": time.perf_counter()}]
+            for _, stage, _ in self.pipeline.stages:
+                batch = stage(batch)
+            return batch[0]
+        
+        except Exception as e:
+            METRICS.increment("errors")
+            print(f"Error processing system data: {e}")
+            traceback.print_exc()
+            return {"error": str(e)}
+    
+    # ---------- pipeline ----------
+    
+    def start_pipeline(self):
+        """Start the stage workers"""
+        self.pipeline.start()
+    
+    def submit(self, system_data: Dict, source: str = "local", block: bool = True) -> bool:
+        """Queue a sample for pipelined processing (thread-safe)"""
+        self.pipeline.start()
+        return self.pipeline.submit({"system_data": system_data, "source": source,
+                                     "received": time.perf_counter()}, block=block)
+    
+    def attach_source(self, name: str, samples: Iterable[Dict]) -> threading.Thread:
+        """Feed every sample of an iterable into the pipeline from its own thread"""
+        def feed():
+            for system_data in samples:
+                if not self.running:
+                    break
+                self.submit(system_data, source=name)
+        
+        thread = threading.Thread(target=feed, name=f"source-{name}", daemon=True)
+        thread.start()
+        return thread
+    
+    def add_response_handler(self, handler: Callable[[Dict], None]):
+        """Call handler(response) for every assessment leaving the pipeline"""
+        self.response_handlers.append(handler)
+    
+    def _on_response(self, response: Dict):
+        self.last_response = response
+        for handler in self.response_handlers:
+            try:
+                handler(response)
+            except Exception as e:
+                print(f"Error in response handler: {e}")
+    
+    def _stage_ingest(self, batch: List[Dict]) -> List[Dict]:
+        """Route each sample to its device's profiler/detector"""
+        self.models_ready.wait()
+        flow_features = None
+        if self.flow_aggregator is not None:
+            # Measured traffic replaces the placeholder network metrics
+            flow_features = self.flow_aggregator.get_features()
+            flow_features.pop('window_start', None)
+        
+        METRICS.increment("samples", len(batch))
+        for item in batch:
             self.iteration_count += 1
+            system_data = item["system_data"]
             
-            # Step 1: Update behavior baseline
-            self.profiler.update_baseline(system_data)
-            
-            # Step 2: Extract features and detect anomalies
-            features = self.profiler.build_feature_vector(system_data)
-            self.detector.add_training_data(features)
-            
-            is_anomaly, anomaly_score = self.detector.detect_anomaly(features)
-            
-            # Step 3: Calculate risk score
-            risk_score = self.detector.calculate_risk_score(
-                anomaly_score,
-                detection_count=1 if is_anomaly else 0,
-                severity=0.8 if is_anomaly else 0.3
-            )
-            
-            # Step 4: Monitor honeypot files
-            honeypot_alerts = self.honeypot.monitor_honeypot_access()
-            
-            # Step 5: Generate response
-            response = {
+            # Telemetry from other endpoints gets its own baseline and model,
+            # in a shard process when sharding is enabled
+            device_id = system_data.get('device_id')
+            item["sharded"] = False
+            if device_id is None:
+                item["profiler"], item["detector"] = self.profiler, self.detector
+                if flow_features:
+                    item["system_data"] = {**system_data, **flow_features}
+            elif self.shards is not None:
+                item["sharded"] = True
+            else:
+                item["profiler"], item["detector"] = self.registry.get(device_id)
+            item["device_id"] = device_id
+        return batch
+    
+    def _stage_features(self, batch: List[Dict]) -> List[Dict]:
+        """Update behavior baselines and extract feature vectors"""
+        extract_features([item for item in batch if not item["sharded"]])
+        return batch
+    
+    def _stage_scoring(self, batch: List[Dict]) -> List[Dict]:
+        """Detect anomalies and score risk, locally or on the device shards"""
+        score_items([item for item in batch if not item["sharded"]])
+        
+        sharded = [item for item in batch if item["sharded"]]
+        if sharded:
+            with METRICS.timer("shard_analysis"):
+                results = self.shards.analyze([item["system_data"] for item in sharded])
+            for item, result in zip(sharded, results):
+                item.update(result)
+        return batch
+    
+    def _stage_honeypot(self, batch: List[Dict]) -> List[Dict]:
+        """Collect honeypot alerts raised since the previous batch"""
+        with METRICS.timer("honeypot_check"):
+            alerts = self.honeypot.monitor_honeypot_access()
+        METRICS.increment("honeypot_alerts", len(alerts))
+        for item in batch:
+            item["honeypot_alerts"] = alerts
+            alerts = []  # report each alert once
+        return batch
+    
+    def _stage_response(self, batch: List[Dict]) -> List[Dict]:
+        """Build assessments and trigger collective defense if needed"""
+        responses = []
+        for item in batch:
+            risk_score = item["risk_score"]
+            responses.append({
                 "type": "ai_assessment",
+                "device_id": item["device_id"],
                 "risk_score": risk_score,
-                "is_anomaly": is_anomaly,
-                "anomaly_score": anomaly_score,
+                "is_anomaly": item["is_anomaly"],
+                "anomaly_score": item["anomaly_score"],
                 "timestamp": datetime.now().isoformat(),
-                "baseline_complete": self.profiler.is_learning_complete(),
-                "honeypot_alerts": honeypot_alerts,
-                "mesh_devices_online": len(self.mesh.mesh_devices),
+                "baseline_complete": item["baseline_complete"],
+                "honeypot_alerts": item["honeypot_alerts"],
+                "mesh_devices_online": self.mesh.online_count,
                 "mesh_status": self.mesh.mesh_status
-            }
+            })
             
-            # Step 6: Trigger collective defense if needed
+            start = time.perf_counter()
             if risk_score > 70:
                 self.mesh.activate_collective_defense()
             elif risk_score < 30:
                 self.mesh.deactivate_collective_defense()
-            
-            return response
+            now = time.perf_counter()
+            METRICS.observe("mesh_decision", now - start)
+            if "received" in item:
+                METRICS.observe("end_to_end", now - item["received"])
+        return responses
+    
+    def get_metrics(self, fmt: str = "dict"):
+        """
+        Stage latency histograms and counters, including shard processes
         
-        except Exception as e:
-            print(f"Error processing system data: {e}")
-            traceback.print_exc()
-            return {"error": str(e)}
+        Args:
+            fmt: "dict" for a snapshot dict, "text" for Prometheus text format
+        """
+        metrics = METRICS
+        if self.shards is not None:
+            metrics = MetricsRegistry()
+            metrics.merge(METRICS.snapshot())
+            for snapshot in self.shards.metrics():
+                metrics.merge(snapshot)
+        
+        snapshot = metrics.snapshot()
+        snapshot["counters"]["iterations"] = self.iteration_count
+        snapshot["pipeline"] = {
+            "queue_depths": self.pipeline.queue_depths(),
+            "dropped": self.pipeline.dropped
+        }
+        if fmt == "text":
+            return metrics.to_text()
+        return snapshot
+    
+    def simulated_source(self, interval: float = 5.0) -> Iterator[Dict]:
+        """Simulated system data every interval seconds (in production, from C++)"""
+        while self.running:
+            yield self.generate_simulated_system_data()
+            time.sleep(interval)
     
     def run(self):
         """Main event loop"""
         print("[SmartAI AI Module] Starting event loop...")
         
+        self.start_pipeline()
+        sample_interval = float(os.getenv('SMARTAI_SAMPLE_INTERVAL', '5'))
+        self.attach_source("simulated", self.simulated_source(sample_interval))
+        
+        # Optional text metrics dump for scraping (e.g. node_exporter textfile)
+        metrics_file = os.getenv('SMARTAI_METRICS_FILE')
+        last_metrics_time = 0.0
+        
         while self.running:
             try:
-                # Simulated system data (in production, receive from C++)
-                system_data = self.generate_simulated_system_data()
+                time.sleep(1)
                 
-                # Process and analyze
-                response = self.process_system_data(system_data)
+                if time.time() - self.last_checkpoint_time >= self.checkpoint_interval_seconds:
+                    self.save_models()
                 
-                # Print response for testing
-                # print(f"[AI] Risk Score: {response.get('risk_score', 0):.1f}")
-                
-                time.sleep(5)  # Process every 5 seconds
+                if metrics_file and time.time() - last_metrics_time >= 60:
+                    last_metrics_time = time.time()
+                    with open(metrics_file + ".tmp", "w") as f:
+                        f.write(self.get_metrics("text"))
+                    os.replace(metrics_file + ".tmp", metrics_file)
             
             except KeyboardInterrupt:
                 print("[SmartAI AI Module] Shutting down...")
-                self.running = False
+                self.shutdown()
             except Exception as e:
                 print(f"Error in event loop: {e}")
                 traceback.print_exc()
     
+    def shutdown(self):
+        """Stop all workers and services, then save models"""
+        self.running = False
+        self.pipeline.stop()
+        if self.shards is not None:
+            self.shards.stop()
+        self.detector.stop()
+        self.registry.stop()
+        self.honeypot.stop_file_watcher()
+        self.honeypot.stop_fake_services()
+        self.honeypot.alerts.close()
+        self.deception.attacker_tracking.close()
+        if self.flow_aggregator is not None:
+            self.flow_aggregator.stop()
+        self.mesh.stop_gossip()
+        self.save_models()
+    
     def generate_simulated_system_data(self) -> Dict:
         """Generate simulated system data for testing"""
         import random
@@ -32,6 +32,13 @@ except ImportError:
     print("[Python] WARNING: database_encryption module not found. Database encryption disabled.")
     DatabaseEncryption = None
 
+# Binary SYSTEM_DATA framing (needs numpy); base64 JSON is used without it
+try:
+    import binary_protocol
+except ImportError:
+    print("[Python] WARNING: binary_protocol unavailable (numpy needed). Using JSON messages only.")
+    binary_protocol = None
+
 # ==================== LOGGING SETUP ====================
 
 logging.basicConfig(
@@ -380,21 +387,112 @@ class MeshDefenseCoordinator:
 
 # ==================== WEBSOCKET SERVER ====================
 
+OVERFLOW_POLICIES = ('drop_oldest', 'coalesce', 'disconnect')
+
+class ClientConnection:
+    """
+    Outgoing side of one client connection
+    
+    Messages are queued without waiting and sent by a dedicated writer task,
+    so a slow client only delays itself. When the queue is full the overflow
+    policy decides: drop_oldest discards the oldest queued message, coalesce
+    replaces everything queued with the newest message, disconnect closes
+    the connection.
+    """
+    
+    def __init__(self, websocket, queue_size: int = 64, overflow_policy: str = 'drop_oldest'):
+        if overflow_policy not in OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown overflow policy: {overflow_policy}")
+        
+        self.websocket = websocket
+        self.queue_size = max(1, queue_size)
+        self.overflow_policy = overflow_policy
+        self.format = 'json'  # negotiated via HELLO
+        self.queue = deque()
+        self.stats = {'sent': 0, 'dropped': 0, 'coalesced': 0}
+        self.closed = False
+        self._ready = asyncio.Event()
+        self._writer = asyncio.ensure_future(self._write_loop())
+    
+    def enqueue(self, message) -> bool:
+        """Queue a message for sending; returns False if the client was dropped"""
+        if self.closed:
+            return False
+        
+        if len(self.queue) >= self.queue_size:
+            if self.overflow_policy == 'drop_oldest':
+                self.queue.popleft()
+                self.stats['dropped'] += 1
+            elif self.overflow_policy == 'coalesce':
+                self.stats['coalesced'] += len(self.queue)
+                self.queue.clear()
+            else:
+                logger.warning(f"Client send queue full ({self.queue_size}), disconnecting")
+                self.close()
+                return False
+        
+        self.queue.append(message)
+        self._ready.set()
+        return True
+    
+    def close(self):
+        """Stop the writer and close the socket without waiting for either"""
+        if self.closed:
+            return
+        self.closed = True
+        self.queue.clear()
+        self._writer.cancel()
+        close = getattr(self.websocket, 'close', None)
+        if close is not None:
+            asyncio.ensure_future(close())
+    
+    async def _write_loop(self):
+        try:
+            while True:
+                await self._ready.wait()
+                while self.queue:
+                    await self.websocket.send(self.queue.popleft())
+                    self.stats['sent'] += 1
+                self._ready.clear()
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            logger.error(f"Send to client failed: {e}")
+            self.close()
+
 class AIWebSocketServer:
     """WebSocket server for Electron communication"""
     
-    def __init__(self, encryption: EncryptionHandler, analyzer: BehaviorAnalyzer):
+    def __init__(self, encryption: EncryptionHandler, analyzer: BehaviorAnalyzer,
+                 send_queue_size: int = 64, overflow_policy: str = 'drop_oldest'):
+        if overflow_policy not in OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown overflow policy: {overflow_policy}")
+        
         self.encryption = encryption
         self.analyzer = analyzer
         self.threat_dna = ThreatDNAEngine()
         self.deception = DeceptionNetworkEngine()
         self.mesh = MeshDefenseCoordinator()
-        self.clients = set()
+        self.send_queue_size = send_queue_size
+        self.overflow_policy = overflow_policy
+        self.clients = {}  # websocket -> ClientConnection
         logger.info("✓ AI WebSocket server initialized")
     
+    def register_client(self, websocket) -> ClientConnection:
+        """Start the send queue and writer task for a connected client"""
+        connection = ClientConnection(websocket, self.send_queue_size, self.overflow_policy)
+        self.clients[websocket] = connection
+        return connection
+    
+    def unregister_client(self, websocket):
+        """Stop a client's writer and forget it"""
+        connection = self.clients.pop(websocket, None)
+        if connection is not None:
+            connection.close()
+    
     async def handle_client(self, websocket, path):
         """Handle incoming WebSocket connections"""
-        self.clients.add(websocket)
+        self.register_client(websocket)
         logger.info(f"✓ Electron connected. Total clients: {len(self.clients)}")
         
         try:
@@ -403,19 +501,49 @@ class AIWebSocketServer:
         except Exception as e:
             logger.error(f"WebSocket error: {e}")
         finally:
-            self.clients.discard(websocket)
+            self.unregister_client(websocket)
             logger.info(f"Electron disconnected. Total clients: {len(self.clients)}")
     
-    async def process_message(self, websocket, message: str):
+    def decode_message(self, message, fmt: str = 'json') -> dict:
+        """
+        Decode a received message
+        
+        Binary frames are parsed in place by binary_protocol, and only
+        accepted once the connection negotiated them (fmt); text frames
+        are base64 JSON.
+        """
+        if binary_protocol and binary_protocol.is_binary_frame(message):
+            if fmt != binary_protocol.FORMAT_NAME:
+                raise binary_protocol.ProtocolError(
+                    f"Binary frame on a connection that negotiated {fmt}")
+            return binary_protocol.decode_frame(message)
+        
+        if isinstance(message, (bytes, bytearray)):
+            message = message.decode('utf-8')
+        return json.loads(self.encryption.decrypt(message))
+    
+    async def process_message(self, websocket, message):
         """Process incoming messages from Electron or C++"""
         try:
-            # Decrypt message
-            decrypted = self.encryption.decrypt(message)
-            data = json.loads(decrypted)
+            connection = self.clients.get(websocket)
+            data = self.decode_message(message, connection.format if connection else 'json')
             
             msg_type = data.get('type')
             
-            if msg_type == 'SYSTEM_DATA':
+            if msg_type == 'HELLO':
+                # Format negotiation: binary frames only if both sides support them
+                offered = data.get('formats', [])
+                fmt = binary_protocol.negotiate(offered) if binary_protocol else 'json'
+                connection = connection or self.register_client(websocket)
+                connection.format = fmt
+                connection.enqueue(self.encryption.encrypt(json.dumps({
+                    'type': 'HELLO_ACK',
+                    'format': fmt,
+                    'version': binary_protocol.VERSION if binary_protocol else 0
+                })))
+                logger.info(f"✓ Client negotiated {fmt} messages")
+                
+            elif msg_type == 'SYSTEM_DATA':
                 # Analyze system data
                 analysis = self.analyzer.analyze(data)
                 
@@ -455,18 +583,26 @@ class AIWebSocketServer:
             logger.error(f"Message processing error: {e}")
     
     async def broadcast(self, data: dict):
-        """Broadcast analysis to all connected Electron clients"""
+        """Queue analysis for all connected Electron clients (never waits on a socket)"""
         if not self.clients:
             return
         
         # Encrypt response
         encrypted = self.encryption.encrypt(json.dumps(data))
         
-        # Send to all clients
-        tasks = [client.send(encrypted) for client in self.clients]
-        await asyncio.gather(*tasks, return_exceptions=True)
+        # Hand off to each client's writer; drop clients the overflow policy disconnected
+        for websocket, connection in list(self.clients.items()):
+            if not connection.enqueue(encrypted):
+                self.clients.pop(websocket, None)
         
         logger.info(f"Analysis broadcasted to {len(self.clients)} Electron client(s)")
+    
+    def get_client_stats(self) -> list:
+        """Queue depth and send/drop counters per connected client"""
+        return [
+            {'queued': len(c.queue), 'format': c.format, **c.stats}
+            for c in self.clients.values()
+        ]
 
 # ==================== MAIN APPLICATION ====================
 
@@ -488,8 +624,12 @@ async def main():
         encryption = EncryptionHandler(enc_key)
         analyzer = BehaviorAnalyzer()
         
+        # Per-client send queues: SMARTAI_WS_OVERFLOW is drop_oldest, coalesce or disconnect
+        send_queue_size = int(os.getenv('SMARTAI_WS_SEND_QUEUE', 64))
+        overflow_policy = os.getenv('SMARTAI_WS_OVERFLOW', 'drop_oldest')
+        
         # Create WebSocket server
-        ws_server = AIWebSocketServer(encryption, analyzer)
+        ws_server = AIWebSocketServer(encryption, analyzer, send_queue_size, overflow_policy)
         
         # Start serving
         print("[Python] Starting WebSocket server...")
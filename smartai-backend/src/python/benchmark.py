@@ -0,0 +1,420 @@
+#!/usr/bin/env python3
+"""
+SmartAI Benchmark Harness
+Drives the analysis paths with seeded synthetic fleet telemetry, without
+sleeps, and reports samples/sec and p50/p99 latency per stage, with the
+highest whole-process RSS sampled while each stage ran (stages share one
+process, so this is not the stage's own memory use):
+
+- controller: each stage of SmartAIController.process_system_data
+- pipeline: SmartAIController.submit() throughput with all stages concurrent
+- websocket: AIWebSocketServer.process_message and its analysis steps, fed
+  base64 JSON text frames and (websocket_binary) binary_protocol frames
+
+Usage:
+    python benchmark.py --samples 5000 --devices 16 --seed 42 --json results.json
+"""
+
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import tempfile
+import threading
+import importlib.util
+from collections import defaultdict
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+try:
+    import resource
+except ImportError:
+    resource = None  # Windows
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+
+# ==================== SYNTHETIC TELEMETRY ====================
+
+def generate_fleet_telemetry(n_samples: int, n_devices: int = 16, seed: int = 42,
+                             burst_rate: float = 0.002, burst_length: int = 20,
+                             ) -> Tuple[List[Dict], np.ndarray]:
+    """
+    Deterministic fleet telemetry with injected anomaly bursts
+
+    Samples interleave devices round robin (one time step per device). Each
+    device has its own baseline; a burst raises CPU/memory, process count
+    and outbound traffic (exfiltration) for burst_length consecutive steps.
+
+    Args:
+        n_samples: Number of system_data snapshots
+        n_devices: Devices in the fleet; 0 for untagged local telemetry
+        seed: Random seed, same seed gives the same telemetry
+        burst_rate: Chance per device step that a burst starts
+        burst_length: Steps each burst lasts
+
+    Returns:
+        (snapshots, labels): system_data dicts in the controller's format
+        and a boolean array marking samples inside a burst
+    """
+    rng = np.random.default_rng(seed)
+    fleet = max(n_devices, 1)
+    device_index = np.arange(n_samples) % fleet
+    step = np.arange(n_samples) // fleet
+    n_steps = int(step[-1]) + 1 if n_samples else 0
+
+    # Bursts: a start flag per (device, step), stretched over burst_length steps
+    starts = rng.random((fleet, n_steps)) < burst_rate
+    in_burst = np.zeros((fleet, n_steps), dtype=bool)
+    for offset in range(burst_length):
+        in_burst[:, offset:] |= starts[:, :n_steps - offset]
+    labels = in_burst[device_index, step]
+
+    base_cpu = rng.uniform(15, 45, fleet)[device_index]
+    base_memory = rng.uniform(25, 60, fleet)[device_index]
+    base_in = rng.uniform(0.2, 1.0, fleet)[device_index]
+    base_out = rng.uniform(0.1, 0.5, fleet)[device_index]
+
+    cpu = base_cpu + rng.normal(0, 10, n_samples)
+    memory = base_memory + rng.normal(0, 8, n_samples)
+    network_in = base_in + rng.normal(0, 0.2, n_samples)
+    network_out = base_out + rng.normal(0, 0.15, n_samples)
+    process_count = rng.integers(20, 80, n_samples)
+    n_processes = rng.integers(15, 50, n_samples)
+
+    cpu[labels] = 80 + rng.random(labels.sum()) * 20
+    memory[labels] = 75 + rng.random(labels.sum()) * 20
+    network_out[labels] *= 20
+    process_count[labels] += 50
+
+    cpu = np.clip(cpu, 0, 100).tolist()
+    memory = np.clip(memory, 0, 100).tolist()
+    network_in = np.maximum(network_in, 0).tolist()
+    network_out = np.maximum(network_out, 0).tolist()
+    process_count = process_count.tolist()
+
+    # Per-process metrics for every sample, generated in one go
+    proc_cpu = rng.uniform(0, 20, int(n_processes.sum())).tolist()
+    proc_memory = rng.uniform(10, 500, int(n_processes.sum())).tolist()
+    bounds = np.concatenate(([0], np.cumsum(n_processes))).tolist()
+
+    snapshots = []
+    for i in range(n_samples):
+        start = bounds[i]
+        snapshot = {
+            "cpu_usage": cpu[i],
+            "memory_usage": memory[i],
+            "network_in": network_in[i],
+            "network_out": network_out[i],
+            "process_count": process_count[i],
+            "processes": [
+                {"name": f"process_{k}.exe", "pid": 1000 + k,
+                 "cpu": proc_cpu[start + k], "memory": proc_memory[start + k]}
+                for k in range(bounds[i + 1] - start)
+            ]
+        }
+        if n_devices:
+            snapshot["device_id"] = f"device-{device_index[i]:03d}"
+        snapshots.append(snapshot)
+
+    return snapshots, labels
+
+
+def to_websocket_message(snapshot: Dict) -> Dict:
+    """Convert a system_data snapshot into a C++ core SYSTEM_DATA message"""
+    return {
+        "type": "SYSTEM_DATA",
+        "systemStats": {
+            "cpuUsage": snapshot["cpu_usage"],
+            "ramUsage": snapshot["memory_usage"],
+            "processes": snapshot["processes"],
+        }
+    }
+
+
+# ==================== MEASUREMENT ====================
+
+def current_rss() -> Optional[int]:
+    """Resident set size of this process in bytes (None if unknown)"""
+    if psutil is not None:
+        return psutil.Process().memory_info().rss
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def peak_rss() -> Optional[int]:
+    """Peak resident set size of this process in bytes (None if unknown)"""
+    if resource is None:
+        return current_rss()
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+class StageRecorder:
+    """Collect per-call latencies and process RSS samples for named stages"""
+
+    def __init__(self, rss_every: int = 64):
+        self.rss_every = rss_every
+        self.latencies = defaultdict(list)
+        self.process_rss = defaultdict(int)
+        self.elapsed = defaultdict(float)
+
+    def record(self, stage: str, seconds: float):
+        calls = self.latencies[stage]
+        calls.append(seconds)
+        self.elapsed[stage] += seconds
+        if len(calls) % self.rss_every == 1:
+            self.process_rss[stage] = max(self.process_rss[stage], current_rss() or 0)
+
+    def wrap(self, stage: str, function: Callable) -> Callable:
+        """Time every call of a sync or async function under a stage name"""
+        if asyncio.iscoroutinefunction(function):
+            async def timed_async(*args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    return await function(*args, **kwargs)
+                finally:
+                    self.record(stage, time.perf_counter() - start)
+            return timed_async
+
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                self.record(stage, time.perf_counter() - start)
+        return timed
+
+    def report(self) -> Dict[str, Dict]:
+        results = {}
+        for stage, calls in self.latencies.items():
+            latencies = np.array(calls) * 1000
+            results[stage] = {
+                "calls": len(calls),
+                "samples_per_sec": len(calls) / self.elapsed[stage] if self.elapsed[stage] else 0.0,
+                "p50_ms": float(np.percentile(latencies, 50)),
+                "p99_ms": float(np.percentile(latencies, 99)),
+                "process_rss_mb": self.process_rss[stage] / 1e6,
+            }
+        return results
+
+
+# ==================== BENCHMARKS ====================
+
+def bench_controller(controller, snapshots: List[Dict]) -> Dict[str, Dict]:
+    """Time each process_system_data stage, one sample at a time"""
+    recorder = StageRecorder()
+    wall_start = time.perf_counter()
+    for system_data in snapshots:
+        total_start = time.perf_counter()
+        batch = [{"system_data": system_data, "source": "benchmark"}]
+        for name, stage, _ in controller.pipeline.stages:
+            start = time.perf_counter()
+            batch = stage(batch)
+            recorder.record(f"controller.{name}", time.perf_counter() - start)
+        recorder.record("controller.process_system_data", time.perf_counter() - total_start)
+
+    # Wall clock, so time taken by background retraining counts against throughput
+    results = recorder.report()
+    results["controller.process_system_data"]["samples_per_sec"] = (
+        len(snapshots) / (time.perf_counter() - wall_start))
+    return results
+
+
+def bench_pipeline(controller, snapshots: List[Dict], n_sources: int = 4) -> Dict[str, Dict]:
+    """
+    Throughput of the concurrent pipeline fed from several sources
+
+    Latency percentiles come from the controller's METRICS histograms
+    (bucket upper bounds), per stage and end to end including queueing.
+    """
+    from ai_module import METRICS
+
+    done = threading.Event()
+    received = [0]
+    lock = threading.Lock()
+
+    def on_response(response: Dict):
+        with lock:
+            received[0] += 1
+            if received[0] == len(snapshots):
+                done.set()
+
+    controller.add_response_handler(on_response)
+    controller.start_pipeline()
+    METRICS.reset()
+
+    start = time.perf_counter()
+    threads = [
+        controller.attach_source(f"benchmark-{k}", iter(snapshots[k::n_sources]))
+        for k in range(n_sources)
+    ]
+    done.wait(timeout=600)
+    elapsed = time.perf_counter() - start
+    for thread in threads:
+        thread.join()
+    controller.response_handlers.remove(on_response)
+
+    rss_mb = (current_rss() or 0) / 1e6
+    stages = METRICS.snapshot()["stages"]
+    results = {}
+    for stage, h in stages.items():
+        if stage == "end_to_end":
+            continue
+        results[f"pipeline.{stage}"] = {
+            "calls": h["count"],
+            "samples_per_sec": h["count"] / h["sum_seconds"] if h["sum_seconds"] else 0.0,
+            "p50_ms": h["p50_ms"],
+            "p99_ms": h["p99_ms"],
+            "process_rss_mb": rss_mb,
+        }
+
+    end_to_end = stages.get("end_to_end", {})
+    results["pipeline.end_to_end"] = {
+        "calls": received[0],
+        "samples_per_sec": received[0] / elapsed if elapsed else 0.0,
+        "p50_ms": end_to_end.get("p50_ms"),
+        "p99_ms": end_to_end.get("p99_ms"),
+        "process_rss_mb": rss_mb,
+    }
+    return results
+
+
+class _NullClient:
+    """Stands in for an Electron WebSocket connection"""
+
+    def __init__(self):
+        self.sent = 0
+
+    async def send(self, data):
+        self.sent += 1
+
+
+def bench_websocket(snapshots: List[Dict], binary: bool = False) -> Dict[str, Dict]:
+    """Time AIWebSocketServer.process_message and its analysis steps
+
+    Args:
+        binary: Send binary_protocol frames instead of base64 JSON
+    """
+    import logging
+    import ai_module_websocket as ws
+    import binary_protocol
+
+    prefix = "websocket_binary" if binary else "websocket"
+
+    logging.getLogger(ws.__name__).setLevel(logging.WARNING)
+    encryption = ws.EncryptionHandler("benchmark")
+    server = ws.AIWebSocketServer(encryption, ws.BehaviorAnalyzer())
+
+    recorder = StageRecorder()
+    server.analyzer.analyze = recorder.wrap(f"{prefix}.analyze", server.analyzer.analyze)
+    server.threat_dna.analyze_threat = recorder.wrap(
+        f"{prefix}.threat_dna", server.threat_dna.analyze_threat)
+    server.deception.check_honeypot = recorder.wrap(
+        f"{prefix}.deception", server.deception.check_honeypot)
+    server.mesh.get_mesh_status = recorder.wrap(f"{prefix}.mesh", server.mesh.get_mesh_status)
+    server.broadcast = recorder.wrap(f"{prefix}.broadcast", server.broadcast)
+    server.decode_message = recorder.wrap(f"{prefix}.decode", server.decode_message)
+    process_message = recorder.wrap(f"{prefix}.process_message", server.process_message)
+
+    if binary:
+        messages = [binary_protocol.encode_system_data(to_websocket_message(s)["systemStats"])
+                    for s in snapshots]
+    else:
+        messages = [encryption.encrypt(json.dumps(to_websocket_message(s))) for s in snapshots]
+
+    async def drive():
+        client = _NullClient()
+        connection = server.register_client(client)
+        if binary:
+            # What a HELLO offering binary-v1 negotiates, without timing it
+            connection.format = binary_protocol.negotiate([binary_protocol.FORMAT_NAME])
+        for message in messages:
+            await process_message(client, message)
+            await asyncio.sleep(0)  # let the client writer run
+
+    asyncio.run(drive())
+    return recorder.report()
+
+
+# ==================== ENTRY POINT ====================
+
+def print_report(results: Dict[str, Dict]):
+    print(f"{'stage':<34}{'samples/s':>12}{'p50 ms':>10}{'p99 ms':>10}{'proc RSS MB':>14}")
+    for stage, r in results.items():
+        p50 = f"{r['p50_ms']:.3f}" if r["p50_ms"] is not None else "-"
+        p99 = f"{r['p99_ms']:.3f}" if r["p99_ms"] is not None else "-"
+        print(f"{stage:<34}{r['samples_per_sec']:>12.0f}{p50:>10}{p99:>10}{r['process_rss_mb']:>14.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="SmartAI analysis benchmark")
+    parser.add_argument("--samples", type=int, default=5000)
+    parser.add_argument("--devices", type=int, default=16,
+                        help="devices in the synthetic fleet (0: untagged local telemetry)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--burst-rate", type=float, default=0.002)
+    parser.add_argument("--burst-length", type=int, default=20)
+    parser.add_argument("--sources", type=int, default=4, help="concurrent pipeline sources")
+    parser.add_argument("--skip", action="append", default=[],
+                        choices=["controller", "pipeline", "websocket"])
+    parser.add_argument("--json", help="write results to this file")
+    args = parser.parse_args()
+
+    # Keep models, alerts and decoys out of the real data directories
+    workdir = tempfile.mkdtemp(prefix="smartai-bench-")
+    os.environ.setdefault("SMARTAI_DATA_DIR", os.path.join(workdir, "data"))
+    os.environ.setdefault("SMARTAI_HONEYPOT_DIR", os.path.join(workdir, "honeypot"))
+
+    snapshots, labels = generate_fleet_telemetry(
+        args.samples, args.devices, args.seed, args.burst_rate, args.burst_length)
+    print(f"Generated {len(snapshots)} samples for {args.devices} device(s), "
+          f"{int(labels.sum())} inside anomaly bursts (seed {args.seed})")
+
+    results = {}
+    if "controller" not in args.skip or "pipeline" not in args.skip:
+        from ai_module import SmartAIController
+
+        startup = time.perf_counter()
+        controller = SmartAIController()
+        print(f"Controller startup: {(time.perf_counter() - startup) * 1000:.0f} ms")
+        try:
+            if "controller" not in args.skip:
+                results.update(bench_controller(controller, snapshots))
+            if "pipeline" not in args.skip:
+                results.update(bench_pipeline(controller, snapshots, args.sources))
+        finally:
+            controller.shutdown()
+
+    if "websocket" not in args.skip:
+        if importlib.util.find_spec("websockets") is None:
+            print("Skipping websocket benchmark (websockets not installed)")
+        else:
+            results.update(bench_websocket(snapshots))
+            results.update(bench_websocket(snapshots, binary=True))
+
+    print()
+    print_report(results)
+    print(f"\nPeak RSS (process): {(peak_rss() or 0) / 1e6:.1f} MB")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({
+                "config": vars(args),
+                "anomaly_samples": int(labels.sum()),
+                "peak_rss_mb": (peak_rss() or 0) / 1e6,
+                "stages": results,
+            }, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+"""
+SmartAI Binary Message Protocol
+Compact binary encoding of SYSTEM_DATA messages for the C++ -> Python
+WebSocket channel. Sent as binary WebSocket frames (no base64), with typed
+header fields and the process table as a packed array that is decoded with
+np.frombuffer (no per-process parsing, no copy). Base64 JSON text frames
+remain the fallback; a client opts in with a HELLO message listing
+"binary-v1" among its formats, and binary frames on a connection that
+has not negotiated it are rejected.
+
+Layout (little-endian):
+    header   FRAME_HEADER: magic b"SMAI", version u8, message type u8,
+             flags u16, timestamp f64, cpu f32, ram f32, ram available MB u32,
+             ram total MB u32, process count u32, name blob size u32
+    records  process count x PROCESS_DTYPE (pid, cpu, memory, name offset,
+             name length)
+    names    UTF-8 process names, back to back, referenced by the records
+"""
+
+import struct
+import time
+from typing import Dict, Iterable, List, Optional, Union
+
+import numpy as np
+
+MAGIC = b"SMAI"
+VERSION = 1
+FORMAT_NAME = "binary-v1"
+
+MSG_SYSTEM_DATA = 1
+MSG_KEY_SYNC = 2
+MESSAGE_TYPES = {MSG_SYSTEM_DATA: "SYSTEM_DATA", MSG_KEY_SYNC: "KEY_SYNC"}
+
+FRAME_HEADER = struct.Struct("<4sBBHdffIIII")
+
+PROCESS_DTYPE = np.dtype([
+    ("pid", "<u4"),
+    ("cpu", "<f4"),
+    ("memory", "<f4"),
+    ("name_offset", "<u4"),
+    ("name_length", "<u4"),
+])
+
+Buffer = Union[bytes, bytearray, memoryview]
+
+
+class ProtocolError(ValueError):
+    """Malformed binary frame"""
+
+
+def is_binary_frame(message) -> bool:
+    """Check if a received WebSocket message is a binary protocol frame"""
+    return isinstance(message, (bytes, bytearray, memoryview)) and bytes(message[:4]) == MAGIC
+
+
+def encode_system_data(system_stats: Dict, timestamp: Optional[float] = None,
+                       msg_type: int = MSG_SYSTEM_DATA) -> bytes:
+    """
+    Encode a systemStats document into a binary frame
+
+    Args:
+        system_stats: cpuUsage, ramUsage, ramAvailable, ramTotal and
+            processes (names, or dicts with name/pid/cpu/memory)
+        timestamp: Seconds since epoch (default: now)
+
+    Returns:
+        Frame bytes for a binary WebSocket message
+    """
+    processes = system_stats.get("processes", [])
+    records = np.zeros(len(processes), dtype=PROCESS_DTYPE)
+    names = bytearray()
+    for i, proc in enumerate(processes):
+        if isinstance(proc, dict):
+            name = proc.get("name", "")
+            records[i]["pid"] = proc.get("pid", 0)
+            records[i]["cpu"] = proc.get("cpu", 0)
+            records[i]["memory"] = proc.get("memory", 0)
+        else:
+            name = proc
+        encoded = str(name).encode("utf-8")
+        records[i]["name_offset"] = len(names)
+        records[i]["name_length"] = len(encoded)
+        names += encoded
+
+    header = FRAME_HEADER.pack(
+        MAGIC, VERSION, msg_type, 0,
+        time.time() if timestamp is None else timestamp,
+        system_stats.get("cpuUsage", 0), system_stats.get("ramUsage", 0),
+        int(system_stats.get("ramAvailable", 0)), int(system_stats.get("ramTotal", 0)),
+        len(processes), len(names),
+    )
+    return header + records.tobytes() + bytes(names)
+
+
+class ProcessTable:
+    """
+    Process records of a decoded frame
+
+    Fields are NumPy views into the received buffer; names are decoded only
+    when asked for.
+    """
+
+    def __init__(self, records: np.ndarray, names: memoryview):
+        self.records = records
+        self._names = names
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    @property
+    def pid(self) -> np.ndarray:
+        return self.records["pid"]
+
+    @property
+    def cpu(self) -> np.ndarray:
+        return self.records["cpu"]
+
+    @property
+    def memory(self) -> np.ndarray:
+        return self.records["memory"]
+
+    def name(self, index: int) -> str:
+        record = self.records[index]
+        start = int(record["name_offset"])
+        return bytes(self._names[start:start + int(record["name_length"])]).decode(
+            "utf-8", errors="replace")
+
+    def names(self) -> List[str]:
+        return [self.name(i) for i in range(len(self.records))]
+
+    def to_list(self) -> List[Dict]:
+        """Process dicts in the JSON message format"""
+        return [
+            {"name": self.name(i), "pid": int(r["pid"]), "cpu": float(r["cpu"]),
+             "memory": float(r["memory"])}
+            for i, r in enumerate(self.records)
+        ]
+
+
+def decode_frame(message: Buffer) -> Dict:
+    """
+    Decode a binary frame into the same shape as the JSON message
+
+    Returns:
+        {"type", "timestamp", "format", "systemStats": {..., "processes":
+        ProcessTable}}
+    """
+    view = memoryview(message)
+    if len(view) < FRAME_HEADER.size:
+        raise ProtocolError("Frame shorter than header")
+
+    (magic, version, msg_type, _flags, timestamp, cpu, ram, ram_available,
+     ram_total, n_processes, names_size) = FRAME_HEADER.unpack_from(view)
+    if magic != MAGIC:
+        raise ProtocolError("Bad frame magic")
+    if version != VERSION:
+        raise ProtocolError(f"Unsupported frame version {version}")
+
+    records_end = FRAME_HEADER.size + n_processes * PROCESS_DTYPE.itemsize
+    if len(view) < records_end + names_size:
+        raise ProtocolError("Truncated frame")
+
+    records = np.frombuffer(view, dtype=PROCESS_DTYPE, count=n_processes,
+                            offset=FRAME_HEADER.size)
+    if n_processes and int((records["name_offset"] + records["name_length"]).max()) > names_size:
+        raise ProtocolError("Process name outside name blob")
+
+    return {
+        "type": MESSAGE_TYPES.get(msg_type, f"UNKNOWN_{msg_type}"),
+        "timestamp": timestamp,
+        "format": FORMAT_NAME,
+        "systemStats": {
+            "cpuUsage": float(cpu),
+            "ramUsage": float(ram),
+            "ramAvailable": ram_available,
+            "ramTotal": ram_total,
+            "processes": ProcessTable(records, view[records_end:records_end + names_size]),
+        },
+    }
+
+
+def negotiate(client_formats: Iterable[str]) -> str:
+    """Pick the message format for a client from the formats it offers"""
+    return FORMAT_NAME if FORMAT_NAME in set(client_formats or ()) else "json"
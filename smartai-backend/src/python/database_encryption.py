@@ -12,7 +12,7 @@ import logging
 from pathlib import Path
 from cryptography.fernet import Fernet
 from cryptography.hazmat.primitives import hashes
-from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2
+from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
 from cryptography.hazmat.backends import default_backend
 import base64
 
@@ -51,7 +51,7 @@ class DatabaseEncryption:
         # Use a consistent salt for key derivation
         salt = b'smartai_db_salt_'  # Fixed salt for consistent key derivation
         
-        kdf = PBKDF2(
+        kdf = PBKDF2HMAC(
             algorithm=hashes.SHA256(),
             length=32,  # 256 bits
             salt=salt,
@@ -117,8 +117,9 @@ class DatabaseEncryption:
             with open(file_path, 'rb') as f:
                 encrypted = f.read()
             
-            # Check if file is actually encrypted or just new
-            if not encrypted.startswith(b'gAAAAAA'):  # Fernet token prefix
+            # Check if file is actually encrypted or just new (the Fernet
+            # token prefix changes with its timestamp, so test for SQLite)
+            if encrypted.startswith(b'SQLite format 3\x00'):
                 # File is not encrypted yet (first run), just copy it
                 with open(temp_path, 'wb') as f:
                     f.write(encrypted)
@@ -187,7 +188,9 @@ class DatabaseEncryption:
         
         Args:
             conn: sqlite3 connection
-            encrypt: True to encrypt database after closing
+            encrypt: True to encrypt database after closing. False for
+                read-only connections: the decrypted copy is discarded and
+                the encrypted file is left untouched
         """
         try:
             db_path = self.db_paths.get(id(conn))
@@ -224,6 +227,8 @@ class DatabaseEncryption:
                 # Encrypt the file
                 self._encrypt_file(db_path)
                 logger.debug(f"Encrypted and closed database: {db_path}")
+            elif os.path.exists(db_info['temp_path']):
+                os.remove(db_info['temp_path'])
             
             # Cleanup
             del self.db_connections[db_path]
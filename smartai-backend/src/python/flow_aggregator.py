@@ -0,0 +1,414 @@
+#!/usr/bin/env python3
+"""
+SmartAI Flow Aggregator
+Turns raw packets (live interface or offline pcap) into windowed network
+features for the behavior profiler. Packets are handled in batches and
+decoded with vectorized NumPy operations, never one Python callback per packet.
+"""
+
+import time
+import socket
+import struct
+import threading
+import logging
+from collections import deque
+from typing import Dict, Iterable, Iterator, List
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# pcap link types
+LINKTYPE_ETHERNET = 1
+LINKTYPE_RAW = 101
+LINKTYPE_LINUX_SLL = 113
+
+_L2_HEADER = {LINKTYPE_ETHERNET: 14, LINKTYPE_RAW: 0, LINKTYPE_LINUX_SLL: 16}
+
+_PCAP_MAGIC = {
+    b"\xd4\xc3\xb2\xa1": ("<", 1e-6),
+    b"\xa1\xb2\xc3\xd4": (">", 1e-6),
+    b"\x4d\x3c\xb2\xa1": ("<", 1e-9),
+    b"\xa1\xb2\x3c\x4d": (">", 1e-9),
+}
+
+ETH_P_ALL = 0x0003
+PROTO_TCP = 6
+PROTO_UDP = 17
+
+
+class PacketBatch:
+    """Many captured frames packed into one buffer"""
+
+    def __init__(self, buffer: np.ndarray, offsets: np.ndarray, caplens: np.ndarray,
+                 wirelens: np.ndarray, timestamps: np.ndarray, linktype: int):
+        self.buffer = buffer  # uint8, all frames back to back
+        self.offsets = offsets  # start of each frame in buffer
+        self.caplens = caplens  # bytes captured per frame
+        self.wirelens = wirelens  # original length on the wire
+        self.timestamps = timestamps  # seconds since epoch
+        self.linktype = linktype
+
+    def __len__(self) -> int:
+        return len(self.offsets)
+
+
+def read_pcap(path: str, batch_size: int = 65536,
+              chunk_bytes: int = 16 * 1024 * 1024) -> Iterator[PacketBatch]:
+    """
+    Read a classic pcap file in batches of up to batch_size packets
+
+    Only the 16-byte record headers are walked in Python; packet contents
+    are decoded later in bulk by decode_ipv4.
+    """
+    with open(path, "rb") as f:
+        header = f.read(24)
+        if len(header) < 24 or header[:4] not in _PCAP_MAGIC:
+            raise ValueError(f"Not a pcap file: {path}")
+        endian, ts_unit = _PCAP_MAGIC[header[:4]]
+        linktype = struct.unpack(endian + "I", header[20:24])[0] & 0x0FFFFFFF
+        if linktype not in _L2_HEADER:
+            raise ValueError(f"Unsupported pcap link type: {linktype}")
+
+        record = struct.Struct(endian + "IIII")
+        pending = b""
+        eof = False
+        while not eof:
+            chunk = f.read(chunk_bytes)
+            eof = not chunk
+            data = pending + chunk
+            pos = 0
+            offsets, caplens, wirelens, stamps = [], [], [], []
+
+            while pos + 16 <= len(data):
+                ts_sec, ts_frac, caplen, wirelen = record.unpack_from(data, pos)
+                if pos + 16 + caplen > len(data):
+                    break  # record continues in the next chunk
+                offsets.append(pos + 16)
+                caplens.append(caplen)
+                wirelens.append(wirelen)
+                stamps.append(ts_sec + ts_frac * ts_unit)
+                pos += 16 + caplen
+
+                if len(offsets) == batch_size:
+                    yield _make_batch(data, offsets, caplens, wirelens, stamps, linktype)
+                    offsets, caplens, wirelens, stamps = [], [], [], []
+
+            if offsets:
+                yield _make_batch(data, offsets, caplens, wirelens, stamps, linktype)
+            pending = data[pos:]
+
+
+def _make_batch(data: bytes, offsets: List[int], caplens: List[int], wirelens: List[int],
+                stamps: List[float], linktype: int) -> PacketBatch:
+    return PacketBatch(
+        np.frombuffer(data, dtype=np.uint8),
+        np.array(offsets, dtype=np.int64),
+        np.array(caplens, dtype=np.int64),
+        np.array(wirelens, dtype=np.int64),
+        np.array(stamps, dtype=np.float64),
+        linktype
+    )
+
+
+def decode_ipv4(batch: PacketBatch) -> Dict[str, np.ndarray]:
+    """
+    Decode IPv4/TCP/UDP header fields of a whole batch at once
+
+    Returns arrays for the IPv4 packets only: timestamp, length, src, dst
+    (uint32), proto, sport, dport, has_ports and syn (SYN without ACK).
+    """
+    buf = batch.buffer
+    last = len(buf) - 1
+    caplens = batch.caplens
+    l3 = batch.offsets + _L2_HEADER[batch.linktype]
+
+    def byte_at(index: np.ndarray) -> np.ndarray:
+        return buf[np.minimum(index, last)].astype(np.uint32)
+
+    # Keep IPv4 packets with a complete IP header
+    available = caplens - _L2_HEADER[batch.linktype]
+    ipv4 = (available >= 20) & ((byte_at(l3) >> 4) == 4)
+    if batch.linktype == LINKTYPE_ETHERNET:
+        ipv4 &= (byte_at(batch.offsets + 12) == 0x08) & (byte_at(batch.offsets + 13) == 0x00)
+    elif batch.linktype == LINKTYPE_LINUX_SLL:
+        ipv4 &= (byte_at(batch.offsets + 14) == 0x08) & (byte_at(batch.offsets + 15) == 0x00)
+
+    l3 = l3[ipv4]
+    available = available[ipv4]
+    ihl = (byte_at(l3) & 0x0F) * 4
+    proto = byte_at(l3 + 9)
+    src = (byte_at(l3 + 12) << 24) | (byte_at(l3 + 13) << 16) | (byte_at(l3 + 14) << 8) | byte_at(l3 + 15)
+    dst = (byte_at(l3 + 16) << 24) | (byte_at(l3 + 17) << 16) | (byte_at(l3 + 18) << 8) | byte_at(l3 + 19)
+
+    # Non-first fragments carry no transport header
+    fragment_offset = ((byte_at(l3 + 6) & 0x1F) << 8) | byte_at(l3 + 7)
+    l4 = l3 + ihl
+    has_ports = (((proto == PROTO_TCP) | (proto == PROTO_UDP))
+                 & (fragment_offset == 0) & (available >= ihl + 4))
+    sport = np.where(has_ports, (byte_at(l4) << 8) | byte_at(l4 + 1), 0)
+    dport = np.where(has_ports, (byte_at(l4 + 2) << 8) | byte_at(l4 + 3), 0)
+
+    tcp_flags = byte_at(l4 + 13)
+    has_flags = has_ports & (proto == PROTO_TCP) & (available >= ihl + 14)
+    syn = has_flags & ((tcp_flags & 0x12) == 0x02)
+
+    return {
+        "timestamp": batch.timestamps[ipv4],
+        "length": batch.wirelens[ipv4],
+        "src": src,
+        "dst": dst,
+        "proto": proto,
+        "sport": sport,
+        "dport": dport,
+        "has_ports": has_ports,
+        "syn": syn,
+    }
+
+
+class LiveCapture:
+    """
+    Capture frames from a Linux interface with a raw AF_PACKET socket
+
+    Frames are received straight into one preallocated buffer and handed
+    over as a PacketBatch every batch_size frames or batch_interval seconds.
+    Requires root (CAP_NET_RAW).
+    """
+
+    def __init__(self, interface: str, batch_size: int = 4096,
+                 batch_interval: float = 0.1, snaplen: int = 128):
+        if not hasattr(socket, "AF_PACKET"):
+            raise OSError("Live capture needs Linux AF_PACKET sockets")
+        self.interface = interface
+        self.batch_size = batch_size
+        self.batch_interval = batch_interval
+        self.snaplen = snaplen
+        self.sock = socket.socket(socket.AF_PACKET, socket.SOCK_RAW, socket.ntohs(ETH_P_ALL))
+        self.sock.bind((interface, 0))
+        self.sock.settimeout(batch_interval)
+
+    def batches(self, running: threading.Event) -> Iterator[PacketBatch]:
+        """Yield batches until running is cleared"""
+        buffer = bytearray(self.batch_size * self.snaplen)
+        view = memoryview(buffer)
+        while running.is_set():
+            offsets, caplens, wirelens = [], [], []
+            deadline = time.monotonic() + self.batch_interval
+            pos = 0
+            while len(offsets) < self.batch_size and time.monotonic() < deadline:
+                try:
+                    wirelen = self.sock.recv_into(view[pos:pos + self.snaplen], 0, socket.MSG_TRUNC)
+                except socket.timeout:
+                    break
+                offsets.append(pos)
+                caplens.append(min(wirelen, self.snaplen))
+                wirelens.append(wirelen)
+                pos += self.snaplen
+
+            # Empty batches on a quiet link still let the window close on time
+            now = time.time()
+            yield PacketBatch(
+                np.frombuffer(bytes(view[:pos]), dtype=np.uint8),
+                np.array(offsets, dtype=np.int64),
+                np.array(caplens, dtype=np.int64),
+                np.array(wirelens, dtype=np.int64),
+                np.full(len(offsets), now),
+                LINKTYPE_ETHERNET
+            )
+
+    def close(self):
+        self.sock.close()
+
+
+def _mix64(x: np.ndarray) -> np.ndarray:
+    """splitmix64 finalizer: every input bit affects the low bits used as a slot"""
+    x = x ^ (x >> np.uint64(30))
+    x = x * np.uint64(0xBF58476D1CE4E5B9)
+    x = x ^ (x >> np.uint64(27))
+    x = x * np.uint64(0x94D049BB133111EB)
+    return x ^ (x >> np.uint64(31))
+
+
+def ip_to_uint32(address: str) -> int:
+    return struct.unpack("!I", socket.inet_aton(address))[0]
+
+
+class FlowAggregator:
+    """
+    Windowed per-flow and per-host traffic counters
+
+    Flows (5-tuples) and hosts are hashed into fixed-size NumPy tables, so
+    memory does not grow with traffic. When a window of window_seconds ends
+    its features are computed and kept (last history windows), keyed like
+    the profiler's system_data: network_in/network_out (MB/s, relative to
+    local_ips), flow_bytes, flow_packets, flow_distinct_dst_ports,
+    flow_syn_ratio, flow_active_flows and flow_active_hosts.
+    """
+
+    def __init__(self, window_seconds: float = 5.0, local_ips: Iterable[str] = (),
+                 n_flow_slots: int = 65536, n_host_slots: int = 4096, history: int = 120):
+        self.window_seconds = window_seconds
+        self.local_ips = np.array([ip_to_uint32(ip) for ip in local_ips], dtype=np.uint32)
+        self.n_flow_slots = n_flow_slots
+        self.n_host_slots = n_host_slots
+
+        self.flow_bytes = np.zeros(n_flow_slots)
+        self.flow_packets = np.zeros(n_flow_slots)
+        self.host_bytes = np.zeros(n_host_slots)
+        self.dst_ports = np.zeros(65536, dtype=bool)
+        self._reset_totals()
+
+        self.current_window = None
+        self.windows = deque(maxlen=history)
+        self.packets_processed = 0
+        self.lock = threading.Lock()
+        self._running = threading.Event()
+        self._thread = None
+
+    def _reset_totals(self):
+        self.flow_bytes.fill(0)
+        self.flow_packets.fill(0)
+        self.host_bytes.fill(0)
+        self.dst_ports.fill(False)
+        self.total_bytes = 0
+        self.total_packets = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.tcp_packets = 0
+        self.syn_packets = 0
+
+    def add_batch(self, batch: PacketBatch):
+        """Decode a batch and add it to the current window(s)"""
+        if len(batch) == 0:
+            return
+        self.add_packets(decode_ipv4(batch))
+
+    def add_packets(self, packets: Dict[str, np.ndarray]):
+        """Add decoded packets, closing windows as timestamps move on"""
+        if len(packets["timestamp"]) == 0:
+            return
+
+        window_ids = np.floor(packets["timestamp"] / self.window_seconds).astype(np.int64)
+        with self.lock:
+            # Captures are time ordered, so each window is one contiguous run
+            boundaries = np.flatnonzero(np.diff(window_ids)) + 1
+            starts = np.concatenate(([0], boundaries))
+            ends = np.concatenate((boundaries, [len(window_ids)]))
+            for start, end in zip(starts, ends):
+                window_id = int(window_ids[start])
+                if self.current_window is None:
+                    self.current_window = window_id
+                elif window_id > self.current_window:
+                    self._close_window()
+                    self.current_window = window_id
+                self._accumulate({k: v[start:end] for k, v in packets.items()})
+            self.packets_processed += len(window_ids)
+
+    def _accumulate(self, p: Dict[str, np.ndarray]):
+        length = p["length"].astype(np.float64)
+        src = p["src"].astype(np.uint64)
+        dst = p["dst"].astype(np.uint64)
+
+        ports = ((p["sport"].astype(np.uint64) << np.uint64(32))
+                 | (p["dport"].astype(np.uint64) << np.uint64(16))
+                 | p["proto"].astype(np.uint64))
+        flow_hash = _mix64(_mix64((src << np.uint64(32)) | dst) ^ ports)
+        flow_slot = (flow_hash % np.uint64(self.n_flow_slots)).astype(np.int64)
+        self.flow_bytes += np.bincount(flow_slot, weights=length, minlength=self.n_flow_slots)
+        self.flow_packets += np.bincount(flow_slot, minlength=self.n_flow_slots)
+
+        host_slot = (_mix64(src) % np.uint64(self.n_host_slots)).astype(np.int64)
+        self.host_bytes += np.bincount(host_slot, weights=length, minlength=self.n_host_slots)
+
+        self.dst_ports[p["dport"][p["has_ports"]]] = True
+
+        self.total_bytes += float(length.sum())
+        self.total_packets += len(length)
+        if len(self.local_ips):
+            self.bytes_in += float(length[np.isin(p["dst"], self.local_ips)].sum())
+            self.bytes_out += float(length[np.isin(p["src"], self.local_ips)].sum())
+        self.tcp_packets += int(np.count_nonzero(p["proto"] == PROTO_TCP))
+        self.syn_packets += int(np.count_nonzero(p["syn"]))
+
+    def _close_window(self):
+        seconds = self.window_seconds
+        self.windows.append({
+            "window_start": self.current_window * seconds,
+            "network_in": self.bytes_in / seconds / 1e6,
+            "network_out": self.bytes_out / seconds / 1e6,
+            "flow_bytes": self.total_bytes,
+            "flow_packets": self.total_packets,
+            "flow_distinct_dst_ports": int(np.count_nonzero(self.dst_ports)),
+            "flow_syn_ratio": self.syn_packets / self.tcp_packets if self.tcp_packets else 0.0,
+            "flow_active_flows": int(np.count_nonzero(self.flow_packets)),
+            "flow_active_hosts": int(np.count_nonzero(self.host_bytes)),
+        })
+        self._reset_totals()
+
+    def flush(self):
+        """Close the current (partial) window"""
+        with self.lock:
+            if self.current_window is not None:
+                self._close_window()
+                self.current_window = None
+
+    def get_features(self) -> Dict:
+        """Features of the last completed window ({} if none yet)"""
+        with self.lock:
+            return dict(self.windows[-1]) if self.windows else {}
+
+    def replay_pcap(self, path: str) -> List[Dict]:
+        """Aggregate a whole pcap file synchronously and return every window"""
+        for batch in read_pcap(path):
+            self.add_batch(batch)
+        self.flush()
+        with self.lock:
+            return list(self.windows)
+
+    def start_pcap(self, path: str):
+        """Replay a pcap file in a background thread"""
+        self._start(lambda: read_pcap(path), flush_at_end=True)
+
+    def start_live(self, interface: str, **capture_options):
+        """Capture from a live interface in a background thread"""
+        capture = LiveCapture(interface, **capture_options)
+        self._start(lambda: capture.batches(self._running), close_idle=True,
+                    on_exit=capture.close)
+
+    def _start(self, make_batches, flush_at_end: bool = False,
+               close_idle: bool = False, on_exit=None):
+        self._running.set()
+
+        def run():
+            try:
+                for batch in make_batches():
+                    if not self._running.is_set():
+                        break
+                    self.add_batch(batch)
+                    if close_idle:
+                        self._close_idle_window()
+                if flush_at_end:
+                    self.flush()
+            except Exception as e:
+                logger.error(f"Flow capture stopped: {e}")
+            finally:
+                if on_exit:
+                    on_exit()
+
+        self._thread = threading.Thread(target=run, daemon=True)
+        self._thread.start()
+
+    def _close_idle_window(self):
+        # On a quiet live link, close the window by the wall clock
+        with self.lock:
+            if (self.current_window is not None
+                    and time.time() >= (self.current_window + 1) * self.window_seconds):
+                self._close_window()
+                self.current_window = None
+
+    def stop(self):
+        """Stop background capture"""
+        self._running.clear()
+        if self._thread is not None:
+            self._thread.join(timeout=2)
+            self._thread = None
@@ -0,0 +1,365 @@
+#!/usr/bin/env python3
+"""
+SmartAI Honeypot File Watcher
+Event-driven detection of decoy file access using Linux inotify
+(via ctypes, no extra dependencies) and /proc-based attribution of
+the processes holding decoy files open
+"""
+
+import os
+import sys
+import ctypes
+import ctypes.util
+import select
+import struct
+import threading
+import time
+import logging
+from typing import Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# inotify event flags (see inotify(7))
+IN_ACCESS = 0x00000001
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_OPEN = 0x00000020
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_CLOEXEC = 0o2000000
+
+EVENT_NAMES = {
+    IN_ACCESS: "read",
+    IN_MODIFY: "modify",
+    IN_ATTRIB: "attrib",
+    IN_CLOSE_WRITE: "close_write",
+    IN_OPEN: "open",
+    IN_DELETE_SELF: "delete",
+    IN_MOVE_SELF: "move",
+}
+
+WATCH_MASK = (IN_ACCESS | IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_OPEN
+              | IN_DELETE_SELF | IN_MOVE_SELF)
+
+# Decoy directories: a watched name (re)appearing, e.g. an atomic replace
+DIR_MASK = IN_CREATE | IN_MOVED_TO | IN_ONLYDIR
+
+# Never debounced: the caller may need to restore the file
+REMOVAL_EVENTS = ("delete", "move")
+
+_EVENT_HEADER = struct.Struct("iIII")  # wd, mask, cookie, name length
+
+
+def procfs_available() -> bool:
+    """Check if /proc exposes per-process file descriptors"""
+    return os.path.isdir("/proc/self/fd")
+
+
+def inotify_available() -> bool:
+    """Check if inotify can be used on this platform"""
+    return sys.platform.startswith("linux") and ctypes.util.find_library("c") is not None
+
+
+class InotifyWatcher:
+    """
+    Watch decoy files with a single inotify descriptor
+
+    A background thread blocks on the descriptor and calls
+    callback(path, events) once per burst of events on a file: an
+    open/read/close sequence within debounce_seconds produces one call.
+    The parent directories are watched too, so a watched path that is
+    deleted, moved away or atomically replaced is watched again as soon
+    as a file with that name exists again.
+    """
+
+    def __init__(self, callback: Callable[[str, List[str]], None],
+                 debounce_seconds: float = 1.0):
+        if not inotify_available():
+            raise OSError("inotify is not available on this platform")
+
+        self.callback = callback
+        self.debounce_seconds = debounce_seconds
+        self._libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        self._fd = self._libc.inotify_init1(IN_CLOEXEC)
+        if self._fd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, f"inotify_init1 failed: {os.strerror(errno)}")
+
+        self.paths = set()  # paths to keep watched
+        self.watches = {}  # wd -> path
+        self.dir_watches = {}  # wd -> directory of watched paths
+        self._last_reported = {}  # path -> monotonic time of last callback
+        self._lock = threading.Lock()
+        self._thread = None
+        self._running = False
+
+    def add_watch(self, path: str) -> bool:
+        """Start watching a file (and keep watching whatever file gets that name)"""
+        directory = os.path.dirname(path) or "."
+        with self._lock:
+            self.paths.add(path)
+            watch_dir = directory not in self.dir_watches.values()
+        if watch_dir:
+            wd = self._libc.inotify_add_watch(self._fd, os.fsencode(directory), DIR_MASK)
+            if wd < 0:
+                errno = ctypes.get_errno()
+                logger.warning(f"Cannot watch directory {directory}: {os.strerror(errno)}")
+            else:
+                with self._lock:
+                    self.dir_watches[wd] = directory
+        return self._watch_file(path)
+
+    def _watch_file(self, path: str) -> bool:
+        wd = self._libc.inotify_add_watch(self._fd, os.fsencode(path), WATCH_MASK)
+        if wd < 0:
+            errno = ctypes.get_errno()
+            logger.warning(f"Cannot watch {path}: {os.strerror(errno)}")
+            return False
+
+        with self._lock:
+            self.watches[wd] = path
+        return True
+
+    def remove_watch(self, path: str):
+        """Stop watching a file"""
+        with self._lock:
+            self.paths.discard(path)
+            for wd, watched_path in list(self.watches.items()):
+                if watched_path == path:
+                    self._libc.inotify_rm_watch(self._fd, wd)
+                    del self.watches[wd]
+            directories = {os.path.dirname(p) or "." for p in self.paths}
+            for wd, directory in list(self.dir_watches.items()):
+                if directory not in directories:
+                    self._libc.inotify_rm_watch(self._fd, wd)
+                    del self.dir_watches[wd]
+
+    def start(self):
+        """Start the background event thread"""
+        if self._running:
+            return
+        self._running = True
+        self._thread = threading.Thread(target=self._event_loop, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop the event thread and release the descriptor"""
+        self._running = False
+        if self._thread is not None:
+            self._thread.join(timeout=2)
+            self._thread = None
+        if self._fd >= 0:
+            os.close(self._fd)
+            self._fd = -1
+
+    def _event_loop(self):
+        while self._running:
+            try:
+                ready, _, _ = select.select([self._fd], [], [], 0.5)
+                if not ready:
+                    continue
+                self._dispatch(os.read(self._fd, 64 * 1024))
+            except Exception as e:
+                if self._running:
+                    logger.error(f"Honeypot watcher error: {e}")
+                    time.sleep(0.5)
+
+    def _dispatch(self, buffer: bytes):
+        # Merge all events of one read per file before reporting
+        events_by_path: Dict[str, List[str]] = {}
+        rewatch = set()
+        offset = 0
+        while offset + _EVENT_HEADER.size <= len(buffer):
+            wd, mask, _, name_len = _EVENT_HEADER.unpack_from(buffer, offset)
+            name = buffer[offset + _EVENT_HEADER.size:offset + _EVENT_HEADER.size + name_len]
+            offset += _EVENT_HEADER.size + name_len
+
+            with self._lock:
+                directory = self.dir_watches.get(wd)
+                if directory is not None:
+                    if mask & IN_IGNORED:
+                        self.dir_watches.pop(wd, None)
+                    elif mask & (IN_CREATE | IN_MOVED_TO):
+                        created = os.path.join(directory, os.fsdecode(name.rstrip(b"\0")))
+                        if created in self.paths:
+                            rewatch.add(created)
+                    continue
+
+                path = self.watches.get(wd)
+                if mask & IN_IGNORED:
+                    # The file is gone (or replaced); the name may already exist again
+                    self.watches.pop(wd, None)
+                    if path in self.paths:
+                        rewatch.add(path)
+            if path is None:
+                continue
+
+            names = events_by_path.setdefault(path, [])
+            for flag, event_name in EVENT_NAMES.items():
+                if mask & flag and event_name not in names:
+                    names.append(event_name)
+
+        # Re-adding a watch on an inode already watched just returns its wd
+        for path in rewatch:
+            if os.path.exists(path):
+                self._watch_file(path)
+
+        now = time.monotonic()
+        for path, names in events_by_path.items():
+            if not names:
+                continue
+            last = self._last_reported.get(path)
+            removed = any(name in REMOVAL_EVENTS for name in names)
+            if not removed and last is not None and now - last < self.debounce_seconds:
+                continue
+            self._last_reported[path] = now
+            try:
+                self.callback(path, names)
+            except Exception as e:
+                logger.error(f"Honeypot watcher callback failed: {e}")
+
+
+class ProcFdIndex:
+    """
+    Map watched file paths/inodes to the PIDs holding them open
+
+    Built by scanning /proc/<pid>/fd; no subprocesses. A background thread
+    refreshes the index every refresh_interval seconds. Every refresh
+    re-reads each descriptor's link, so reused descriptor numbers are seen,
+    but only stats links it has not resolved before (a full rescan every
+    full_rescan_every refreshes drops that cache). Lookups that miss
+    trigger an immediate rescan (the watcher already debounces lookups
+    per file).
+    """
+
+    def __init__(self, refresh_interval: float = 1.0, full_rescan_every: int = 10):
+        if not procfs_available():
+            raise OSError("/proc file descriptors are not available on this platform")
+
+        self.refresh_interval = refresh_interval
+        self.full_rescan_every = full_rescan_every
+
+        self.watched_paths = set()
+        self.watched_inodes = {}  # (st_dev, st_ino) -> path
+        self.path_pids = {}  # watched path -> set of pids
+        self._pid_fds = {}  # pid -> {fd name: (link target, watched path or None)}
+        self._refresh_count = 0
+        self._lock = threading.RLock()
+        self._thread = None
+        self._running = False
+
+    def watch(self, path: str):
+        """Track which processes open this path"""
+        path = os.path.realpath(path)
+        with self._lock:
+            self.watched_paths.add(path)
+            try:
+                st = os.stat(path)
+                self.watched_inodes[(st.st_dev, st.st_ino)] = path
+            except OSError:
+                pass
+
+    def start(self):
+        """Start the background refresh thread"""
+        if self._running:
+            return
+        self._running = True
+        self._thread = threading.Thread(target=self._refresh_loop, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop the background refresh thread"""
+        self._running = False
+        if self._thread is not None:
+            self._thread.join(timeout=2)
+            self._thread = None
+
+    def _refresh_loop(self):
+        while self._running:
+            try:
+                self.refresh()
+            except Exception as e:
+                logger.error(f"Process index refresh failed: {e}")
+            time.sleep(self.refresh_interval)
+
+    def refresh(self, full: bool = False):
+        """Rescan /proc, resolving only new file descriptors unless full"""
+        with self._lock:
+            self._refresh_count += 1
+            full = full or self._refresh_count % self.full_rescan_every == 0
+
+            path_pids = {}
+            pid_fds = {}
+            for entry in os.scandir("/proc"):
+                if not entry.name.isdigit():
+                    continue
+                pid = int(entry.name)
+                fd_dir = f"/proc/{pid}/fd"
+                try:
+                    fd_names = os.listdir(fd_dir)
+                except OSError:
+                    continue  # exited, or not ours to inspect
+
+                known = {} if full else self._pid_fds.get(pid, {})
+                resolved = {}
+                for fd_name in fd_names:
+                    fd_path = f"{fd_dir}/{fd_name}"
+                    try:
+                        link = os.readlink(fd_path)
+                    except OSError:
+                        continue  # closed since listdir
+                    cached = known.get(fd_name)
+                    if cached is not None and cached[0] == link:
+                        target = cached[1]
+                    else:
+                        target = self._resolve_fd(fd_path, link)
+                    resolved[fd_name] = (link, target)
+                    if target is not None:
+                        path_pids.setdefault(target, set()).add(pid)
+                pid_fds[pid] = resolved
+
+            self._pid_fds = pid_fds
+            self.path_pids = path_pids
+
+    def _resolve_fd(self, fd_path: str, target: str) -> Optional[str]:
+        if target in self.watched_paths:
+            return target
+        if not target.startswith("/") or not self.watched_inodes:
+            return None  # sockets, pipes, anon inodes
+        try:
+            st = os.stat(fd_path)
+        except OSError:
+            return None
+        return self.watched_inodes.get((st.st_dev, st.st_ino))
+
+    def lookup(self, path: str) -> List[Dict]:
+        """Get processes holding a watched file open"""
+        path = os.path.realpath(path)
+        with self._lock:
+            pids = self.path_pids.get(path)
+            if not pids:
+                self.refresh()
+                pids = self.path_pids.get(path)
+            pids = sorted(pids or ())
+
+        return [info for info in (self._process_info(pid) for pid in pids) if info]
+
+    @staticmethod
+    def _process_info(pid: int) -> Dict:
+        try:
+            with open(f"/proc/{pid}/stat", "rb") as f:
+                stat = f.read().decode(errors="replace")
+            with open(f"/proc/{pid}/cmdline", "rb") as f:
+                cmdline = f.read().replace(b"\0", b" ").decode(errors="replace").strip()
+        except OSError:
+            return {}
+
+        # Format: pid (comm) state ppid ...; comm may itself contain ')'
+        name = stat[stat.index("(") + 1:stat.rindex(")")]
+        ppid = int(stat[stat.rindex(")") + 2:].split()[1])
+        return {"pid": pid, "name": name, "parent_pid": ppid, "command_line": cmdline}
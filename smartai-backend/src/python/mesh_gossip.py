@@ -0,0 +1,377 @@
+#!/usr/bin/env python3
+"""
+SmartAI Mesh Gossip
+Disseminates threat intelligence between mesh devices. New entries are
+pushed once to a few random peers (rumor mongering) in compressed batches,
+and periodic anti-entropy rounds compare fixed-size bucket digests so peers
+only exchange the entries one of them is missing. Entries are deduplicated
+by content hash. Datagrams go over UDP; payloads too large for one datagram
+fall back to a TCP connection on the same port. Every packet carries an
+HMAC-SHA256 under the shared mesh key and is dropped unverified before it is
+decompressed or parsed.
+"""
+
+import hmac
+import json
+import time
+import zlib
+import random
+import select
+import socket
+import struct
+import hashlib
+import threading
+import logging
+from collections import OrderedDict
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+WIRE_MAGIC = b"SG2"
+MAX_DATAGRAM = 60000
+MAX_PAYLOAD = 8 * 1024 * 1024  # decompressed packet and TCP frame limit
+_MAC_SIZE = hashlib.sha256().digest_size
+_TCP_LENGTH = struct.Struct("!I")
+
+Peer = Tuple[str, int]
+
+
+def content_hash(message: Dict) -> str:
+    """Hash a message by its canonical JSON form"""
+    canonical = json.dumps(message, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+def parse_peers(spec: str) -> List[Peer]:
+    """Parse 'host:port,host:port' into peer addresses"""
+    peers = []
+    for item in spec.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        host, _, port = item.rpartition(":")
+        peers.append((host or "127.0.0.1", int(port)))
+    return peers
+
+
+def encode_packet(packet: Dict, key: bytes) -> bytes:
+    """Compress and sign a packet: magic, HMAC-SHA256 of the body, body"""
+    body = zlib.compress(json.dumps(packet, separators=(",", ":"), default=str).encode())
+    return WIRE_MAGIC + hmac.new(key, body, hashlib.sha256).digest() + body
+
+
+def decode_packet(data: bytes, key: bytes) -> Optional[Dict]:
+    """Verify and decode a packet; None if forged, oversized or malformed"""
+    header = len(WIRE_MAGIC) + _MAC_SIZE
+    if len(data) <= header or not data.startswith(WIRE_MAGIC):
+        return None
+    body = data[header:]
+    if not hmac.compare_digest(data[len(WIRE_MAGIC):header],
+                               hmac.new(key, body, hashlib.sha256).digest()):
+        return None
+    try:
+        decompressor = zlib.decompressobj()
+        payload = decompressor.decompress(body, MAX_PAYLOAD)
+        if decompressor.unconsumed_tail or not decompressor.eof:
+            return None  # would expand past MAX_PAYLOAD, or truncated
+        return json.loads(payload)
+    except (zlib.error, ValueError):
+        return None
+
+
+class GossipNode:
+    """
+    One mesh device's gossip endpoint
+
+    publish(message) stores a message locally and queues it for the next
+    push round; on_message(message) is called once for every entry first
+    learned from a peer. Peers are the static list plus any node that has
+    sent us a packet signed with the mesh key. TCP frames are read by up to
+    max_tcp_readers threads, so a slow connection never blocks the node.
+    """
+
+    def __init__(self, node_id: str, key: bytes, host: str = "127.0.0.1", port: int = 0,
+                 peers: Iterable[Peer] = (), on_message: Optional[Callable[[Dict], None]] = None,
+                 fanout: int = 3, gossip_interval: float = 0.5,
+                 anti_entropy_interval: float = 5.0, max_entries: int = 1000,
+                 n_buckets: int = 64, max_tcp_readers: int = 8):
+        if not key:
+            raise ValueError("A mesh key is required")
+        self.node_id = node_id
+        self.key = key
+        self.on_message = on_message
+        self.fanout = fanout
+        self.gossip_interval = gossip_interval
+        self.anti_entropy_interval = anti_entropy_interval
+        self.max_entries = max_entries
+        self.n_buckets = n_buckets
+
+        self.entries = OrderedDict()  # content hash -> message, oldest first
+        self.seen = OrderedDict()  # hashes already accepted, so evicted entries stay dead
+        self.bucket_digests = [0] * n_buckets  # XOR of entry hashes per bucket
+        self.pending = []  # hashes to push next round
+        self.peers = OrderedDict((tuple(peer), None) for peer in peers)
+        self.stats = {"packets_sent": 0, "bytes_sent": 0, "packets_received": 0,
+                      "bytes_received": 0, "entries_received": 0, "duplicates": 0,
+                      "packets_rejected": 0}
+        self._lock = threading.RLock()
+        self._tcp_slots = threading.BoundedSemaphore(max_tcp_readers)
+
+        self.udp = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.udp.bind((host, port))
+        self.host, self.port = self.udp.getsockname()
+        self.tcp = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.tcp.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.tcp.bind((self.host, self.port))
+        self.tcp.listen(16)
+
+        self._thread = None
+        self._running = False
+
+    # ---------- local state ----------
+
+    def publish(self, message: Dict) -> str:
+        """Add a local message and schedule it for dissemination"""
+        with self._lock:
+            digest = self._store(message)
+            if digest is not None:
+                self.pending.append(digest)
+            return digest or content_hash(message)
+
+    def add_peer(self, peer: Peer):
+        """Add a peer address"""
+        peer = (peer[0], int(peer[1]))
+        if peer != (self.host, self.port):
+            with self._lock:
+                self.peers.setdefault(peer, None)
+
+    def _store(self, message: Dict) -> Optional[str]:
+        """Store a message; returns its hash, or None if already known"""
+        digest = content_hash(message)
+        if digest in self.seen:
+            self.stats["duplicates"] += 1
+            return None
+
+        self.seen[digest] = None
+        if len(self.seen) > 4 * self.max_entries:
+            self.seen.popitem(last=False)
+
+        self.entries[digest] = message
+        self._toggle_bucket(digest)
+        if len(self.entries) > self.max_entries:
+            evicted, _ = self.entries.popitem(last=False)
+            self._toggle_bucket(evicted)
+        return digest
+
+    def _bucket(self, digest: str) -> int:
+        return int(digest[:4], 16) % self.n_buckets
+
+    def _toggle_bucket(self, digest: str):
+        self.bucket_digests[self._bucket(digest)] ^= int(digest[:16], 16)
+
+    # ---------- lifecycle ----------
+
+    def start(self):
+        """Start the network thread"""
+        if self._running:
+            return
+        self._running = True
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop the network thread and close sockets"""
+        self._running = False
+        if self._thread is not None:
+            self._thread.join(timeout=2)
+            self._thread = None
+        self.udp.close()
+        self.tcp.close()
+
+    def _run(self):
+        next_gossip = time.monotonic() + self.gossip_interval
+        next_anti_entropy = time.monotonic() + self.anti_entropy_interval
+        while self._running:
+            timeout = max(0.0, min(next_gossip, next_anti_entropy) - time.monotonic())
+            try:
+                ready, _, _ = select.select([self.udp, self.tcp], [], [], timeout)
+                for sock in ready:
+                    if sock is self.udp:
+                        data, addr = self.udp.recvfrom(65535)
+                        self._receive(data, addr[0])
+                    else:
+                        self._accept_tcp()
+
+                now = time.monotonic()
+                if now >= next_gossip:
+                    self.gossip_round()
+                    next_gossip = now + self.gossip_interval
+                if now >= next_anti_entropy:
+                    self.anti_entropy_round()
+                    next_anti_entropy = now + self.anti_entropy_interval
+            except Exception as e:
+                if self._running:
+                    logger.error(f"Gossip error: {e}")
+                    time.sleep(0.1)
+
+    # ---------- rounds ----------
+
+    def gossip_round(self):
+        """Push entries learned since the last round to a few random peers"""
+        with self._lock:
+            if not self.pending or not self.peers:
+                return
+            messages = [self.entries[h] for h in self.pending if h in self.entries]
+            self.pending = []
+            targets = random.sample(list(self.peers), min(self.fanout, len(self.peers)))
+
+        for peer in targets:
+            self._send_entries(peer, messages)
+
+    def anti_entropy_round(self):
+        """Send our bucket digests to one random peer"""
+        with self._lock:
+            if not self.peers:
+                return
+            peer = random.choice(list(self.peers))
+            digests = [format(d, "x") for d in self.bucket_digests]
+        self._send(peer, {"t": "digest", "d": digests})
+
+    # ---------- sending ----------
+
+    def _send_entries(self, peer: Peer, messages: List[Dict]):
+        if messages:
+            self._send(peer, {"t": "push", "e": messages})
+
+    def _send(self, peer: Peer, packet: Dict):
+        packet["n"] = self.node_id
+        packet["p"] = self.port
+        data = encode_packet(packet, self.key)
+        try:
+            if len(data) <= MAX_DATAGRAM:
+                self.udp.sendto(data, peer)
+            else:
+                with socket.create_connection(peer, timeout=2.0) as conn:
+                    conn.sendall(_TCP_LENGTH.pack(len(data)) + data)
+        except OSError as e:
+            logger.debug(f"Gossip send to {peer} failed: {e}")
+            return
+        self.stats["packets_sent"] += 1
+        self.stats["bytes_sent"] += len(data)
+
+    # ---------- receiving ----------
+
+    def _accept_tcp(self):
+        conn, addr = self.tcp.accept()
+        if not self._tcp_slots.acquire(blocking=False):
+            conn.close()  # too many frames in flight
+            return
+        threading.Thread(target=self._read_tcp, args=(conn, addr[0]), daemon=True).start()
+
+    def _read_tcp(self, conn: socket.socket, host: str):
+        try:
+            with conn:
+                conn.settimeout(2.0)
+                header = self._recv_exact(conn, _TCP_LENGTH.size)
+                if header is None:
+                    return
+                length = _TCP_LENGTH.unpack(header)[0]
+                if length > MAX_PAYLOAD:
+                    self.stats["packets_rejected"] += 1
+                    return
+                data = self._recv_exact(conn, length)
+                if data is not None:
+                    self._receive(data, host)
+        except Exception as e:
+            logger.debug(f"Gossip TCP read from {host} failed: {e}")
+        finally:
+            self._tcp_slots.release()
+
+    @staticmethod
+    def _recv_exact(conn: socket.socket, size: int) -> Optional[bytes]:
+        chunks = []
+        while size > 0:
+            chunk = conn.recv(min(size, 1 << 20))
+            if not chunk:
+                return None
+            chunks.append(chunk)
+            size -= len(chunk)
+        return b"".join(chunks)
+
+    def _receive(self, data: bytes, host: str):
+        packet = decode_packet(data, self.key)
+        if packet is None:
+            self.stats["packets_rejected"] += 1
+            return
+        if packet.get("n") == self.node_id:
+            return
+        self.stats["packets_received"] += 1
+        self.stats["bytes_received"] += len(data)
+
+        # Signed with the mesh key, so the sender may become a peer
+        peer = (host, int(packet.get("p", 0)))
+        self.add_peer(peer)
+
+        kind = packet.get("t")
+        if kind == "push":
+            self._handle_push(packet.get("e", []))
+        elif kind == "digest":
+            self._handle_digest(peer, packet.get("d", []))
+        elif kind == "hashes":
+            self._handle_hashes(peer, packet.get("h", {}))
+        elif kind == "want":
+            self._handle_want(peer, packet.get("h", []))
+
+    def _handle_push(self, messages: List[Dict]):
+        learned = []
+        with self._lock:
+            for message in messages:
+                digest = self._store(message)
+                if digest is not None:
+                    self.pending.append(digest)  # keep the rumor going
+                    learned.append(message)
+        self.stats["entries_received"] += len(learned)
+
+        if self.on_message is not None:
+            for message in learned:
+                try:
+                    self.on_message(message)
+                except Exception as e:
+                    logger.error(f"Gossip message handler failed: {e}")
+
+    def _handle_digest(self, peer: Peer, digests: List[str]):
+        # Reply with our hashes for every bucket that differs
+        with self._lock:
+            mismatched = {
+                b for b, d in enumerate(digests[:self.n_buckets])
+                if int(d, 16) != self.bucket_digests[b]
+            }
+            if not mismatched:
+                return
+            hashes = {str(b): [] for b in mismatched}
+            for digest in self.entries:
+                b = self._bucket(digest)
+                if b in mismatched:
+                    hashes[str(b)].append(digest)
+        self._send(peer, {"t": "hashes", "h": hashes})
+
+    def _handle_hashes(self, peer: Peer, hashes: Dict[str, List[str]]):
+        # Ask for what we lack, push what they lack
+        with self._lock:
+            theirs = set()
+            for bucket_hashes in hashes.values():
+                theirs.update(bucket_hashes)
+            buckets = {int(b) for b in hashes}
+            wanted = [h for h in theirs if h not in self.seen]
+            missing = [
+                message for digest, message in self.entries.items()
+                if self._bucket(digest) in buckets and digest not in theirs
+            ]
+        if wanted:
+            self._send(peer, {"t": "want", "h": wanted})
+        self._send_entries(peer, missing)
+
+    def _handle_want(self, peer: Peer, wanted: List[str]):
+        with self._lock:
+            messages = [self.entries[h] for h in wanted if h in self.entries]
+        self._send_entries(peer, messages)
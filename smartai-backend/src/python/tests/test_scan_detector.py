@@ -0,0 +1,53 @@
+"""Regression tests for ScanDetector classification thresholds"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ai_module import ScanDetector
+
+# Wall-clock epoch seconds, as passed by the listener (far beyond the windows)
+T0 = 1_700_000_000.0
+
+
+def test_port_scan_fires_on_distinct_ports():
+    detector = ScanDetector()
+    t = T0
+    assert detector.record("10.0.0.1", 21, t) == ([], [])
+    assert detector.record("10.0.0.1", 445, t + 1) == ([], [])
+    assert detector.record("10.0.0.1", 3389, t + 2) == (["port_scan"], ["port_scan"])
+
+
+def test_brute_force_fires_on_repeated_port():
+    detector = ScanDetector()
+    t = T0
+    for i in range(9):
+        active, _ = detector.record("10.0.0.2", 3389, t + i)
+        assert "brute_force" not in active
+    active, new = detector.record("10.0.0.2", 3389, t + 9)
+    assert active == ["brute_force"] and new == ["brute_force"]
+    # Reported once per cooldown
+    assert detector.record("10.0.0.2", 3389, t + 10) == (["brute_force"], [])
+
+
+def test_slow_scan_fires_across_long_window():
+    detector = ScanDetector()
+    t = T0
+    detector.record("10.0.0.3", 21, t)
+    detector.record("10.0.0.3", 445, t + 600)
+    assert detector.record("10.0.0.3", 3389, t + 1200) == (["slow_scan"], ["slow_scan"])
+
+
+def test_idle_sources_are_evicted():
+    detector = ScanDetector(slow_window_seconds=3600)
+    detector.record("10.0.0.4", 21, T0)
+    detector.record("10.0.0.5", 21, T0 + 3600)
+    assert list(detector.sources) == ["10.0.0.5"]
+
+
+def test_max_sources_keeps_the_newest():
+    detector = ScanDetector(max_sources=2)
+    for i, ip in enumerate(["10.0.0.6", "10.0.0.7", "10.0.0.8"]):
+        detector.record(ip, 21, T0 + i)
+    assert list(detector.sources) == ["10.0.0.7", "10.0.0.8"]